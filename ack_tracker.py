@@ -0,0 +1,157 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+
+
+class AckTracker:
+    # One timer thread for every in-flight packet. Deadlines live in a heap;
+    # ack/cancel just drop the dict entry and the stale heap slot is skipped
+    # when it reaches the top.
+    def __init__(self, timeout=60, on_timeout=None, clock=time.monotonic, samples=512):
+        self.timeout = timeout
+        self.on_timeout = on_timeout
+        self.clock = clock
+        self._heap = []
+        self._pending = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = None
+        self._rtts = deque(maxlen=samples)
+        self._srtt = None
+        self._rttvar = None
+        self._tracked = 0
+        self._acked = 0
+        self._late = 0
+        self._timeouts = 0
+        self._cancelled = 0
+
+    def track(self, packet_id, timeout=None, context=None, sent_at=None):
+        now = self.clock()
+        entry = [now + (self.timeout if timeout is None else timeout), next(self._seq), packet_id,
+                 now if sent_at is None else sent_at, context]
+        with self._cond:
+            self._pending[packet_id] = entry
+            heapq.heappush(self._heap, entry)
+            self._tracked += 1
+            if self._heap[0] is entry:
+                self._cond.notify()
+        return entry
+
+    def ack(self, packet_id):
+        # Returns the round-trip time in seconds, or None if the packet
+        # was not being tracked (already acked, timed out or unknown).
+        now = self.clock()
+        with self._cond:
+            entry = self._pending.pop(packet_id, None)
+            if entry is None:
+                self._late += 1
+                return None
+            rtt = now - entry[3]
+            self._record_rtt(rtt)
+            self._acked += 1
+            return rtt
+
+    def cancel(self, packet_id):
+        with self._cond:
+            if self._pending.pop(packet_id, None) is None:
+                return False
+            self._cancelled += 1
+            return True
+
+    def context(self, packet_id):
+        entry = self._pending.get(packet_id)
+        return entry[4] if entry is not None else None
+
+    def _record_rtt(self, rtt):
+        self._rtts.append(rtt)
+        if self._srtt is None:
+            self._srtt, self._rttvar = rtt, rtt / 2
+        else:
+            self._rttvar = 0.75 * self._rttvar + 0.25 * abs(self._srtt - rtt)
+            self._srtt = 0.875 * self._srtt + 0.125 * rtt
+
+    def expire(self):
+        now = self.clock()
+        expired = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                entry = heapq.heappop(self._heap)
+                if self._pending.get(entry[2]) is entry:
+                    del self._pending[entry[2]]
+                    expired.append(entry)
+            self._timeouts += len(expired)
+            self._compact()
+        for entry in expired:
+            if self.on_timeout is not None:
+                try:
+                    self.on_timeout(entry[2], entry[4])
+                except Exception as e:
+                    logging.error(f"Error handling ACK timeout for packet ID {entry[2]}: {e}")
+                    logging.exception("Stack trace:")
+        return len(expired)
+
+    def _compact(self):
+        # Cancelled entries only leave the heap when they reach the top;
+        # rebuild if they ever dominate it.
+        if len(self._heap) > 64 and len(self._heap) > 4 * len(self._pending):
+            self._heap = [entry for entry in self._heap if self._pending.get(entry[2]) is entry]
+            heapq.heapify(self._heap)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._cond:
+            self._stop = False
+        self._thread = threading.Thread(target=self._run, name='ack-tracker', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(1)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._stop:
+                    return
+                delay = self._heap[0][0] - self.clock() if self._heap else None
+                if delay is None or delay > 0:
+                    self._cond.wait(delay)
+                    continue
+            self.expire()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def stats(self):
+        with self._cond:
+            samples = sorted(self._rtts)
+            def percentile(p):
+                return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 1) if samples else None
+            return {
+                'inFlight': len(self._pending),
+                'heapSize': len(self._heap),
+                'timeoutSeconds': self.timeout,
+                'tracked': self._tracked,
+                'acked': self._acked,
+                'lateOrUnknownAcks': self._late,
+                'timeouts': self._timeouts,
+                'cancelled': self._cancelled,
+                'rtt': {
+                    'samples': len(samples),
+                    'minMs': round(samples[0] * 1000, 1) if samples else None,
+                    'maxMs': round(samples[-1] * 1000, 1) if samples else None,
+                    'p50Ms': percentile(0.5),
+                    'p95Ms': percentile(0.95),
+                    'smoothedMs': round(self._srtt * 1000, 1) if self._srtt is not None else None,
+                    'varianceMs': round(self._rttvar * 1000, 1) if self._rttvar is not None else None
+                }
+            }
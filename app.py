@@ -1,13 +1,23 @@
-from flask import Flask, render_template, request
-from flask_socketio import SocketIO, emit
+import os
+
+# MESHTASTIC_ASYNC_MODE=gevent serves websockets from greenlets instead of
+# one OS thread each. Patching has to happen before anything else imports
+# socket, ssl or threading.
+ASYNC_MODE = os.environ.get('MESHTASTIC_ASYNC_MODE', 'threading')
+if ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+from flask import Flask, render_template, request, jsonify
+from flask_socketio import SocketIO, emit, join_room, leave_room, rooms
 from flask_cors import CORS
 
 import serial
 import serial.tools.list_ports
 
+import functools
 import json
 import logging
-import os
 
 import meshtastic
 from meshtastic.serial_interface import SerialInterface
@@ -21,29 +31,204 @@ import time
 from datetime import datetime
 import asyncio
 import threading
-from threading import Event
 import requests
 
 from google.protobuf.json_format import MessageToDict
 
+from dispatch import PacketHandlerRegistry, PacketView, normalize_portnum
+from dedup import DuplicateFilter
+from node_store import NodeStore, NodeDeltaBatcher, NodeSpill, merge_node_deltas
+from spatial import GridIndex, valid_coordinates
+from tracks import TrackStore
+from timeseries import TelemetryStore
+from message_store import MessageStore
+from message_index import MessageIndex
+from ack_tracker import AckTracker
+from ingest import IngestQueue, IngestWorker, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW, PRIORITY_NAMES
+from send_queue import OutboundQueue, ClientQuota, backoff_delay
+from compression import CompressionStats, is_compressed
+from emit_batcher import EmitBatcher, latest
+from rooms import (BROADCAST_ROOM, NODES_ROOM, DEBUG_ROOM, MAP_ALL_ROOM, TOPIC_ROOMS, channel_room,
+                   map_rooms_for_point, map_rooms_for_bbox)
+from loop_bridge import LoopBridge
+from message_bus import BusManager, MessageBroker, ROLE_STANDALONE, ROLE_INGEST, ROLE_WEB, ROLES, parse_address
+from wire_format import WIRE_JSON, WIRE_COMPACT, WIRE_FORMATS, WIRE_VERSION, FIELD_NAMES, WireStats, pack, wire_room
+
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# MESHTASTIC_ROLE=ingest owns the radio and all state and publishes every
+# emit on a local message bus; any number of MESHTASTIC_ROLE=web workers,
+# each on its own MESHTASTIC_PORT, deliver them to their clients and
+# forward requests back. The default runs everything in one process.
+SERVER_ROLE = os.environ.get('MESHTASTIC_ROLE', ROLE_STANDALONE)
+if SERVER_ROLE not in ROLES:
+    raise ValueError(f"MESHTASTIC_ROLE must be one of {', '.join(ROLES)}")
+SERVER_PORT = int(os.environ.get('MESHTASTIC_PORT', 5678))
+MESSAGE_BUS_ADDRESS = parse_address(os.environ.get('MESHTASTIC_BUS', '127.0.0.1:5680'))
+# Bus messages are pickles, so the key is what keeps the bus from running
+# code sent by anyone who can reach it. There is no default.
+MESSAGE_BUS_AUTHKEY = os.environ.get('MESHTASTIC_BUS_KEY', '').encode('utf-8')
+if SERVER_ROLE != ROLE_STANDALONE and not MESSAGE_BUS_AUTHKEY:
+    raise ValueError("MESHTASTIC_BUS_KEY must be set to a shared secret when MESHTASTIC_ROLE is ingest or web")
+
 app = Flask(__name__, static_folder='static')
 CORS(app)
-socketio = SocketIO(app, cors_allowed_origins="*")
+message_broker = MessageBroker(MESSAGE_BUS_ADDRESS, MESSAGE_BUS_AUTHKEY) if SERVER_ROLE == ROLE_INGEST else None
+bus_manager = BusManager(MESSAGE_BUS_ADDRESS, MESSAGE_BUS_AUTHKEY) if SERVER_ROLE != ROLE_STANDALONE else None
+# Long-polling responses above this size are gzip/deflate compressed;
+# websocket frames use permessage-deflate when the browser offers it.
+SOCKET_COMPRESSION_THRESHOLD = 1024
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=ASYNC_MODE, http_compression=True,
+                    compression_threshold=SOCKET_COMPRESSION_THRESHOLD, client_manager=bus_manager)
+loop_bridge = LoopBridge(ASYNC_MODE)
 
 available_channels = []
-found_nodes = {}
-received_messages = []
-messages = {}
-
-app.config['received_messages'] = received_messages
-app.config['messages'] = {}
-
 connection_timeout = None
 
 WEBHOOK_FILE = 'discord_webhook.json'
 
+INGEST_QUEUE_SIZE = 1000
+INGEST_OVERFLOW_POLICY = IngestQueue.DROP_OLDEST
+INGEST_SHED_THRESHOLD = 250
+
+DEDUP_MAX_ENTRIES = 4096
+DEDUP_TTL_SECONDS = 600
+
+NODE_UPDATE_FLUSH_INTERVAL = 0.25
+NODE_TABLE_MAX_NODES = 2000
+NODE_MAX_AGE_SECONDS = 3 * 24 * 3600
+NODE_AGE_CHECK_INTERVAL = 60
+NODE_SPILL_FILE = 'node_spill.db'
+
+SPATIAL_CELL_DEGREES = 0.5
+MAP_QUERY_LIMIT = 1000
+
+TRACK_DEPTH = 500
+TRACK_DEFAULT_TOLERANCE_METERS = 10
+
+TELEMETRY_MAX_POINTS = 10080
+TELEMETRY_MAX_AGE_SECONDS = 7 * 24 * 3600
+TELEMETRY_MAX_BUCKETS = 2000
+
+MESSAGE_DB_FILE = 'messages.db'
+MESSAGE_DB_BATCH_SIZE = 200
+MESSAGE_DB_FLUSH_INTERVAL = 0.5
+MESSAGE_PAGE_SIZE = 50
+MESSAGE_PAGE_MAX = 200
+MESSAGE_SEARCH_LIMIT = 20
+MESSAGE_SEARCH_MAX = 100
+MESSAGE_SEARCH_CANDIDATES = 1000
+MESSAGE_INDEX_PER_CHANNEL = 500
+ACK_TIMEOUT_SECONDS = 60
+# Outbound pacing: seconds of estimated airtime allowed per second (10% duty
+# cycle) and how much may be sent back to back before pacing kicks in.
+SEND_AIRTIME_BUDGET = 0.1
+SEND_BURST_SECONDS = 6.0
+SEND_QUEUE_SIZE = 200
+# Fair share between browser clients: airtime credit each sender earns per
+# round-robin turn, plus per-client admission limits (0 disables a limit).
+SEND_FAIR_QUANTUM_SECONDS = 1.0
+SEND_CLIENT_MAX_QUEUED = 5
+SEND_CLIENT_MESSAGES_PER_MINUTE = 10
+SEND_CLIENT_BURST = 3
+# Opt-in compressed text (per message, from the UI) goes out on this portnum.
+# Only other instances of this interface can read it.
+COMPRESSED_TEXT_PORTNUM = portnums_pb2.PortNum.PRIVATE_APP
+# High-rate events are buffered and sent as one 'batch' frame per target per
+# window; repeated events with the same merge key collapse within a window.
+EMIT_BATCH_WINDOW = 0.1
+EMIT_MERGE_RULES = {
+    'position_update': (lambda data: data.get('sender'), latest),
+    'node_delta': (lambda data: data.get('num'), merge_node_deltas),
+    'send_queued': (lambda data: data.get('jobId'), latest)
+}
+# Map viewport rooms are cells of this size; wider views use the whole-map room.
+MAP_ROOM_CELL_DEGREES = 10
+MAP_ROOM_MAX_CELLS = 36
+DEFAULT_ROOMS = (NODES_ROOM, channel_room(0), MAP_ALL_ROOM)
+# Clients may ask for the compact wire format (field ids instead of key
+# names) when they connect; bytes per event are sampled for both formats.
+WIRE_STATS_SAMPLE_EVERY = 10
+# Unacknowledged messages are resent up to SEND_MAX_ATTEMPTS times in total,
+# waiting base * 2^(attempt-1) seconds (with jitter, capped) between tries.
+SEND_MAX_ATTEMPTS = 3
+SEND_RETRY_BASE_SECONDS = 15
+SEND_RETRY_MAX_SECONDS = 120
+PACKET_LOG_ENABLED = True
+PACKET_RETENTION_SECONDS = 7 * 24 * 3600
+
+PACKET_PRIORITIES = {
+    'TEXT_MESSAGE_APP': PRIORITY_HIGH,
+    'ROUTING_APP': PRIORITY_HIGH,
+    'ADMIN_APP': PRIORITY_HIGH,
+    'NODEINFO_APP': PRIORITY_NORMAL,
+    'POSITION_APP': PRIORITY_LOW,
+    'TELEMETRY_APP': PRIORITY_LOW
+}
+
+def classify_packet(packet):
+    decoded = packet.get('decoded')
+    if decoded is None:
+        return PRIORITY_NORMAL, None
+    portnum = normalize_portnum(decoded.get('portnum'))
+    if portnum == 'PRIVATE_APP' and is_compressed(decoded.get('payload')):
+        # Compressed chat is decoded as text later; queue it like text.
+        portnum = 'TEXT_MESSAGE_APP'
+    priority = PACKET_PRIORITIES.get(portnum, PRIORITY_NORMAL)
+    if priority != PRIORITY_LOW:
+        return priority, None
+    # Only the latest position/telemetry per node is worth keeping under load.
+    variant = None
+    if portnum == 'TELEMETRY_APP':
+        variant = next((k for k in decoded.get('telemetry', {}) if k != 'time'), None)
+    return priority, (packet.get('from') or packet.get('fromId'), portnum, variant)
+
+packet_handlers = PacketHandlerRegistry()
+ingest_worker = None
+node_maintenance_started = False
+# The radio, the stores and the send queue belong to the process that owns
+# the radio. Web workers build none of them (no SQLite files, no worker
+# threads) and forward every request that needs them over the bus.
+OWNS_RADIO_STATE = SERVER_ROLE != ROLE_WEB
+if OWNS_RADIO_STATE:
+    ingest_queue = IngestQueue(INGEST_QUEUE_SIZE, INGEST_OVERFLOW_POLICY,
+                               classify=classify_packet, shed_threshold=INGEST_SHED_THRESHOLD)
+    duplicate_filter = DuplicateFilter(DEDUP_MAX_ENTRIES, DEDUP_TTL_SECONDS)
+    node_store = NodeStore(
+        on_merge=lambda src, dst: on_nodes_merged(src, dst),
+        on_evict=lambda num: on_node_evicted(num),
+        max_nodes=NODE_TABLE_MAX_NODES,
+        max_age=NODE_MAX_AGE_SECONDS,
+        spill=NodeSpill(NODE_SPILL_FILE) if NODE_SPILL_FILE else None
+    )
+    spatial_index = GridIndex(SPATIAL_CELL_DEGREES)
+    track_store = TrackStore(TRACK_DEPTH)
+    telemetry_store = TelemetryStore(TELEMETRY_MAX_POINTS, TELEMETRY_MAX_AGE_SECONDS)
+    message_store = MessageStore(MESSAGE_DB_FILE, MESSAGE_DB_BATCH_SIZE, MESSAGE_DB_FLUSH_INTERVAL)
+    message_index = MessageIndex(MESSAGE_INDEX_PER_CHANNEL)
+    ack_tracker = AckTracker(ACK_TIMEOUT_SECONDS, on_timeout=lambda packet_id, context: on_ack_timeout(packet_id))
+    send_queue = OutboundQueue(
+        lambda job: send_queued_message(job),
+        rate=SEND_AIRTIME_BUDGET,
+        burst=SEND_BURST_SECONDS,
+        maxsize=SEND_QUEUE_SIZE,
+        on_position=lambda job, position, eta: on_send_position(job, position, eta),
+        quantum=SEND_FAIR_QUANTUM_SECONDS
+    )
+    text_compression = CompressionStats()
+    client_quota = ClientQuota(SEND_CLIENT_MAX_QUEUED, SEND_CLIENT_MESSAGES_PER_MINUTE, SEND_CLIENT_BURST)
+else:
+    ingest_queue = duplicate_filter = node_store = spatial_index = track_store = telemetry_store = None
+    message_store = message_index = ack_tracker = send_queue = text_compression = client_quota = None
+client_formats = {}
+wire_stats = WireStats(WIRE_STATS_SAMPLE_EVERY)
+# Standalone knows every client, so each one gets a single batch frame per
+# window; the ingest process only sees rooms, so it batches per room.
+emit_batcher = EmitBatcher(lambda event, data, to: emit_frame(event, data, to), EMIT_BATCH_WINDOW, EMIT_MERGE_RULES,
+                           recipients=(lambda to: local_recipients(to)) if SERVER_ROLE == ROLE_STANDALONE else None)
+node_deltas = NodeDeltaBatcher(node_store, lambda event, data: batched_emit(event, data, to=NODES_ROOM),
+                               NODE_UPDATE_FLUSH_INTERVAL) if OWNS_RADIO_STATE else None
+
 def list_serial_ports():
     try:
         return [port.device for port in serial.tools.list_ports.comports()]
@@ -55,6 +240,8 @@ def connect_serial(port):
     global connection_timeout
     
     try:
+        loop_bridge.start()
+
         def timeout_handler():
             logging.error("Timed out waiting for connection completion")
             safe_emit('serial_error', {'message': 'Connection timed out'})
@@ -62,15 +249,17 @@ def connect_serial(port):
         connection_timeout = threading.Timer(60, timeout_handler)
         connection_timeout.start()
 
-        interface = SerialInterface(port)
+        # Under gevent the radio reader gets its own OS thread and hub.
+        interface = loop_bridge.run_in_thread(SerialInterface, port)
         logging.info(f"Interface created: {interface}")
 
         if connection_timeout:
             connection_timeout.cancel()
             connection_timeout = None
 
-        pub.subscribe(on_receive, "meshtastic.receive")
-        pub.subscribe(on_connection, "meshtastic.connection.established")
+        start_background_workers()
+        pub.subscribe(bridged_on_receive, "meshtastic.receive")
+        pub.subscribe(bridged_on_connection, "meshtastic.connection.established")
         
         interface.on_received = on_receive
 
@@ -92,6 +281,7 @@ def connect_serial(port):
             'isLocal': True
         }
 
+        node_store.pin(initial_node_info['num'])
         update_node(initial_node_info['num'], initial_node_info)
 
         safe_emit('serial_connected', {'port': port, 'initialNodeInfo': initial_node_info})
@@ -106,13 +296,13 @@ def connect_serial(port):
         return None
 
 def on_connection(interface, topic=pub.AUTO_TOPIC):
-    global connection_timeout, available_channels, received_messages
+    global connection_timeout, available_channels
     if connection_timeout:
         connection_timeout.cancel()
         connection_timeout = None
 
-    pub.subscribe(on_receive, "meshtastic.receive")
-    pub.subscribe(on_connection, "meshtastic.connection.established")
+    pub.subscribe(bridged_on_receive, "meshtastic.receive")
+    pub.subscribe(bridged_on_connection, "meshtastic.connection.established")
     logging.info("Connected to Meshtastic device")
     try:
         clear_message_queue(interface)
@@ -138,9 +328,10 @@ def on_connection(interface, topic=pub.AUTO_TOPIC):
         for node_id, node_data in nodes.items():
             update_node(node_id, node_data)
 
-        received_messages = fetch_stored_messages(interface)
-        app.config['received_messages'] = received_messages
-        socketio.emit('all_messages', {'messages': received_messages})
+        for message in fetch_stored_messages(interface):
+            message_store.add_message(message)
+        message_store.flush()
+        socketio.emit('messages_reset', {})
 
     except Exception as e:
         logging.error(f"Error in on_connection: {e}")
@@ -149,6 +340,117 @@ def on_connection(interface, topic=pub.AUTO_TOPIC):
         available_channels = [default_channel]
         socketio.emit('channel_list', {'channels': available_channels})
 
+def start_background_workers():
+    global ingest_worker, node_maintenance_started
+    if ingest_worker is None:
+        ingest_worker = IngestWorker(ingest_queue, process_packet)
+    ingest_worker.start()
+    emit_batcher.start()
+    node_deltas.start()
+    message_store.start()
+    ack_tracker.start()
+    send_queue.start()
+    if not node_maintenance_started:
+        node_maintenance_started = True
+        socketio.start_background_task(node_maintenance_loop)
+
+def batched_emit(event, data=None, to=None):
+    emit_batcher.emit(event, data, to)
+
+def wire_targets(to, wire_format):
+    if isinstance(to, tuple):
+        return tuple(wire_room(room, wire_format) for room in to)
+    return wire_room(BROADCAST_ROOM if to is None else to, wire_format)
+
+def send_encoded(event, data, to, wire_format):
+    if wire_format == WIRE_COMPACT:
+        socketio.emit('packed', [event, pack(data)], to=to)
+    else:
+        socketio.emit(event, data, to=to)
+
+def local_recipients(to):
+    if isinstance(to, str) and to in client_formats:
+        return (to,)
+    rooms = to if isinstance(to, tuple) else (BROADCAST_ROOM if to is None else to,)
+    shadows = [wire_room(room, wire_format) for room in rooms for wire_format in WIRE_FORMATS]
+    return [sid for sid, _ in socketio.server.manager.get_participants('/', shadows)]
+
+def emit_frame(event, data, to):
+    # Encodes the frame once per wire format in use and sends each encoding
+    # to that format's copy of the target rooms. A list is the batcher's
+    # group of sids sharing one frame.
+    wire_stats.observe(event, data)
+    if isinstance(to, list):
+        by_format = {}
+        for sid in to:
+            by_format.setdefault(client_formats.get(sid, WIRE_JSON), []).append(sid)
+        for wire_format, sids in by_format.items():
+            send_encoded(event, data, sids, wire_format)
+        return
+    if isinstance(to, str) and to in client_formats:
+        send_encoded(event, data, to, client_formats[to])
+        return
+    # JSON, the default format, always goes out so a broadcast is not lost
+    # while no client format is registered in this process.
+    for wire_format in {WIRE_JSON, *list(client_formats.values())}:
+        send_encoded(event, data, wire_targets(to, wire_format), wire_format)
+
+def reply(event, data):
+    # Like emit() to the requesting client, in its negotiated format.
+    send_encoded(event, data, request.sid, client_formats.get(request.sid, WIRE_JSON))
+
+# Handlers that need the radio or in-memory state. Web workers forward them
+# over the bus and the ingest process runs them on the client's behalf.
+ingest_handlers = {}
+
+def ingest_event(event, expose=True):
+    def decorator(handler):
+        ingest_handlers[event] = handler
+        if expose:
+            socketio.on_event(event, lambda *args: to_ingest(event, *args))
+        return handler
+    return decorator
+
+def to_ingest(event, *args):
+    if SERVER_ROLE == ROLE_WEB:
+        bus_manager.forward(request.sid, event, args)
+    else:
+        ingest_handlers[event](*args)
+
+def ingest_route(view):
+    # HTTP routes backed by the radio state: web workers have none to answer from.
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not OWNS_RADIO_STATE:
+            return jsonify({'error': 'Served by the ingest process'}), 503
+        return view(*args, **kwargs)
+    return wrapper
+
+def on_forwarded_event(message):
+    # Client lifecycle notices run in order on the bus thread; requests get
+    # their own task so a slow one (connecting the radio) blocks nothing.
+    if message.get('event') in ('client_connected', 'client_disconnected'):
+        run_forwarded_event(message)
+    else:
+        socketio.start_background_task(run_forwarded_event, message)
+
+def run_forwarded_event(message):
+    handler = ingest_handlers.get(message.get('event'))
+    if handler is None:
+        logging.warning(f"Ignoring unknown forwarded event {message.get('event')}")
+        return
+    try:
+        with app.test_request_context('/socket.io/'):
+            request.sid = message['sid']
+            request.namespace = '/'
+            handler(*message.get('args', ()))
+    except Exception as e:
+        logging.error(f"Error in forwarded {message.get('event')}: {e}")
+        logging.exception("Stack trace:")
+
+if SERVER_ROLE == ROLE_INGEST:
+    bus_manager.on_client_event = on_forwarded_event
+
 def safe_emit(event, data):
     try:
         socketio.emit(event, data)
@@ -205,11 +507,21 @@ def fetch_stored_messages(interface):
             for node_id, node_data in nodes.items():
                 if 'messages' in node_data:
                     for msg in node_data['messages']:
+                        # Without rxTime the store would stamp it with the
+                        # current time and every reconnect would add a copy.
+                        if not msg.get('rxTime'):
+                            logging.debug(f"Skipping stored message without rxTime: {msg.get('id')}")
+                            continue
+                        text = msg.get('payload')
+                        if isinstance(text, (bytes, bytearray)):
+                            text = bytes(text).decode('utf-8', errors='replace')
                         message = {
-                            'from': msg.get('fromId'),
+                            'packetId': msg.get('id'),
+                            'sender': msg.get('fromId'),
+                            'senderNum': msg.get('from'),
                             'to': msg.get('toId'),
-                            'payload': msg.get('payload'),
-                            'portnum': msg.get('portnum'),
+                            'text': text,
+                            'channel': msg.get('channel', 0),
                             'timestamp': msg.get('rxTime')
                         }
                         messages.append(message)
@@ -238,175 +550,297 @@ def clear_message_queue(interface):
         socketio.emit('queue_error', {'message': f'Error clearing queue: {str(e)}'})
 
 def on_receive(packet, interface):
+    # Runs on the meshtastic reader thread: hand off and return immediately.
+    packet_id = packet.get('id')
+    if packet_id and duplicate_filter.seen((packet.get('from') or packet.get('fromId'), packet_id)):
+        logging.debug(f"Dropping duplicate packet {packet_id} from {packet.get('fromId') or packet.get('from')}")
+        return
+    ingest_queue.put(packet)
+
+# pypubsub holds listeners weakly, so the bridged wrappers live at module level.
+bridged_on_receive = loop_bridge.wrap(on_receive)
+bridged_on_connection = loop_bridge.wrap(on_connection)
+
+def process_packet(packet):
     logging.debug(f"Raw received packet: {packet}")
     try:
-        if 'decoded' in packet:
-            portnum = packet['decoded'].get('portnum')
-            if portnum == 'TEXT_MESSAGE_APP':
-                handle_text_message(packet['decoded'], packet)
-            elif portnum == 'NODEINFO_APP':
-                handle_nodeinfo_message(packet['decoded'], packet)
-            elif portnum == 'POSITION_APP':
-                handle_position_message(packet['decoded'], packet)
-            elif portnum == 'TELEMETRY_APP':
-                handle_telemetry_message(packet['decoded'], packet)
-            elif portnum == 'ADMIN_APP':
-                handle_admin_message(packet['decoded'], packet)
-            elif portnum == 'ROUTING_APP':
-                handle_routing_message(packet['decoded'], packet)
-            elif 'encrypted' in packet:
-                logging.info(f"Received encrypted packet from {packet.get('fromId') or packet.get('from')} to {packet.get('toId') or packet.get('to')}")
-                logging.debug(f"Encrypted packet details: Channel: {packet.get('channel')}, SNR: {packet.get('rxSnr')}, RSSI: {packet.get('rxRssi')}, Hops: {packet.get('hopStart')}")    
-            else:
-                logging.warning(f"Unhandled portnum: {portnum}")
-            
-            if 'message' in packet['decoded']:
-                update_messages(packet['decoded'], packet)
-        elif 'encrypted' in packet:
-            logging.info("Received encrypted packet")
+        view = PacketView(packet)
+        if view.portnum == 'PRIVATE_APP' and is_compressed(view.decoded.get('payload')):
+            # Compressed text from another instance: hand it on as a normal text message.
+            text = text_compression.decompress(view.decoded['payload'])
+            if text is not None:
+                view.decoded['text'] = text
+                view.portnum = 'TEXT_MESSAGE_APP'
+        if view.is_decoded:
+            packet_handlers.dispatch(view)
+
+            if 'message' in view.decoded:
+                update_messages(view.decoded, packet)
+        elif view.encrypted:
+            logging.info(f"Received encrypted packet from {view.sender} to {view.to_id}")
+            logging.debug(f"Encrypted packet details: Channel: {view.channel}, SNR: {view.rx_snr}, RSSI: {view.rx_rssi}, Hops: {view.hop_start}")
         else:
             logging.warning("Received packet with unknown format")
-        
-        update_node(packet.get('fromId') or packet.get('from'), packet)
+
+        update_node(view.node_num, packet)
+
+        if PACKET_LOG_ENABLED:
+            message_store.add_packet(view)
     except Exception as e:
-        logging.error(f"Unexpected error in on_receive: {e}")
+        logging.error(f"Unexpected error in process_packet: {e}")
         logging.exception("Stack trace:")
 
 def update_messages(decoded_data, packet):
     try:
-        global received_messages
+        payload = decoded_data.get('payload')
         message = {
             'from': packet.get('fromId'),
             'to': packet.get('toId'),
-            'payload': decoded_data.get('payload'),
+            'payload': payload,
             'portnum': decoded_data.get('portnum'),
             'timestamp': packet.get('rxTime')
         }
-        received_messages.append(message)
+        message_store.add_message({
+            'packetId': packet.get('id'),
+            'sender': packet.get('fromId'),
+            'senderNum': packet.get('from'),
+            'to': packet.get('toId'),
+            'text': payload.decode('utf-8', 'replace') if isinstance(payload, bytes) else payload,
+            'channel': packet.get('channel', 0),
+            'timestamp': packet.get('rxTime')
+        })
         logging.info(f"New message added: {message}")
-        socketio.emit('new_message', {'message': message})
+        batched_emit('new_message', {'message': message}, to=channel_room(packet.get('channel', 0)))
     except Exception as e:
         logging.error(f"Error updating messages: {e}")
         logging.exception("Stack trace:")
 
-def handle_admin_message(decoded_data, packet):
+@packet_handlers.on('ADMIN_APP')
+def handle_admin_message(view):
     try:
-        if decoded_data.get('payload'):
+        if view.decoded.get('payload'):
             admin_message = mesh_pb2.AdminMessage()
-            admin_message.ParseFromString(decoded_data['payload'])
+            admin_message.ParseFromString(view.decoded['payload'])
             if admin_message.get_ack:
                 ack_packet_id = admin_message.get_ack.for_packet
                 logging.info(f"ACK received for packet ID: {ack_packet_id}")
-                socketio.emit('message_ack', {'packetId': ack_packet_id})
+                batched_emit('message_ack', {'packetId': ack_packet_id}, to=message_room(message_index.get(ack_packet_id)))
     except Exception as e:
         logging.error(f"Error in handle_admin_message: {e}")
         logging.exception("Stack trace:")
 
-def handle_routing_message(decoded_data, packet):
+@packet_handlers.on('ROUTING_APP')
+def handle_routing_message(view):
     try:
-        if decoded_data.get('requestId'):
-            ack_packet_id = decoded_data.get('requestId')
-            logging.info(f"ACK received for packet ID: {ack_packet_id}")
-            socketio.emit('message_ack', {'packetId': ack_packet_id})
+        if view.decoded.get('requestId'):
+            ack_packet_id = view.decoded.get('requestId')
+            error_reason = view.decoded.get('routing', {}).get('errorReason', 'NONE')
+            if error_reason != 'NONE':
+                logging.warning(f"Routing error {error_reason} for packet ID: {ack_packet_id}")
+                if ack_tracker.cancel(ack_packet_id) or message_index.get(ack_packet_id) is None:
+                    handle_undelivered(ack_packet_id, 'failed', error_reason)
+                return
+            rtt = ack_tracker.ack(ack_packet_id)
+            logging.info(f"ACK received for packet ID: {ack_packet_id}" + (f" after {rtt:.1f}s" if rtt is not None else ""))
+            message = message_index.get(ack_packet_id)
+            if set_message_status(ack_packet_id, 'acked'):
+                ack = {'packetId': ack_packet_id, 'rtt': rtt}
+                if message is not None and message.get('attempts'):
+                    # Stop the timers of the other attempts; queued retries see 'acked' and are skipped.
+                    for attempt_id in message['attempts']:
+                        ack_tracker.cancel(attempt_id)
+                    ack.update(packetId=message['packetId'], ackedPacketId=ack_packet_id,
+                               attempt=message['attempts'].index(ack_packet_id) + 1
+                               if ack_packet_id in message['attempts'] else None)
+                batched_emit('message_ack', ack, to=message_room(message))
     except Exception as e:
         logging.error(f"Error in handle_routing_message: {e}")
         logging.exception("Stack trace:")
- 
+
+def set_message_status(packet_id, status):
+    message, applied = message_index.set_status(packet_id, status)
+    if message is not None and not applied:
+        logging.debug(f"Ignoring {status} for packet ID {packet_id}, already {message.get('status')}")
+        return False
+    # Unknown ids (e.g. sent before a restart) still update the stored row.
+    message_store.update_status(message['packetId'] if message is not None else packet_id, status)
+    return True
+
+def message_room(message):
+    # Status events follow the message's channel; unknown messages go to everyone.
+    return channel_room(message.get('channel')) if message is not None else None
+
+def on_ack_timeout(packet_id):
+    handle_undelivered(packet_id, 'timeout')
+
+def handle_undelivered(packet_id, status, error=None):
+    message = message_index.get(packet_id)
+    attempts = message.get('attempts', []) if message is not None else []
+    if (message is not None and message.get('status') == 'pending' and attempts
+            and attempts[-1] == packet_id and len(attempts) < SEND_MAX_ATTEMPTS):
+        delay = backoff_delay(len(attempts), SEND_RETRY_BASE_SECONDS, SEND_RETRY_MAX_SECONDS)
+        job = send_queue.put({
+            'text': message['text'],
+            'channel': message['channel'],
+            'data': message.get('data'),
+            'packetId': message['packetId'],
+            'attempt': len(attempts) + 1
+        }, PRIORITY_LOW, delay=delay)
+        if job is not None:
+            logging.info(f"No ACK for packet ID {packet_id} ({error or status}), "
+                         f"retrying as attempt {len(attempts) + 1} in {delay:.1f}s")
+            batched_emit('message_retry', {
+                'packetId': message['packetId'],
+                'attempt': len(attempts) + 1,
+                'maxAttempts': SEND_MAX_ATTEMPTS,
+                'delay': round(delay, 1),
+                'reason': error or status
+            }, to=message_room(message))
+            return
+    original_id = message['packetId'] if message is not None else packet_id
+    if set_message_status(packet_id, status):
+        if status == 'timeout':
+            logging.warning(f"ACK timeout for packet ID {original_id} after {max(1, len(attempts))} attempt(s)")
+            batched_emit('message_ack_timeout', {'packetId': original_id, 'status': 'timeout', 'attempts': len(attempts)},
+                         to=message_room(message))
+        else:
+            batched_emit('routing_error', {'packetId': original_id, 'error': error, 'attempts': len(attempts)},
+                         to=message_room(message))
+
+def on_nodes_merged(src, dst):
+    logging.info(f"Merged duplicate node {src} into {dst}")
+    spatial_index.remove(src)
+    track_store.remove(src)
+    telemetry_store.remove(src)
+    batched_emit('node_merged', {'from': src, 'into': dst}, to=NODES_ROOM)
+
+def on_node_evicted(num):
+    logging.info(f"Evicted node {num} from node table")
+    spatial_index.remove(num)
+    track_store.remove(num)
+    telemetry_store.remove(num)
+    batched_emit('node_removed', {'num': num}, to=NODES_ROOM)
+
+def node_maintenance_loop():
+    while True:
+        socketio.sleep(NODE_AGE_CHECK_INTERVAL)
+        try:
+            expired = node_store.expire()
+            if expired:
+                logging.info(f"Aged out {expired} nodes not heard for {NODE_MAX_AGE_SECONDS}s")
+            if PACKET_LOG_ENABLED and PACKET_RETENTION_SECONDS:
+                message_store.prune_packets(time.time() - PACKET_RETENTION_SECONDS)
+        except Exception as e:
+            logging.error(f"Error in node maintenance: {e}")
+            logging.exception("Stack trace:")
+
 def update_node(node_id, data):
-    global found_nodes
     if not node_id:
         node_id = data.get('from') or data.get('fromId')
     if not node_id:
         logging.warning("Attempted to update node with empty ID")
         return
-    
-    if node_id not in found_nodes:
-        found_nodes[node_id] = {'num': node_id}
-    
+
     node_info = {
-        'num': node_id,
-        'user': data.get('user', {}),
-        'position': data.get('position', {}),
+        'user': data.get('user'),
+        'position': data.get('position'),
         'snr': data.get('snr') or data.get('rxSnr'),
         'lastHeard': data.get('lastHeard') or data.get('rxTime'),
-        'deviceMetrics': data.get('deviceMetrics', {}),
+        'deviceMetrics': data.get('deviceMetrics'),
         'hopsAway': data.get('hopsAway') or data.get('hopStart'),
-        'telemetry': data.get('telemetry', {}),
-        'viaMqtt': data.get('viaMqtt'),
-        'lastUpdated': int(time.time())  
+        'telemetry': data.get('telemetry'),
+        'viaMqtt': data.get('viaMqtt')
     }
-    
-    found_nodes[node_id] = merge_dicts(found_nodes[node_id], node_info)
-    
-    found_nodes[node_id] = {k: v for k, v in found_nodes[node_id].items() if v is not None}
-    for key in ['user', 'position', 'deviceMetrics', 'telemetry']:
-        if key in found_nodes[node_id]:
-            found_nodes[node_id][key] = {k: v for k, v in found_nodes[node_id][key].items() if v is not None}
-    
-    logging.info(f"Node updated: {found_nodes[node_id]}")
-    socketio.emit('node_updated', found_nodes[node_id])
-
-def merge_dicts(dict1, dict2):
-    result = dict1.copy()
-    for key, value in dict2.items():
-        if isinstance(value, dict):
-            result[key] = merge_dicts(result.get(key, {}), value)
-        elif value is not None:
-            result[key] = value
-    return result
-
-def handle_decoded_packet(decoded_data, packet, interface):
-    try:
-        portnum = decoded_data.get("portnum")
-
-        if portnum == portnums_pb2.PortNum.TEXT_MESSAGE_APP:
-            handle_text_message(decoded_data, packet)
-        elif portnum == portnums_pb2.PortNum.NODEINFO_APP:
-            handle_nodeinfo_message(decoded_data, packet)
-        elif portnum == portnums_pb2.PortNum.TELEMETRY_APP:
-            handle_telemetry_message(decoded_data, packet)
-        else:
-            logging.warning(f"Unhandled portnum: {portnum}")
-    except Exception as e:
-        logging.error(f"Error in handle_decoded_packet: {e}")
-        logging.exception("Stack trace:")
 
-def handle_text_message(decoded_data, packet):
+    record, changed = node_store.update(node_id, node_info)
+    if record is None:
+        logging.warning(f"Could not resolve node ID: {node_id}")
+        return
+    if changed:
+        logging.info(f"Node updated: {node_id} changed {changed}")
+        if any(path.startswith('position.') for path in changed):
+            index_node_position(record)
+        node_deltas.mark(record.num, changed, record.version)
+
+def position_coordinates(position):
+    if position is None:
+        return None, None
+    lat, lon = position.latitude, position.longitude
+    if lat is None and position.latitudeI is not None:
+        lat = position.latitudeI / 1e7
+    if lon is None and position.longitudeI is not None:
+        lon = position.longitudeI / 1e7
+    return lat, lon
+
+def index_node_position(record):
+    lat, lon = position_coordinates(record.position)
+    spatial_index.update(record.num, lat, lon)
+
+def nodes_in_area(results):
+    return [
+        {
+            'num': item[0],
+            'name': node_store.display_name(item[0]),
+            'latitude': item[1],
+            'longitude': item[2],
+            **({'distance': round(item[3], 1)} if len(item) > 3 else {})
+        }
+        for item in results
+    ]
+
+def query_nodes(args):
+    limit = max(1, min(int(args.get('limit') or MAP_QUERY_LIMIT), MAP_QUERY_LIMIT))
+    if args.get('bbox') is not None:
+        bbox = args['bbox']
+        if isinstance(bbox, str):
+            bbox = bbox.split(',')
+        south, west, north, east = (float(v) for v in bbox)
+        return nodes_in_area(spatial_index.query_bbox(south, west, north, east, limit))
+    if args.get('lat') is not None and args.get('lon') is not None and args.get('radius') is not None:
+        return nodes_in_area(spatial_index.query_radius(
+            float(args['lat']), float(args['lon']), float(args['radius']), limit
+        ))
+    raise ValueError("Expected bbox=south,west,north,east or lat, lon and radius (meters)")
+
+@packet_handlers.on('TEXT_MESSAGE_APP')
+def handle_text_message(view):
     try:
-        logging.info(f"Raw text message packet: {packet}")
+        logging.info(f"Raw text message packet: {view.packet}")
 
-        sender_id = packet.get('fromId', 'Unknown')
-        sender_node = found_nodes.get(sender_id, {})
-        sender_name = sender_node.get('user', {}).get('longName') or sender_node.get('user', {}).get('shortName') or sender_id
+        sender_name = node_store.display_name(view.node_num, view.from_id or 'Unknown')
 
         message = {
+            'packetId': view.packet_id,
             'sender': sender_name,
-            'text': decoded_data.get('text', ''),
-            'channel': packet.get('channel', 0),  
-            'timestamp': packet.get('rxTime', int(time.time()))
+            'text': view.decoded.get('text', ''),
+            'channel': view.channel,
+            'timestamp': view.rx_time or int(time.time())
         }
 
         display_message = f"{sender_name}\n{message['text']}\n{datetime.fromtimestamp(message['timestamp']).strftime('%Y-%m-%d %H:%M:%S')}"
 
-        received_messages.append(message)
+        message_store.add_message(dict(message, senderNum=view.node_num, to=view.to_id))
+        message_index.add(dict(message, direction='rx'))
         logging.info(f"New text message received: {display_message}")
-        socketio.emit('new_message', {'raw_message': message, 'formatted_message': display_message})
+        batched_emit('new_message', {'raw_message': message, 'formatted_message': display_message},
+                     to=channel_room(message['channel']))
     except Exception as e:
         logging.error(f"Error in handle_text_message: {e}")
         logging.exception("Stack trace:")
 
-def handle_position_message(decoded_data, packet):
+@packet_handlers.on('POSITION_APP')
+def handle_position_message(view):
     try:
-        position = decoded_data.get('position', {})
+        position = view.decoded.get('position', {})
         position_data = {
-            'sender': packet.get('fromId', 'Unknown'),
+            'sender': view.from_id or 'Unknown',
             'latitude': position.get('latitude'),
             'longitude': position.get('longitude'),
             'latitudeI': position.get('latitudeI'),
             'longitudeI': position.get('longitudeI'),
             'altitude': position.get('altitude'),
             'time': position.get('time'),
-            'timestamp': packet.get('rxTime', 0),
+            'timestamp': view.rx_time or 0,
             'PDOP': position.get('PDOP'),
             'groundSpeed': position.get('groundSpeed'),
             'groundTrack': position.get('groundTrack'),
@@ -414,45 +848,65 @@ def handle_position_message(decoded_data, packet):
             'precisionBits': position.get('precisionBits')
         }
         logging.info(f"Position update: {position_data}")
-        socketio.emit('position_update', position_data)
-        
+
+        lat = position_data['latitude']
+        lon = position_data['longitude']
+        if lat is None and position_data['latitudeI'] is not None:
+            lat = position_data['latitudeI'] / 1e7
+        if lon is None and position_data['longitudeI'] is not None:
+            lon = position_data['longitudeI'] / 1e7
+        if valid_coordinates(lat, lon):
+            batched_emit('position_update', position_data, to=map_rooms_for_point(lat, lon, MAP_ROOM_CELL_DEGREES))
+        else:
+            batched_emit('position_update', position_data, to=MAP_ALL_ROOM)
+        if view.node_num is not None and valid_coordinates(lat, lon):
+            track_store.add(view.node_num, lat, lon, position_data['altitude'],
+                            position_data['time'] or view.rx_time or time.time())
+
         node_info = {
             'position': position_data,
-            'lastHeard': packet.get('rxTime'),
-            'snr': packet.get('rxSnr'),
-            'hopsAway': packet.get('hopStart')
+            'lastHeard': view.rx_time,
+            'snr': view.rx_snr,
+            'hopsAway': view.hop_start
         }
-        update_node(packet.get('fromId') or packet.get('from'), node_info)
+        update_node(view.node_num, node_info)
     except Exception as e:
         logging.error(f"Error in handle_position_message: {e}")
         logging.exception("Stack trace:")
 
-def handle_telemetry_message(decoded_data, packet):
+@packet_handlers.on('TELEMETRY_APP')
+def handle_telemetry_message(view):
     try:
-        telemetry = decoded_data.get('telemetry', {})
+        telemetry = view.decoded.get('telemetry', {})
         telemetry_data = {
             'time': telemetry.get('time'),
             'deviceMetrics': telemetry.get('deviceMetrics', {})
         }
-        
+
         telemetry_data['deviceMetrics'] = {k: v for k, v in telemetry_data['deviceMetrics'].items() if v is not None}
-        
+
+        if view.node_num is not None:
+            telemetry_store.record(view.node_num, view.rx_time or telemetry_data['time'] or time.time(),
+                                   telemetry_data['deviceMetrics'])
+
         node_info = {
             'telemetry': telemetry_data,
-            'lastHeard': packet.get('rxTime'),
-            'snr': packet.get('rxSnr'),
-            'hopsAway': packet.get('hopStart')
+            'lastHeard': view.rx_time,
+            'snr': view.rx_snr,
+            'hopsAway': view.hop_start
         }
-        update_node(packet.get('fromId') or packet.get('from'), node_info)
+        update_node(view.node_num, node_info)
     except Exception as e:
         logging.error(f"Error in handle_telemetry_message: {e}")
         logging.exception("Stack trace:")
 
-def handle_nodeinfo_message(decoded_data, packet):
+@packet_handlers.on('NODEINFO_APP')
+def handle_nodeinfo_message(view):
     try:
+        decoded_data = view.decoded
         user_data = decoded_data.get('user', {})
         node_info = {
-            'num': packet.get('fromId') or packet.get('from') or user_data.get('id'),
+            'num': view.node_num or user_data.get('id'),
             'user': {
                 'id': user_data.get('id'),
                 'longName': user_data.get('longName'),
@@ -470,9 +924,9 @@ def handle_nodeinfo_message(decoded_data, packet):
                 'altitude': user_data.get('altitude'),
                 'time': user_data.get('time')
             },
-            'snr': packet.get('rxSnr'),
-            'lastHeard': packet.get('rxTime'),
-            'hopsAway': packet.get('hopStart'),
+            'snr': view.rx_snr,
+            'lastHeard': view.rx_time,
+            'hopsAway': view.hop_start,
             'deviceMetrics': {
                 'batteryLevel': user_data.get('batteryLevel'),
                 'voltage': user_data.get('voltage'),
@@ -498,12 +952,91 @@ def handle_nodeinfo_message(decoded_data, packet):
         node_info['deviceMetrics'] = {k: v for k, v in node_info['deviceMetrics'].items() if v is not None}
 
         update_node(node_info['num'], node_info)
-        
+
         logging.info(f"Node info received for {user_data.get('id')}: {node_info}")
     except Exception as e:
         logging.error(f"Error in handle_nodeinfo_message: {e}")
         logging.exception("Stack trace:")
 
+@packet_handlers.on('NEIGHBORINFO_APP')
+def handle_neighborinfo_message(view):
+    try:
+        neighborinfo = view.decoded.get('neighborinfo', {})
+        neighbor_data = {
+            'sender': view.sender,
+            'nodeId': neighborinfo.get('nodeId'),
+            'nodeBroadcastIntervalSecs': neighborinfo.get('nodeBroadcastIntervalSecs'),
+            'neighbors': [
+                {'nodeId': n.get('nodeId'), 'snr': n.get('snr')}
+                for n in neighborinfo.get('neighbors', [])
+            ],
+            'timestamp': view.rx_time
+        }
+        logging.info(f"Neighbor info from {view.sender}: {len(neighbor_data['neighbors'])} neighbors")
+        batched_emit('neighbor_info', neighbor_data, to=DEBUG_ROOM)
+    except Exception as e:
+        logging.error(f"Error in handle_neighborinfo_message: {e}")
+        logging.exception("Stack trace:")
+
+@packet_handlers.on('TRACEROUTE_APP')
+def handle_traceroute_message(view):
+    try:
+        traceroute = view.decoded.get('traceroute', {})
+        traceroute_data = {
+            'sender': view.sender,
+            'to': view.to_id,
+            'requestId': view.decoded.get('requestId'),
+            'route': traceroute.get('route', []),
+            'snrTowards': traceroute.get('snrTowards', []),
+            'routeBack': traceroute.get('routeBack', []),
+            'snrBack': traceroute.get('snrBack', []),
+            'timestamp': view.rx_time
+        }
+        logging.info(f"Traceroute from {view.sender}: {traceroute_data['route']}")
+        batched_emit('traceroute', traceroute_data, to=DEBUG_ROOM)
+    except Exception as e:
+        logging.error(f"Error in handle_traceroute_message: {e}")
+        logging.exception("Stack trace:")
+
+@packet_handlers.on('RANGE_TEST_APP')
+def handle_range_test_message(view):
+    try:
+        range_test_data = {
+            'sender': view.sender,
+            'text': view.decoded.get('text', ''),
+            'channel': view.channel,
+            'snr': view.rx_snr,
+            'rssi': view.rx_rssi,
+            'timestamp': view.rx_time
+        }
+        logging.info(f"Range test packet from {view.sender}: {range_test_data['text']}")
+        batched_emit('range_test', range_test_data, to=DEBUG_ROOM)
+    except Exception as e:
+        logging.error(f"Error in handle_range_test_message: {e}")
+        logging.exception("Stack trace:")
+
+@packet_handlers.on('STORE_FORWARD_APP')
+def handle_store_forward_message(view):
+    try:
+        store_forward = view.decoded.get('storeforward', {})
+        store_forward_data = {
+            'sender': view.sender,
+            'requestResponse': store_forward.get('rr'),
+            'stats': store_forward.get('stats'),
+            'history': store_forward.get('history'),
+            'heartbeat': store_forward.get('heartbeat'),
+            'timestamp': view.rx_time
+        }
+        logging.info(f"Store & forward packet from {view.sender}: {store_forward_data['requestResponse']}")
+        batched_emit('store_forward', store_forward_data, to=DEBUG_ROOM)
+    except Exception as e:
+        logging.error(f"Error in handle_store_forward_message: {e}")
+        logging.exception("Stack trace:")
+
+def handle_unknown_portnum(view):
+    logging.warning(f"Unhandled portnum: {view.portnum}")
+
+packet_handlers.set_fallback(handle_unknown_portnum)
 
 @app.route('/')
 def index():
@@ -512,8 +1045,9 @@ def index():
         return render_template('index.html', 
                                ports=ports, 
                                initialChannels=available_channels, 
-                               initialNodes=found_nodes,
-                               initialMessages=messages)
+                               initialNodes=node_store.to_dict() if OWNS_RADIO_STATE else {},
+                               initialMessages={0: message_store.page(0, limit=MESSAGE_PAGE_SIZE)['messages']}
+                               if OWNS_RADIO_STATE else {})
     except Exception as e:
         logging.error(f"Error in index route: {e}")
         logging.exception("Stack trace:")
@@ -523,6 +1057,156 @@ def index():
 def settings():
     return render_template('settings.html')
 
+@app.route('/stats')
+def stats():
+    return jsonify(collect_stats())
+
+@app.route('/nodes/within')
+@ingest_route
+def nodes_within():
+    try:
+        return jsonify({'nodes': query_nodes(request.args)})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/nodes/<node_id>/track')
+@ingest_route
+def node_track(node_id):
+    try:
+        return jsonify(get_node_track(node_id, request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+def get_node_track(node_id, args):
+    num = node_store.resolve(node_id)
+    if num is None:
+        raise ValueError(f"Unknown node: {node_id}")
+    tolerance = float(args.get('tolerance', TRACK_DEFAULT_TOLERANCE_METERS))
+    since = int(args['since']) if args.get('since') is not None else None
+    points, simplified = track_store.track(num, tolerance, since)
+    return {
+        'num': num,
+        'tolerance': tolerance,
+        'originalPoints': len(points),
+        'points': [list(point) for point in simplified]
+    }
+
+@app.route('/nodes/<node_id>/telemetry')
+@ingest_route
+def node_telemetry(node_id):
+    try:
+        return jsonify(get_node_telemetry(node_id, request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+def get_node_telemetry(node_id, args):
+    num = node_store.resolve(node_id)
+    if num is None:
+        raise ValueError(f"Unknown node: {node_id}")
+    metrics = args.get('metric') or args.get('metrics')
+    if not metrics:
+        metrics = telemetry_store.metrics(num)
+    elif isinstance(metrics, str):
+        metrics = metrics.split(',')
+    end = int(args['end']) if args.get('end') is not None else int(time.time()) + 1
+    start = int(args['start']) if args.get('start') is not None else end - 24 * 3600
+    if end <= start:
+        raise ValueError("end must be after start")
+    if args.get('resolution') is not None:
+        resolution = int(args['resolution'])
+        if resolution <= 0:
+            raise ValueError("resolution must be a positive number of seconds")
+    else:
+        resolution = max(1, (end - start) // 200)
+    if (end - start) // resolution > TELEMETRY_MAX_BUCKETS:
+        raise ValueError(f"Resolution too fine: at most {TELEMETRY_MAX_BUCKETS} buckets per query")
+    return {
+        'num': num,
+        'start': start,
+        'end': end,
+        'resolution': resolution,
+        'series': {metric: telemetry_store.query(num, metric, start, end, resolution) for metric in metrics}
+    }
+
+@app.route('/messages')
+@ingest_route
+def messages_history():
+    try:
+        return jsonify(get_messages_page(request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+def get_messages_page(args):
+    channel = int(args.get('channel') or 0)
+    limit = max(1, min(int(args.get('limit') or MESSAGE_PAGE_SIZE), MESSAGE_PAGE_MAX))
+    return message_store.page(channel, args.get('before'), args.get('after'), limit)
+
+@app.route('/messages/search')
+@ingest_route
+def messages_search():
+    try:
+        return jsonify(search_messages(request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+def search_messages(args):
+    channel = args.get('channel')
+    sender = args.get('sender')
+    sender_num = None
+    if sender:
+        sender_num = node_store.resolve(sender)
+        if sender_num is None:
+            raise ValueError(f"Unknown sender: {sender}")
+    start = args.get('start')
+    end = args.get('end')
+    return message_store.search(
+        args.get('q') or args.get('query') or '',
+        channel=int(channel) if channel not in (None, '') else None,
+        sender_num=sender_num,
+        start=int(start) if start not in (None, '') else None,
+        end=int(end) if end not in (None, '') else None,
+        limit=max(1, min(int(args.get('limit') or MESSAGE_SEARCH_LIMIT), MESSAGE_SEARCH_MAX)),
+        offset=max(0, int(args.get('offset') or 0)),
+        candidates=MESSAGE_SEARCH_CANDIDATES,
+        before=int(args['before']) if args.get('before') not in (None, '') else None
+    )
+
+@app.route('/stats/nodes/memory')
+@ingest_route
+def node_memory_stats():
+    return jsonify(node_store.memory_usage())
+
+def collect_stats():
+    stats = {}
+    if OWNS_RADIO_STATE:
+        stats.update({
+            'dispatch': packet_handlers.stats.snapshot(),
+            'ingest': ingest_queue.stats(),
+            'dedup': duplicate_filter.stats(),
+            'nodeDeltas': node_deltas.stats(),
+            'nodes': node_store.stats(),
+            'spatial': spatial_index.stats(),
+            'tracks': track_store.stats(),
+            'telemetry': telemetry_store.stats(),
+            'messageStore': message_store.stats(),
+            'messageIndex': message_index.stats(),
+            'acks': ack_tracker.stats(),
+            'sendQueue': send_queue.stats(),
+            'clientQuota': client_quota.stats(),
+            'compression': text_compression.stats()
+        })
+    stats.update({
+        'emitBatches': emit_batcher.stats(),
+        'loopBridge': loop_bridge.stats(),
+        'bus': dict(bus_manager.stats(), role=SERVER_ROLE,
+                    broker=message_broker.stats() if message_broker else None) if bus_manager else {'role': SERVER_ROLE},
+        'wire': dict(wire_stats.stats(), clients={
+            wire_format: sum(1 for f in list(client_formats.values()) if f == wire_format)
+            for wire_format in WIRE_FORMATS
+        })
+    })
+    return stats
+
 
 @socketio.on_error()
 def error_handler(e):
@@ -530,10 +1214,63 @@ def error_handler(e):
     safe_emit('error', {'message': 'An unexpected error occurred'})
 
 
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    try:
+        wanted = set()
+        for channel in data.get('channels', [0]):
+            wanted.add(channel_room(channel))
+        for topic in data.get('topics', [NODES_ROOM]):
+            if topic in TOPIC_ROOMS:
+                wanted.add(TOPIC_ROOMS[topic])
+        viewport = data.get('viewport')
+        if viewport is None:
+            wanted.add(MAP_ALL_ROOM)
+        elif viewport:
+            south, west, north, east = (float(v) for v in viewport)
+            wanted.update(map_rooms_for_bbox(south, west, north, east, MAP_ROOM_CELL_DEGREES, MAP_ROOM_MAX_CELLS))
+        wire_format = client_formats.get(request.sid, WIRE_JSON)
+        joined = {wire_room(room, wire_format) for room in wanted | {BROADCAST_ROOM}}
+        current = set(rooms()) - {request.sid}
+        for room in current - joined:
+            leave_room(room)
+        for room in joined - current:
+            join_room(room)
+        reply('subscribed', {'rooms': sorted(wanted)})
+    except Exception as e:
+        logging.error(f"Error in subscribe: {e}")
+        logging.exception("Stack trace:")
+
+@socketio.on('disconnect')
+def handle_disconnect(reason=None):
+    client_formats.pop(request.sid, None)
+    to_ingest('client_disconnected')
+
+@ingest_event('client_disconnected', expose=False)
+def on_client_disconnected():
+    client_quota.forget(request.sid)
+    client_formats.pop(request.sid, None)
+
 @socketio.on('connect')
-def handle_connect():
+def handle_connect(auth=None):
     logging.info("WebSocket client connected")
-    emit('settings_data', get_current_settings())
+    wire_format = (auth or {}).get('wire')
+    if wire_format not in WIRE_FORMATS:
+        wire_format = WIRE_JSON
+    emit('wire_format', {
+        'format': wire_format,
+        'version': WIRE_VERSION,
+        'fields': FIELD_NAMES if wire_format == WIRE_COMPACT else None
+    })
+    for room in (BROADCAST_ROOM,) + DEFAULT_ROOMS:
+        join_room(wire_room(room, wire_format))
+    client_formats[request.sid] = wire_format
+    to_ingest('client_connected', wire_format)
+
+@ingest_event('client_connected', expose=False)
+def on_client_connected(wire_format):
+    client_formats[request.sid] = wire_format
+    reply('settings_data', get_current_settings())
     try:
         if os.path.exists(WEBHOOK_FILE):
             with open(WEBHOOK_FILE, 'r') as f:
@@ -545,7 +1282,7 @@ def handle_connect():
         logging.error(f"Error checking webhook file on connect: {e}")
 
 
-@socketio.on('connect_serial')
+@ingest_event('connect_serial')
 def handle_connect_serial(data):
     try:
         port = data.get('port')
@@ -561,7 +1298,7 @@ def handle_connect_serial(data):
         socketio.emit('serial_error', {'message': str(e)})
 
 
-@socketio.on('disconnect_serial')
+@ingest_event('disconnect_serial')
 def handle_disconnect_serial():
     try:
         interface = app.config.get('serial_interface')
@@ -577,95 +1314,241 @@ def handle_disconnect_serial():
         logging.exception("Stack trace:")
         socketio.emit('serial_error', {'message': str(e)})
 
-@socketio.on('get_messages')
-def handle_get_messages():
+@ingest_event('get_stats')
+def handle_get_stats():
+    try:
+        reply('stats', collect_stats())
+    except Exception as e:
+        logging.error(f"Error in get_stats: {e}")
+        logging.exception("Stack trace:")
+
+@ingest_event('get_nodes')
+def handle_get_nodes():
+    try:
+        reply('all_nodes', {'nodes': node_store.to_dict()})
+    except Exception as e:
+        logging.error(f"Error in get_nodes: {e}")
+        logging.exception("Stack trace:")
+
+@ingest_event('resync_nodes')
+def handle_resync_nodes(data):
+    try:
+        for node_id in data.get('ids', []):
+            node_data = node_store.get_dict(node_id)
+            if node_data is not None:
+                reply('node_updated', node_data)
+    except Exception as e:
+        logging.error(f"Error in resync_nodes: {e}")
+        logging.exception("Stack trace:")
+
+@ingest_event('query_nodes_in_view')
+def handle_query_nodes_in_view(data):
+    try:
+        reply('nodes_in_view', {'bbox': data.get('bbox'), 'nodes': query_nodes(data)})
+    except Exception as e:
+        logging.error(f"Error in query_nodes_in_view: {e}")
+        logging.exception("Stack trace:")
+
+@ingest_event('get_track')
+def handle_get_track(data):
+    try:
+        reply('node_track', get_node_track(data.get('num'), data))
+    except Exception as e:
+        logging.error(f"Error in get_track: {e}")
+        logging.exception("Stack trace:")
+
+@ingest_event('get_telemetry')
+def handle_get_telemetry(data):
+    try:
+        reply('node_telemetry', get_node_telemetry(data.get('num'), data))
+    except Exception as e:
+        logging.error(f"Error in get_telemetry: {e}")
+        logging.exception("Stack trace:")
+
+@ingest_event('search_messages')
+def handle_search_messages(data):
+    try:
+        reply('search_results', search_messages(data or {}))
+    except ValueError as e:
+        reply('search_results', {'query': (data or {}).get('q'), 'error': str(e), 'results': []})
+    except Exception as e:
+        logging.error(f"Error in search_messages: {e}")
+        logging.exception("Stack trace:")
+
+@ingest_event('get_messages')
+def handle_get_messages(data=None):
     try:
-        socketio.emit('all_messages', {'messages': app.config['received_messages']})
+        reply('messages_page', get_messages_page(data or {}))
     except Exception as e:
         logging.error(f"Error in get_messages: {e}")
         logging.exception("Stack trace:")
 
-@socketio.on('send_message')
+@ingest_event('send_message')
 def handle_send_message(data):
     try:
         message = data.get('message')
         channel_index = data.get('channel', 0)
-        interface = app.config.get('serial_interface')
-        if interface:
-            logging.info(f"Attempting to send message: '{message}' on channel {channel_index}")
-            mesh_packet = interface.sendText(message, channelIndex=channel_index, wantAck=True)
-            packet_id = mesh_packet.id
-            logging.info(f"Sent message: '{message}' on channel {channel_index} with packet ID: {packet_id}")
-
-            complete_message_data = {
-                'packetId': packet_id,
-                'message': message,
-                'channel': channel_index,
-                'timestamp': int(time.time())
-            }
-
-            if channel_index not in app.config['messages']:
-                app.config['messages'][channel_index] = []
-            app.config['messages'][channel_index].append(complete_message_data)
-
-            try:
-                with open(WEBHOOK_FILE, 'r') as f:
-                    webhook_data = json.load(f)
-                    webhook_url = webhook_data.get('url')
-
-                if webhook_url:
-                    my_node_info = interface.getMyNodeInfo()
-                    device_info = my_node_info.get('user', {}).get('hwModel', 'Unknown Device')
-                    battery_level = my_node_info.get('deviceMetrics', {}).get('batteryLevel')
-                    if battery_level is not None:
-                        device_info += f" (🔋 {battery_level}%)"
-
-                    embed = {
-                        "title": "📡 New Meshtastic Message",
-                        "description": message,
-                        "color": 3447003,
-                        "fields": [
-                            {"name": "👤 From", "value": my_node_info.get('user', {}).get('longName', 'You')},
-                            {"name": "🔧 Device", "value": device_info}
-                        ],
-                        "footer": {"text": "Meshtastic"},
-                        "timestamp": datetime.utcnow().isoformat()
-                    }
-
-                    position = my_node_info.get('position', {})
-                    if position.get('latitude') is not None and position.get('longitude') is not None:
-                        embed["fields"].append({
-                            "name": "📍 Location",
-                            "value": f"[View on Map](https://www.google.com/maps?q={position['latitude']},{position['longitude']})"
-                        })
-
-                    webhook_payload = {"embeds": [embed]}
-                    response = requests.post(webhook_url, json=webhook_payload)
-                    response.raise_for_status()
-                    logging.info("Message sent to Discord webhook successfully")
-                else:
-                    logging.info("No Discord webhook URL set")
-            except Exception as e:
-                logging.error(f"Error sending to Discord webhook: {e}")
-
-            socketio.emit('message_sent', {
-                'status': 'success',
-                'packetId': packet_id,
-                'message': message,
-                'channel': channel_index,
-                'timestamp': int(time.time())
-            })
-
-            socketio.start_background_task(wait_for_ack, interface, packet_id)
-        else:
+        if not app.config.get('serial_interface'):
             logging.error("Serial interface not connected")
-            socketio.emit('serial_error', {'message': 'Not connected'})
+            reply('serial_error', {'message': 'Not connected'})
+            return
+        priority = data.get('priority', 'normal')
+        priority = PRIORITY_NAMES.index(priority) if priority in PRIORITY_NAMES else PRIORITY_NORMAL
+        payload = {'text': message, 'channel': channel_index, 'clientId': data.get('clientId')}
+        allowed, reason, retry_after = client_quota.admit(request.sid, send_queue.queued(request.sid))
+        if not allowed:
+            logging.warning(f"Throttling client {request.sid}: {reason}")
+            reply('send_throttled', dict(payload, reason=reason,
+                                         retryAfter=round(retry_after, 1) if retry_after is not None else None))
+            return
+        job_payload = payload
+        if data.get('compress'):
+            job_payload = dict(payload, data=text_compression.compress(message))
+        job = send_queue.put(job_payload, priority, request.sid)
+        if job is None:
+            logging.warning(f"Send queue full, rejecting message on channel {channel_index}")
+            reply('send_rejected', dict(payload, reason='Send queue is full'))
+            return
+        logging.info(f"Queued message: '{message}' on channel {channel_index} as job {job.id}")
     except Exception as e:
         logging.error(f"Error in send_message: {str(e)}")
         logging.exception("Stack trace:")
-        socketio.emit('serial_error', {'message': str(e)})
+        reply('serial_error', {'message': str(e)})
 
-@socketio.on('load_webhook_url')
+def on_send_position(job, position, eta):
+    if job.sid is None:
+        return
+    batched_emit('send_queued', {
+        'jobId': job.id,
+        'clientId': job.payload.get('clientId'),
+        'channel': job.payload['channel'],
+        'position': position,
+        'eta': round(eta, 1)
+    }, to=job.sid)
+
+def send_queued_message(job):
+    if job.payload.get('attempt', 1) > 1:
+        return resend_message(job)
+    message = job.payload['text']
+    channel_index = job.payload['channel']
+    interface = app.config.get('serial_interface')
+    try:
+        if not interface:
+            raise RuntimeError('Not connected')
+        logging.info(f"Attempting to send message: '{message}' on channel {channel_index}"
+                     + (f" compressed to {len(job.payload['data'])} bytes" if job.payload.get('data') else ""))
+        mesh_packet = transmit_text(interface, job.payload)
+    except Exception as e:
+        socketio.emit('serial_error', {'message': str(e), 'jobId': job.id, 'clientId': job.payload.get('clientId')}, to=job.sid)
+        raise
+    packet_id = mesh_packet.id
+    logging.info(f"Sent message: '{message}' on channel {channel_index} with packet ID: {packet_id}")
+
+    sent = {
+        'packetId': packet_id,
+        'sender': 'You',
+        'senderNum': app.config.get('my_node_id'),
+        'text': message,
+        'channel': channel_index,
+        'timestamp': int(time.time()),
+        'direction': 'tx',
+        'status': 'pending',
+        'attempts': [packet_id],
+        'data': job.payload.get('data')
+    }
+    message_index.add(sent)
+    message_store.add_message(sent)
+    ack_tracker.track(packet_id)
+
+    socketio.start_background_task(post_sent_message_webhook, interface, message)
+
+    batched_emit('message_sent', {
+        'status': 'success',
+        'packetId': packet_id,
+        'jobId': job.id,
+        'clientId': job.payload.get('clientId'),
+        'message': message,
+        'channel': channel_index,
+        'timestamp': sent['timestamp'],
+        'compressed': bool(job.payload.get('data'))
+    }, to=channel_room(channel_index))
+
+def transmit_text(interface, payload):
+    if payload.get('data'):
+        return interface.sendData(payload['data'], portNum=COMPRESSED_TEXT_PORTNUM,
+                                  wantAck=True, channelIndex=payload['channel'])
+    return interface.sendText(payload['text'], channelIndex=payload['channel'], wantAck=True)
+
+def resend_message(job):
+    original = message_index.get(job.payload['packetId'])
+    attempt = job.payload['attempt']
+    if original is None or original.get('status') != 'pending':
+        logging.info(f"Skipping attempt {attempt} for packet ID {job.payload['packetId']}, no longer pending")
+        return
+    interface = app.config.get('serial_interface')
+    try:
+        if not interface:
+            raise RuntimeError('Not connected')
+        mesh_packet = transmit_text(interface, job.payload)
+    except Exception:
+        set_message_status(original['packetId'], 'failed')
+        batched_emit('routing_error', {'packetId': original['packetId'], 'error': 'Resend failed', 'attempts': attempt - 1},
+                     to=message_room(original))
+        raise
+    packet_id = mesh_packet.id
+    original['attempts'].append(packet_id)
+    message_index.alias(packet_id, original)
+    ack_tracker.track(packet_id)
+    logging.info(f"Resent packet ID {original['packetId']} as {packet_id} (attempt {attempt})")
+    batched_emit('message_retry_sent', {
+        'packetId': original['packetId'],
+        'retryPacketId': packet_id,
+        'attempt': attempt,
+        'maxAttempts': SEND_MAX_ATTEMPTS
+    }, to=message_room(original))
+
+def post_sent_message_webhook(interface, message):
+    try:
+        with open(WEBHOOK_FILE, 'r') as f:
+            webhook_data = json.load(f)
+            webhook_url = webhook_data.get('url')
+
+        if webhook_url:
+            my_node_info = interface.getMyNodeInfo()
+            device_info = my_node_info.get('user', {}).get('hwModel', 'Unknown Device')
+            battery_level = my_node_info.get('deviceMetrics', {}).get('batteryLevel')
+            if battery_level is not None:
+                device_info += f" (🔋 {battery_level}%)"
+
+            embed = {
+                "title": "📡 New Meshtastic Message",
+                "description": message,
+                "color": 3447003,
+                "fields": [
+                    {"name": "👤 From", "value": my_node_info.get('user', {}).get('longName', 'You')},
+                    {"name": "🔧 Device", "value": device_info}
+                ],
+                "footer": {"text": "Meshtastic"},
+                "timestamp": datetime.utcnow().isoformat()
+            }
+
+            position = my_node_info.get('position', {})
+            if position.get('latitude') is not None and position.get('longitude') is not None:
+                embed["fields"].append({
+                    "name": "📍 Location",
+                    "value": f"[View on Map](https://www.google.com/maps?q={position['latitude']},{position['longitude']})"
+                })
+
+            webhook_payload = {"embeds": [embed]}
+            response = requests.post(webhook_url, json=webhook_payload)
+            response.raise_for_status()
+            logging.info("Message sent to Discord webhook successfully")
+        else:
+            logging.info("No Discord webhook URL set")
+    except Exception as e:
+        logging.error(f"Error sending to Discord webhook: {e}")
+
+@ingest_event('load_webhook_url')
 def handle_load_webhook_url():
     try:
         if os.path.exists(WEBHOOK_FILE):
@@ -681,7 +1564,7 @@ def handle_load_webhook_url():
         logging.error(f"Error loading webhook URL: {e}")
         socketio.emit('webhook_url_loaded', {'url': ''})
 
-@socketio.on('save_webhook_url')
+@ingest_event('save_webhook_url')
 def handle_save_webhook_url(data):
     try:
         url = data.get('url', '')
@@ -692,7 +1575,7 @@ def handle_save_webhook_url(data):
     except Exception as e:
         logging.error(f"Error saving webhook URL: {e}")
 
-@socketio.on('delete_webhook_url')
+@ingest_event('delete_webhook_url')
 def handle_delete_webhook_url():
     try:
         if os.path.exists(WEBHOOK_FILE):
@@ -704,907 +1587,11 @@ def handle_delete_webhook_url():
     except Exception as e:
         logging.error(f"Error deleting webhook URL: {e}")
 
-ack_events = {}
-
-def wait_for_ack(interface, packet_id):
-    ack_event = Event()
-    ack_events[packet_id] = ack_event
-    try:
-        if ack_event.wait(timeout=60):
-            logging.info(f"ACK received for packet ID: {packet_id}")
-            socketio.emit('message_ack', {'packetId': packet_id, 'status': 'success'})
-        else:
-            logging.warning(f"ACK timeout for packet ID {packet_id}")
-            socketio.emit('message_ack_timeout', {'packetId': packet_id, 'status': 'timeout'})
-    except Exception as e:
-        logging.error(f"Error waiting for ACK for packet ID {packet_id}: {str(e)}")
-    finally:
-        del ack_events[packet_id]
-
-def handle_ack_message(decoded_data, packet):
-    try:
-        ack_packet_id = decoded_data.get('requestId')
-        if ack_packet_id:
-            logging.info(f"ACK received for packet ID: {ack_packet_id}")
-            socketio.emit('message_ack', {'packetId': ack_packet_id, 'status': 'success'})
-            
-            for channel, channel_messages in app.config['messages'].items():
-                for message in channel_messages:
-                    if message.get('packetId') == ack_packet_id:
-                        message['status'] = 'acked'
-                        break
-            
-            if ack_packet_id in ack_events:
-                ack_events[ack_packet_id].set()
-            
-            socketio.emit('update_message_status', {'packetId': ack_packet_id, 'status': 'acked'})
-        else:
-            logging.warning(f"Received ACK message without requestId: {decoded_data}")
-    except Exception as e:
-        logging.error(f"Error in handle_ack_message: {e}")
-        logging.exception("Stack trace:")
-
-if __name__ == '__main__':
-    socketio.run(app, port=5678)
-from flask import Flask, render_template, request
-from flask_socketio import SocketIO, emit
-from flask_cors import CORS
-
-import serial
-import serial.tools.list_ports
-
-import json
-import logging
-import os
-
-import meshtastic
-from meshtastic.serial_interface import SerialInterface
-from meshtastic import mesh_pb2, portnums_pb2, telemetry_pb2
-from meshtastic.mesh_interface import MeshInterface
-from meshtastic import mesh_interface
-
-from pubsub import pub
-
-import time
-from datetime import datetime
-import asyncio
-import threading
-from threading import Event
-import requests
-
-from google.protobuf.json_format import MessageToDict
-
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
-
-app = Flask(__name__)
-CORS(app)
-socketio = SocketIO(app, cors_allowed_origins="*")
-
-available_channels = []
-found_nodes = {}
-received_messages = []
-messages = {}
-
-app.config['received_messages'] = received_messages
-app.config['messages'] = {}
-
-connection_timeout = None
-
-WEBHOOK_FILE = 'discord_webhook.json'
-
-def list_serial_ports():
-    try:
-        return [port.device for port in serial.tools.list_ports.comports()]
-    except Exception as e:
-        logging.error(f"Error listing serial ports: {e}")
-        return []
-
-def connect_serial(port):
-    global connection_timeout
-    
-    try:
-        def timeout_handler():
-            logging.error("Timed out waiting for connection completion")
-            safe_emit('serial_error', {'message': 'Connection timed out'})
-
-        connection_timeout = threading.Timer(60, timeout_handler)
-        connection_timeout.start()
-
-        interface = SerialInterface(port)
-        logging.info(f"Interface created: {interface}")
-
-        if connection_timeout:
-            connection_timeout.cancel()
-            connection_timeout = None
-
-        pub.subscribe(on_receive, "meshtastic.receive")
-        pub.subscribe(on_connection, "meshtastic.connection.established")
-        
-        interface.on_received = on_receive
-
-        my_info = interface.getMyNodeInfo()
-        app.config['my_node_id'] = my_info['num']
-        
-        initial_node_info = {
-            'num': my_info['num'],
-            'user': {
-                'id': my_info['user']['id'],
-                'longName': my_info['user']['longName'],
-                'shortName': my_info['user']['shortName'],
-                'macaddr': my_info['user']['macaddr'],
-                'hwModel': my_info['user']['hwModel']
-            },
-            'position': my_info.get('position', {}),
-            'lastHeard': my_info.get('lastHeard'),
-            'deviceMetrics': my_info.get('deviceMetrics', {}),
-            'isLocal': True
-        }
-
-        update_node(initial_node_info['num'], initial_node_info)
-
-        safe_emit('serial_connected', {'port': port, 'initialNodeInfo': initial_node_info})
-        logging.info(f"Connected to Meshtastic device on {port}")
-        return interface
-    except Exception as e:
-        if connection_timeout:
-            connection_timeout.cancel()
-            connection_timeout = None
-        logging.error(f"Error connecting to Meshtastic device: {e}")
-        safe_emit('serial_error', {'message': str(e)})
-        return None
-
-def on_connection(interface, topic=pub.AUTO_TOPIC):
-    global connection_timeout, available_channels, received_messages
-    if connection_timeout:
-        connection_timeout.cancel()
-        connection_timeout = None
-
-    pub.subscribe(on_receive, "meshtastic.receive")
-    pub.subscribe(on_connection, "meshtastic.connection.established")
-    logging.info("Connected to Meshtastic device")
-    try:
-        clear_message_queue(interface)
-
-        info = interface.getMyNodeInfo()
-        logging.info(f"Connected to {info}")
-
-        channels = interface.localNode.channels
-
-        available_channels = []
-        for idx, channel in enumerate(channels):
-            channel_info = {
-                'index': idx,
-                'name': channel.settings.name or f'Channel {idx}',
-                'role': channel.role
-            }
-            available_channels.append(channel_info)
-
-        logging.info(f"Available channels: {available_channels}")
-        socketio.emit('channel_list', {'channels': available_channels})
-
-        nodes = interface.nodes
-        for node_id, node_data in nodes.items():
-            update_node(node_id, node_data)
-
-        received_messages = fetch_stored_messages(interface)
-        app.config['received_messages'] = received_messages
-        socketio.emit('all_messages', {'messages': received_messages})
-
-    except Exception as e:
-        logging.error(f"Error in on_connection: {e}")
-        logging.exception("Stack trace:")
-        default_channel = {'index': 0, 'name': 'Default', 'role': 'PRIMARY'}
-        available_channels = [default_channel]
-        socketio.emit('channel_list', {'channels': available_channels})
-
-def safe_emit(event, data):
-    try:
-        socketio.emit(event, data)
-    except Exception as e:
-        logging.error(f"Error emitting {event}: {e}")
-
-def fetch_stored_messages(interface):
-    messages = []
-    try:
-        if hasattr(interface, 'nodesByNum'):
-            nodes = interface.nodesByNum
-            for node_id, node_data in nodes.items():
-                if 'messages' in node_data:
-                    for msg in node_data['messages']:
-                        message = {
-                            'from': msg.get('fromId'),
-                            'to': msg.get('toId'),
-                            'payload': msg.get('payload'),
-                            'portnum': msg.get('portnum'),
-                            'timestamp': msg.get('rxTime')
-                        }
-                        messages.append(message)
-        else:
-            logging.warning("Interface does not have attribute 'nodesByNum'")
-    except Exception as e:
-        logging.error(f"Error fetching stored messages: {e}")
-        logging.exception("Stack trace:")
-    return messages
-
-def clear_message_queue(interface):
-    try:
-        queue_status = interface.getQueueStatus()
-        logging.info(f"Initial queue status: {queue_status}")
-
-        while queue_status.free < queue_status.maxlen:
-            interface.deleteFromQueue()
-            queue_status = interface.getQueueStatus()
-            logging.info(f"Cleared a message. New queue status: {queue_status}")
-
-        logging.info("Message queue cleared successfully")
-        socketio.emit('queue_cleared', {'message': 'Message queue cleared on connection'})
-    except Exception as e:
-        logging.error(f"Error clearing message queue: {e}")
-        logging.exception("Stack trace:")
-        socketio.emit('queue_error', {'message': f'Error clearing queue: {str(e)}'})
-
-def on_receive(packet, interface):
-    logging.debug(f"Raw received packet: {packet}")
-    try:
-        if 'decoded' in packet:
-            portnum = packet['decoded'].get('portnum')
-            if portnum == 'TEXT_MESSAGE_APP':
-                handle_text_message(packet['decoded'], packet)
-            elif portnum == 'NODEINFO_APP':
-                handle_nodeinfo_message(packet['decoded'], packet)
-            elif portnum == 'POSITION_APP':
-                handle_position_message(packet['decoded'], packet)
-            elif portnum == 'TELEMETRY_APP':
-                handle_telemetry_message(packet['decoded'], packet)
-            elif portnum == 'ADMIN_APP':
-                handle_admin_message(packet['decoded'], packet)
-            elif portnum == 'ROUTING_APP':
-                handle_routing_message(packet['decoded'], packet)
-            elif 'encrypted' in packet:
-                logging.info(f"Received encrypted packet from {packet.get('fromId') or packet.get('from')} to {packet.get('toId') or packet.get('to')}")
-                logging.debug(f"Encrypted packet details: Channel: {packet.get('channel')}, SNR: {packet.get('rxSnr')}, RSSI: {packet.get('rxRssi')}, Hops: {packet.get('hopStart')}")    
-            else:
-                logging.warning(f"Unhandled portnum: {portnum}")
-            
-            if 'message' in packet['decoded']:
-                update_messages(packet['decoded'], packet)
-        elif 'encrypted' in packet:
-            logging.info("Received encrypted packet")
-        else:
-            logging.warning("Received packet with unknown format")
-        
-        update_node(packet.get('fromId') or packet.get('from'), packet)
-    except Exception as e:
-        logging.error(f"Unexpected error in on_receive: {e}")
-        logging.exception("Stack trace:")
-
-def update_messages(decoded_data, packet):
-    try:
-        global received_messages
-        message = {
-            'from': packet.get('fromId'),
-            'to': packet.get('toId'),
-            'payload': decoded_data.get('payload'),
-            'portnum': decoded_data.get('portnum'),
-            'timestamp': packet.get('rxTime')
-        }
-        received_messages.append(message)
-        logging.info(f"New message added: {message}")
-        socketio.emit('new_message', {'message': message})
-    except Exception as e:
-        logging.error(f"Error updating messages: {e}")
-        logging.exception("Stack trace:")
-
-def handle_admin_message(decoded_data, packet):
-    try:
-        if decoded_data.get('payload'):
-            admin_message = mesh_pb2.AdminMessage()
-            admin_message.ParseFromString(decoded_data['payload'])
-            if admin_message.get_ack:
-                ack_packet_id = admin_message.get_ack.for_packet
-                logging.info(f"ACK received for packet ID: {ack_packet_id}")
-                socketio.emit('message_ack', {'packetId': ack_packet_id})
-    except Exception as e:
-        logging.error(f"Error in handle_admin_message: {e}")
-        logging.exception("Stack trace:")
-
-def handle_routing_message(decoded_data, packet):
-    try:
-        if decoded_data.get('requestId'):
-            ack_packet_id = decoded_data.get('requestId')
-            logging.info(f"ACK received for packet ID: {ack_packet_id}")
-            socketio.emit('message_ack', {'packetId': ack_packet_id})
-    except Exception as e:
-        logging.error(f"Error in handle_routing_message: {e}")
-        logging.exception("Stack trace:")
- 
-def update_node(node_id, data):
-    global found_nodes
-    if not node_id:
-        node_id = data.get('from') or data.get('fromId')
-    if not node_id:
-        logging.warning("Attempted to update node with empty ID")
-        return
-    
-    if node_id not in found_nodes:
-        found_nodes[node_id] = {'num': node_id}
-    
-    node_info = {
-        'num': node_id,
-        'user': data.get('user', {}),
-        'position': data.get('position', {}),
-        'snr': data.get('snr') or data.get('rxSnr'),
-        'lastHeard': data.get('lastHeard') or data.get('rxTime'),
-        'deviceMetrics': data.get('deviceMetrics', {}),
-        'hopsAway': data.get('hopsAway') or data.get('hopStart'),
-        'telemetry': data.get('telemetry', {}),
-        'viaMqtt': data.get('viaMqtt'),
-        'lastUpdated': int(time.time())  
-    }
-    
-    found_nodes[node_id] = merge_dicts(found_nodes[node_id], node_info)
-    
-    found_nodes[node_id] = {k: v for k, v in found_nodes[node_id].items() if v is not None}
-    for key in ['user', 'position', 'deviceMetrics', 'telemetry']:
-        if key in found_nodes[node_id]:
-            found_nodes[node_id][key] = {k: v for k, v in found_nodes[node_id][key].items() if v is not None}
-    
-    logging.info(f"Node updated: {found_nodes[node_id]}")
-    socketio.emit('node_updated', found_nodes[node_id])
-
-def merge_dicts(dict1, dict2):
-    result = dict1.copy()
-    for key, value in dict2.items():
-        if isinstance(value, dict):
-            result[key] = merge_dicts(result.get(key, {}), value)
-        elif value is not None:
-            result[key] = value
-    return result
-
-def handle_decoded_packet(decoded_data, packet, interface):
-    try:
-        portnum = decoded_data.get("portnum")
-
-        if portnum == portnums_pb2.PortNum.TEXT_MESSAGE_APP:
-            handle_text_message(decoded_data, packet)
-        elif portnum == portnums_pb2.PortNum.NODEINFO_APP:
-            handle_nodeinfo_message(decoded_data, packet)
-        elif portnum == portnums_pb2.PortNum.TELEMETRY_APP:
-            handle_telemetry_message(decoded_data, packet)
-        else:
-            logging.warning(f"Unhandled portnum: {portnum}")
-    except Exception as e:
-        logging.error(f"Error in handle_decoded_packet: {e}")
-        logging.exception("Stack trace:")
-
-def handle_text_message(decoded_data, packet):
-    try:
-        logging.info(f"Raw text message packet: {packet}")
-
-        sender_id = packet.get('fromId', 'Unknown')
-        sender_node = found_nodes.get(sender_id, {})
-        sender_name = sender_node.get('user', {}).get('longName') or sender_node.get('user', {}).get('shortName') or sender_id
-
-        message = {
-            'sender': sender_name,
-            'text': decoded_data.get('text', ''),
-            'channel': packet.get('channel', 0),  
-            'timestamp': packet.get('rxTime', int(time.time()))
-        }
-
-        display_message = f"{sender_name}\n{message['text']}\n{datetime.fromtimestamp(message['timestamp']).strftime('%Y-%m-%d %H:%M:%S')}"
-
-        received_messages.append(message)
-        logging.info(f"New text message received: {display_message}")
-        socketio.emit('new_message', {'raw_message': message, 'formatted_message': display_message})
-    except Exception as e:
-        logging.error(f"Error in handle_text_message: {e}")
-        logging.exception("Stack trace:")
-
-def handle_position_message(decoded_data, packet):
-    try:
-        position = decoded_data.get('position', {})
-        position_data = {
-            'sender': packet.get('fromId', 'Unknown'),
-            'latitude': position.get('latitude'),
-            'longitude': position.get('longitude'),
-            'latitudeI': position.get('latitudeI'),
-            'longitudeI': position.get('longitudeI'),
-            'altitude': position.get('altitude'),
-            'time': position.get('time'),
-            'timestamp': packet.get('rxTime', 0),
-            'PDOP': position.get('PDOP'),
-            'groundSpeed': position.get('groundSpeed'),
-            'groundTrack': position.get('groundTrack'),
-            'satsInView': position.get('satsInView'),
-            'precisionBits': position.get('precisionBits')
-        }
-        logging.info(f"Position update: {position_data}")
-        socketio.emit('position_update', position_data)
-        
-        node_info = {
-            'position': position_data,
-            'lastHeard': packet.get('rxTime'),
-            'snr': packet.get('rxSnr'),
-            'hopsAway': packet.get('hopStart')
-        }
-        update_node(packet.get('fromId') or packet.get('from'), node_info)
-    except Exception as e:
-        logging.error(f"Error in handle_position_message: {e}")
-        logging.exception("Stack trace:")
-
-def handle_telemetry_message(decoded_data, packet):
-    try:
-        telemetry = decoded_data.get('telemetry', {})
-        telemetry_data = {
-            'time': telemetry.get('time'),
-            'deviceMetrics': telemetry.get('deviceMetrics', {})
-        }
-        
-        telemetry_data['deviceMetrics'] = {k: v for k, v in telemetry_data['deviceMetrics'].items() if v is not None}
-        
-        node_info = {
-            'telemetry': telemetry_data,
-            'lastHeard': packet.get('rxTime'),
-            'snr': packet.get('rxSnr'),
-            'hopsAway': packet.get('hopStart')
-        }
-        update_node(packet.get('fromId') or packet.get('from'), node_info)
-    except Exception as e:
-        logging.error(f"Error in handle_telemetry_message: {e}")
-        logging.exception("Stack trace:")
-
-def handle_nodeinfo_message(decoded_data, packet):
-    try:
-        user_data = decoded_data.get('user', {})
-        node_info = {
-            'num': packet.get('fromId') or packet.get('from') or user_data.get('id'),
-            'user': {
-                'id': user_data.get('id'),
-                'longName': user_data.get('longName'),
-                'shortName': user_data.get('shortName'),
-                'macaddr': user_data.get('macaddr'),
-                'hwModel': user_data.get('hwModel'),
-                'isLicensed': user_data.get('isLicensed'),
-                'role': user_data.get('role')
-            },
-            'position': {
-                'latitude': user_data.get('latitude'),
-                'longitude': user_data.get('longitude'),
-                'latitudeI': user_data.get('latitudeI'),
-                'longitudeI': user_data.get('longitudeI'),
-                'altitude': user_data.get('altitude'),
-                'time': user_data.get('time')
-            },
-            'snr': packet.get('rxSnr'),
-            'lastHeard': packet.get('rxTime'),
-            'hopsAway': packet.get('hopStart'),
-            'deviceMetrics': {
-                'batteryLevel': user_data.get('batteryLevel'),
-                'voltage': user_data.get('voltage'),
-                'channelUtilization': user_data.get('channelUtilization'),
-                'airUtilTx': user_data.get('airUtilTx'),
-                'snr': user_data.get('snr')
-            }
-        }
-
-        if 'position' in decoded_data:
-            position = decoded_data['position']
-            node_info['position'].update({
-                'PDOP': position.get('PDOP'),
-                'groundSpeed': position.get('groundSpeed'),
-                'groundTrack': position.get('groundTrack'),
-                'satsInView': position.get('satsInView'),
-                'precisionBits': position.get('precisionBits')
-            })
-
-        node_info = {k: v for k, v in node_info.items() if v is not None}
-        node_info['user'] = {k: v for k, v in node_info['user'].items() if v is not None}
-        node_info['position'] = {k: v for k, v in node_info['position'].items() if v is not None}
-        node_info['deviceMetrics'] = {k: v for k, v in node_info['deviceMetrics'].items() if v is not None}
-
-        update_node(node_info['num'], node_info)
-        
-        logging.info(f"Node info received for {user_data.get('id')}: {node_info}")
-    except Exception as e:
-        logging.error(f"Error in handle_nodeinfo_message: {e}")
-        logging.exception("Stack trace:")
-
-@app.route('/')
-def index():
-    try:
-        ports = list_serial_ports()
-        return render_template('index.html', 
-                               ports=ports, 
-                               initialChannels=available_channels, 
-                               initialNodes=found_nodes,
-                               initialMessages=messages)
-    except Exception as e:
-        logging.error(f"Error in index route: {e}")
-        logging.exception("Stack trace:")
-        return render_template('error.html', error_message="An error occurred while loading the page"), 500
-
-@app.route('/settings')
-def settings():
-    return render_template('settings.html')
-
-@socketio.on('save_settings')
-def handle_save_settings(data):
-    try:
-        device_name = data.get('deviceName')
-        power_level = data.get('powerLevel')
-        region = data.get('region')
-        enable_encryption = data.get('enableEncryption')
-        enable_telemetry = data.get('enableTelemetry')
-
-        # Example settings update, replace with actual Meshtastic API calls
-        interface = app.config.get('serial_interface')
-        if interface:
-            interface.localNode.setOwner(device_name)
-            interface.localNode.setChannelParams(power=power_level, region=region)
-            interface.localNode.setEncryption(enable_encryption)
-            interface.localNode.setTelemetry(enable_telemetry)
-            interface.localNode.reboot()
-            
-            emit('save_success')
-        else:
-            emit('save_error', 'No serial interface connected')
-    except Exception as e:
-        logging.error(f"Error saving settings: {e}")
-        logging.exception("Stack trace:")
-        emit('save_error', str(e))
-
-@socketio.on_error()
-def error_handler(e):
-    logging.error(f"SocketIO error: {e}")
-    safe_emit('error', {'message': 'An unexpected error occurred'})
-
-@socketio.on('connect')
-def handle_connect():
-    logging.info("WebSocket client connected")
-    try:
-        if os.path.exists(WEBHOOK_FILE):
-            with open(WEBHOOK_FILE, 'r') as f:
-                data = json.load(f)
-                url = data.get('url', '')
-                if url:
-                    socketio.emit('prompt_webhook', {'url': url})
-    except Exception as e:
-        logging.error(f"Error checking webhook file on connect: {e}")
-
-@socketio.on('connect_serial')
-def handle_connect_serial(data):
-    try:
-        port = data.get('port')
-        interface = connect_serial(port)
-        if interface:
-            app.config['serial_interface'] = interface
-            on_connection(interface)
-        else:
-            socketio.emit('serial_error', {'message': 'Failed to connect'})
-    except Exception as e:
-        logging.error(f"Error in connect_serial: {e}")
-        logging.exception("Stack trace:")
-        socketio.emit('serial_error', {'message': str(e)})
-
-@socketio.on('disconnect_serial')
-def handle_disconnect_serial():
-    try:
-        interface = app.config.get('serial_interface')
-        if interface:
-            interface.close()
-            app.config['serial_interface'] = None
-            logging.info("Disconnected from Meshtastic device")
-            socketio.emit('serial_disconnected')
-        else:
-            socketio.emit('serial_error', {'message': 'Not connected'})
-    except Exception as e:
-        logging.error(f"Error in disconnect_serial: {e}")
-        logging.exception("Stack trace:")
-        socketio.emit('serial_error', {'message': str(e)})
-
-@socketio.on('get_messages')
-def handle_get_messages():
-    try:
-        socketio.emit('all_messages', {'messages': app.config['received_messages']})
-    except Exception as e:
-        logging.error(f"Error in get_messages: {e}")
-        logging.exception("Stack trace:")
-
-@socketio.on('send_message')
-def handle_send_message(data):
-    try:
-        message = data.get('message')
-        channel_index = data.get('channel', 0)
-        interface = app.config.get('serial_interface')
-        if interface:
-            logging.info(f"Attempting to send message: '{message}' on channel {channel_index}")
-            mesh_packet = interface.sendText(message, channelIndex=channel_index, wantAck=True)
-            packet_id = mesh_packet.id
-            logging.info(f"Sent message: '{message}' on channel {channel_index} with packet ID: {packet_id}")
-
-            complete_message_data = {
-                'packetId': packet_id,
-                'message': message,
-                'channel': channel_index,
-                'timestamp': int(time.time())
-            }
-
-            if channel_index not in app.config['messages']:
-                app.config['messages'][channel_index] = []
-            app.config['messages'][channel_index].append(complete_message_data)
-
-            try:
-                with open(WEBHOOK_FILE, 'r') as f:
-                    webhook_data = json.load(f)
-                    webhook_url = webhook_data.get('url')
-
-                if webhook_url:
-                    my_node_info = interface.getMyNodeInfo()
-                    device_info = my_node_info.get('user', {}).get('hwModel', 'Unknown Device')
-                    battery_level = my_node_info.get('deviceMetrics', {}).get('batteryLevel')
-                    if (battery_level is not None):
-                        device_info += f" (🔋 {battery_level}%)"
-
-                    embed = {
-                        "title": "📡 New Meshtastic Message",
-                        "description": message,
-                        "color": 3447003,
-                        "fields": [
-                            {"name": "👤 From", "value": my_node_info.get('user', {}).get('longName', 'You')},
-                            {"name": "🔧 Device", "value": device_info}
-                        ],
-                        "footer": {"text": "Meshtastic"},
-                        "timestamp": datetime.utcnow().isoformat()
-                    }
-
-                    position = my_node_info.get('position', {})
-                    if position.get('latitude') is not None and position.get('longitude') is not None:
-                        embed["fields"].append({
-                            "name": "📍 Location",
-                            "value": f"[View on Map](https://www.google.com/maps?q={position['latitude']},{position['longitude']})"
-                        })
-
-                    webhook_payload = {"embeds": [embed]}
-                    response = requests.post(webhook_url, json=webhook_payload)
-                    response.raise_for_status()
-                    logging.info("Message sent to Discord webhook successfully")
-                else:
-                    logging.info("No Discord webhook URL set")
-            except Exception as e:
-                logging.error(f"Error sending to Discord webhook: {e}")
-
-            socketio.emit('message_sent', {
-                'status': 'success',
-                'packetId': packet_id,
-                'message': message,
-                'channel': channel_index,
-                'timestamp': int(time.time())
-            })
-
-            socketio.start_background_task(wait_for_ack, interface, packet_id)
-        else:
-            logging.error("Serial interface not connected")
-            socketio.emit('serial_error', {'message': 'Not connected'})
-    except Exception as e:
-        logging.error(f"Error in send_message: {str(e)}")
-        logging.exception("Stack trace:")
-        socketio.emit('serial_error', {'message': str(e)})
-
-@socketio.on('load_webhook_url')
-def handle_load_webhook_url():
-    try:
-        if os.path.exists(WEBHOOK_FILE):
-            with open(WEBHOOK_FILE, 'r') as f:
-                data = json.load(f)
-                url = data.get('url', '')
-                logging.info(f"Loaded Discord webhook URL: {'Set' if url else 'Not set'}")
-                socketio.emit('webhook_url_loaded', {'url': url})
-        else:
-            logging.info("Discord webhook file does not exist")
-            socketio.emit('webhook_url_loaded', {'url': ''})
-    except Exception as e:
-        logging.error(f"Error loading webhook URL: {e}")
-        socketio.emit('webhook_url_loaded', {'url': ''})
-
-@socketio.on('save_webhook_url')
-def handle_save_webhook_url(data):
-    try:
-        url = data.get('url', '')
-        with open(WEBHOOK_FILE, 'w') as f:
-            json.dump({'url': url}, f)
-        logging.info(f"Saved Discord webhook URL: {'Set' if url else 'Not set'}")
-        socketio.emit('webhook_url_saved', {'url': url})
-    except Exception as e:
-        logging.error(f"Error saving webhook URL: {e}")
-
-@socketio.on('delete_webhook_url')
-def handle_delete_webhook_url():
-    try:
-        if os.path.exists(WEBHOOK_FILE):
-            os.remove(WEBHOOK_FILE)
-            logging.info("Deleted Discord webhook URL")
-        else:
-            logging.info("No Discord webhook URL to delete")
-        socketio.emit('webhook_url_deleted')
-    except Exception as e:
-        logging.error(f"Error deleting webhook URL: {e}")
-
-@socketio.on('save_settings')
-def handle_save_settings(data):
-    try:
-        global device_settings
-        device_settings.update(data)  # Update the stored settings with the received data
-        # Save settings back to the device
-        interface = app.config.get('serial_interface')
-        if interface:
-            # Assuming we have a function `update_device_settings` to apply settings to the device
-            update_device_settings(interface, device_settings)
-            safe_emit('save_success')
-        else:
-            raise Exception("No active serial connection")
-    except Exception as e:
-        logging.error(f"Error saving settings: {e}")
-        safe_emit('save_error', {'message': str(e)})
-
-@socketio.on('get_settings')
-def handle_get_settings():
-    try:
-        global device_settings
-        safe_emit('settings_data', device_settings)
-    except Exception as e:
-        logging.error(f"Error getting settings: {e}")
-        safe_emit('save_error', {'message': str(e)})
-
-def update_device_settings(interface, settings):
-    try:
-        for key, value in settings.items():
-            if key == 'deviceName':
-                interface.localNode.setOwner(value)
-            elif key == 'serialEnabled':
-                interface.localNode.radioConfig.preferences.serialEnabled = bool(value)
-            elif key == 'nodeInfoBroadcastSecs':
-                interface.localNode.radioConfig.preferences.nodeInfoBroadcastSecs = int(value)
-            elif key == 'positionBroadcastSecs':
-                interface.localNode.radioConfig.preferences.positionBroadcastSecs = int(value)
-            elif key == 'fixedPosition':
-                interface.localNode.radioConfig.preferences.fixedPosition = bool(value)
-            elif key == 'gpsUpdateInterval':
-                interface.localNode.radioConfig.preferences.gpsUpdateInterval = int(value)
-            elif key == 'positionFlags':
-                interface.localNode.radioConfig.preferences.positionFlags = int(value)
-            elif key == 'broadcastSmartMinimumDistance':
-                interface.localNode.radioConfig.preferences.broadcastSmartMinimumDistance = int(value)
-            elif key == 'broadcastSmartMinimumIntervalSecs':
-                interface.localNode.radioConfig.preferences.broadcastSmartMinimumIntervalSecs = int(value)
-            elif key == 'gpsMode':
-                interface.localNode.radioConfig.preferences.gpsMode = value
-            elif key == 'waitBluetoothSecs':
-                interface.localNode.radioConfig.preferences.waitBluetoothSecs = int(value)
-            elif key == 'sdsSecs':
-                interface.localNode.radioConfig.preferences.sdsSecs = int(value)
-            elif key == 'lsSecs':
-                interface.localNode.radioConfig.preferences.lsSecs = int(value)
-            elif key == 'minWakeSecs':
-                interface.localNode.radioConfig.preferences.minWakeSecs = int(value)
-            elif key == 'ntpServer':
-                interface.localNode.radioConfig.preferences.ntpServer = value
-            elif key == 'ethEnabled':
-                interface.localNode.radioConfig.preferences.ethEnabled = bool(value)
-            elif key == 'screenOnSecs':
-                interface.localNode.radioConfig.preferences.screenOnSecs = int(value)
-            elif key == 'usePreset':
-                interface.localNode.radioConfig.lora.usePreset = bool(value)
-            elif key == 'region':
-                interface.localNode.radioConfig.lora.region = value
-            elif key == 'hopLimit':
-                interface.localNode.radioConfig.lora.hopLimit = int(value)
-            elif key == 'txEnabled':
-                interface.localNode.radioConfig.lora.txEnabled = bool(value)
-            elif key == 'txPower':
-                interface.localNode.radioConfig.lora.txPower = int(value)
-            elif key == 'sx126xRxBoostedGain':
-                interface.localNode.radioConfig.lora.sx126xRxBoostedGain = bool(value)
-            elif key == 'bluetoothEnabled':
-                interface.localNode.radioConfig.bluetooth.enabled = bool(value)
-            elif key == 'fixedPin':
-                interface.localNode.radioConfig.bluetooth.fixedPin = int(value)
-            elif key == 'mqttEnabled':
-                interface.localNode.moduleConfig.mqtt.enabled = bool(value)
-            elif key == 'mqttAddress':
-                interface.localNode.moduleConfig.mqtt.address = value
-            elif key == 'mqttUsername':
-                interface.localNode.moduleConfig.mqtt.username = value
-            elif key == 'mqttPassword':
-                interface.localNode.moduleConfig.mqtt.password = value
-            elif key == 'mqttEncryptionEnabled':
-                interface.localNode.moduleConfig.mqtt.encryptionEnabled = bool(value)
-            elif key == 'mqttRoot':
-                interface.localNode.moduleConfig.mqtt.root = value
-            elif key == 'mqttProxyToClientEnabled':
-                interface.localNode.moduleConfig.mqtt.proxyToClientEnabled = bool(value)
-            elif key == 'mqttMapReportingEnabled':
-                interface.localNode.moduleConfig.mqtt.mapReportingEnabled = bool(value)
-            elif key == 'mqttPositionPrecision':
-                interface.localNode.moduleConfig.mqtt.mapReportSettings.positionPrecision = int(value)
-            elif key == 'telemetryDeviceUpdateInterval':
-                interface.localNode.moduleConfig.telemetry.deviceUpdateInterval = int(value)
-            elif key == 'telemetryEnvironmentUpdateInterval':
-                interface.localNode.moduleConfig.telemetry.environmentUpdateInterval = int(value)
-            elif key == 'telemetryAirQualityInterval':
-                interface.localNode.moduleConfig.telemetry.airQualityInterval = int(value)
-            elif key == 'neighborInfoEnabled':
-                interface.localNode.moduleConfig.neighborInfo.enabled = bool(value)
-            elif key == 'neighborInfoUpdateInterval':
-                interface.localNode.moduleConfig.neighborInfo.updateInterval = int(value)
-            elif key == 'ambientLightingCurrent':
-                interface.localNode.moduleConfig.ambientLighting.current = int(value)
-            elif key == 'ambientLightingRed':
-                interface.localNode.moduleConfig.ambientLighting.red = int(value)
-            elif key == 'ambientLightingGreen':
-                interface.localNode.moduleConfig.ambientLighting.green = int(value)
-            elif key == 'ambientLightingBlue':
-                interface.localNode.moduleConfig.ambientLighting.blue = int(value)
-            elif key == 'detectionSensorMinimumBroadcastSecs':
-                interface.localNode.moduleConfig.detectionSensor.minimumBroadcastSecs = int(value)
-            elif key == 'detectionSensorDetectionTriggeredHigh':
-                interface.localNode.moduleConfig.detectionSensor.detectionTriggeredHigh = bool(value)
-            elif key == 'latitude':
-                interface.localNode.setPosition(latitude=float(value), longitude=interface.localNode.getPosition().longitude, altitude=interface.localNode.getPosition().altitude)
-            elif key == 'longitude':
-                interface.localNode.setPosition(latitude=interface.localNode.getPosition().latitude, longitude=float(value), altitude=interface.localNode.getPosition().altitude)
-            elif key == 'altitude':
-                interface.localNode.setPosition(latitude=interface.localNode.getPosition().latitude, longitude=interface.localNode.getPosition().longitude, altitude=int(value))
-            else:
-                logging.warning(f"Unknown setting: {key}")
-
-        interface.localNode.writeConfig()
-        interface.localNode.reboot()
-
-        logging.info("Device settings updated successfully")
-    except Exception as e:
-        logging.error(f"Error updating device settings: {e}")
-        raise
-
-ack_events = {}
-
-def wait_for_ack(interface, packet_id):
-    ack_event = Event()
-    ack_events[packet_id] = ack_event
-    try:
-        if ack_event.wait(timeout=60):
-            logging.info(f"ACK received for packet ID: {packet_id}")
-            socketio.emit('message_ack', {'packetId': packet_id, 'status': 'success'})
-        else:
-            logging.warning(f"ACK timeout for packet ID {packet_id}")
-            socketio.emit('message_ack_timeout', {'packetId': packet_id, 'status': 'timeout'})
-    except Exception as e:
-        logging.error(f"Error waiting for ACK for packet ID {packet_id}: {str(e)}")
-    finally:
-        del ack_events[packet_id]
-
-def handle_ack_message(decoded_data, packet):
-    try:
-        ack_packet_id = decoded_data.get('requestId')
-        if ack_packet_id:
-            logging.info(f"ACK received for packet ID: {ack_packet_id}")
-            socketio.emit('message_ack', {'packetId': ack_packet_id, 'status': 'success'})
-            
-            for channel, channel_messages in app.config['messages'].items():
-                for message in channel_messages:
-                    if message.get('packetId') == ack_packet_id:
-                        message['status'] = 'acked'
-                        break
-            
-            if ack_packet_id in ack_events:
-                ack_events[ack_packet_id].set()
-            
-            socketio.emit('update_message_status', {'packetId': ack_packet_id, 'status': 'acked'})
-        else:
-            logging.warning(f"Received ACK message without requestId: {decoded_data}")
-    except Exception as e:
-        logging.error(f"Error in handle_ack_message: {e}")
-        logging.exception("Stack trace:")
-
 if __name__ == '__main__':
-    socketio.run(app, port=5678)
\ No newline at end of file
+    if message_broker is not None:
+        message_broker.start()
+    if bus_manager is not None:
+        # Listen to the bus from the start, not from the first client connection.
+        socketio.server.manager_initialized = True
+        bus_manager.initialize()
+    socketio.run(app, port=SERVER_PORT)
@@ -0,0 +1,110 @@
+import logging
+import threading
+import zlib
+
+from meshtastic import mesh_pb2
+
+from send_queue import lora_airtime, MESH_OVERHEAD_BYTES
+
+# Compressed text travels on PRIVATE_APP, prefixed with this marker (magic
+# byte + format version) so other private payloads are left alone.
+MARKER = b'\xc7\x01'
+
+# Preset deflate dictionary shared by every instance of this interface. The
+# most common substrings go last, where deflate finds them cheapest.
+SHARED_DICTIONARY = (
+    b'battery voltage temperature humidity pressure solar panel antenna repeater router '
+    b'gateway firmware update channel frequency preset long fast medium slow short '
+    b'signal snr rssi hops distance miles kilometers meters north south east west '
+    b'weather rain wind snow storm power outage emergency help needed safe home '
+    b'tomorrow tonight today morning afternoon evening minutes hours later soon '
+    b'location position map coordinates trail camp summit road highway '
+    b'anyone there copy loud and clear roger that over out check test testing '
+    b'message received thanks thank you please sorry okay ok yes no good great '
+    b'what where when how why who is are the and you for that this with have '
+    b'will can not your from just it in on at to of a I '
+)
+
+_COMPRESS_LEVEL = 9
+
+# A compressed message came in one LoRa payload; anything inflating far past
+# that is not a chat message from this interface and is not expanded.
+MAX_TEXT_BYTES = 4 * mesh_pb2.Constants.DATA_PAYLOAD_LEN
+
+
+def compress_text(text):
+    # Returns the marked, compressed payload, or None when it would not be
+    # smaller than the plain UTF-8 text.
+    raw = text.encode('utf-8')
+    compressor = zlib.compressobj(_COMPRESS_LEVEL, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, SHARED_DICTIONARY)
+    packed = MARKER + compressor.compress(raw) + compressor.flush()
+    return packed if len(packed) < len(raw) else None
+
+
+def is_compressed(payload):
+    return isinstance(payload, (bytes, bytearray)) and payload[:len(MARKER)] == MARKER
+
+
+def decompress_text(payload):
+    # Returns None when the payload inflates past MAX_TEXT_BYTES.
+    decompressor = zlib.decompressobj(-15, zdict=SHARED_DICTIONARY)
+    raw = decompressor.decompress(bytes(payload[len(MARKER):]), MAX_TEXT_BYTES + 1)
+    if decompressor.unconsumed_tail or len(raw) > MAX_TEXT_BYTES:
+        return None
+    raw += decompressor.flush()
+    if len(raw) > MAX_TEXT_BYTES:
+        return None
+    return raw.decode('utf-8')
+
+
+class CompressionStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._compressed = 0
+        self._skipped = 0
+        self._raw_bytes = 0
+        self._packed_bytes = 0
+        self._airtime_saved = 0.0
+        self._decompressed = 0
+        self._errors = 0
+
+    def compress(self, text):
+        packed = compress_text(text)
+        raw = len(text.encode('utf-8'))
+        with self._lock:
+            if packed is None:
+                self._skipped += 1
+                return None
+            self._compressed += 1
+            self._raw_bytes += raw
+            self._packed_bytes += len(packed)
+            self._airtime_saved += (lora_airtime(raw + MESH_OVERHEAD_BYTES)
+                                    - lora_airtime(len(packed) + MESH_OVERHEAD_BYTES))
+        return packed
+
+    def decompress(self, payload):
+        try:
+            text = decompress_text(payload)
+        except (zlib.error, UnicodeDecodeError) as e:
+            logging.warning(f"Could not decompress text payload: {e}")
+            text = None
+        if text is None:
+            with self._lock:
+                self._errors += 1
+            return None
+        with self._lock:
+            self._decompressed += 1
+        return text
+
+    def stats(self):
+        with self._lock:
+            return {
+                'compressed': self._compressed,
+                'skippedNoGain': self._skipped,
+                'rawBytes': self._raw_bytes,
+                'compressedBytes': self._packed_bytes,
+                'ratio': round(self._packed_bytes / self._raw_bytes, 3) if self._raw_bytes else None,
+                'airtimeSavedSeconds': round(self._airtime_saved, 3),
+                'decompressed': self._decompressed,
+                'errors': self._errors
+            }
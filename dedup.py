@@ -0,0 +1,65 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class DuplicateFilter:
+    # LRU of recently seen keys. A hit refreshes both recency and age, so the
+    # OrderedDict stays sorted by last-seen time and expiry only ever has to
+    # look at the front.
+    def __init__(self, max_entries=4096, ttl=600, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._checks = 0
+        self._hits = 0
+        self._evicted = 0
+        self._expired = 0
+
+    def seen(self, key):
+        now = self.clock()
+        with self._lock:
+            self._checks += 1
+            self._expire(now)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._entries[key] = now
+                self._hits += 1
+                return True
+            self._entries[key] = now
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evicted += 1
+            return False
+
+    def _expire(self, now):
+        cutoff = now - self.ttl
+        entries = self._entries
+        while entries:
+            key, stamp = next(iter(entries.items()))
+            if stamp > cutoff:
+                break
+            del entries[key]
+            self._expired += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'capacity': self.max_entries,
+                'ttlSeconds': self.ttl,
+                'checks': self._checks,
+                'hits': self._hits,
+                'hitRate': round(self._hits / self._checks, 4) if self._checks else 0.0,
+                'evicted': self._evicted,
+                'expired': self._expired
+            }
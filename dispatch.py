@@ -0,0 +1,144 @@
+import logging
+import threading
+import time
+
+from meshtastic import portnums_pb2
+
+from node_store import node_num
+
+
+def normalize_portnum(portnum):
+    if isinstance(portnum, int):
+        try:
+            return portnums_pb2.PortNum.Name(portnum)
+        except ValueError:
+            return str(portnum)
+    return portnum
+
+
+class PacketView:
+    # Flat, normalized view of a received packet. Built once per packet in
+    # on_receive and handed to every handler so nobody re-walks the raw dict.
+    __slots__ = (
+        'packet', 'decoded', 'portnum', 'sender', 'node_num', 'from_num', 'from_id',
+        'to_id', 'channel', 'packet_id', 'rx_time', 'rx_snr', 'rx_rssi',
+        'hop_start', 'via_mqtt', 'encrypted'
+    )
+
+    def __init__(self, packet):
+        decoded = packet.get('decoded')
+        self.packet = packet
+        self.decoded = decoded if decoded is not None else {}
+        self.portnum = normalize_portnum(decoded.get('portnum')) if decoded is not None else None
+        self.from_num = packet.get('from')
+        self.from_id = packet.get('fromId')
+        self.sender = self.from_id or self.from_num
+        self.node_num = node_num(self.from_num)
+        if self.node_num is None:
+            self.node_num = node_num(self.from_id)
+        self.to_id = packet.get('toId') or packet.get('to')
+        self.channel = packet.get('channel', 0)
+        self.packet_id = packet.get('id')
+        self.rx_time = packet.get('rxTime')
+        self.rx_snr = packet.get('rxSnr')
+        self.rx_rssi = packet.get('rxRssi')
+        self.hop_start = packet.get('hopStart')
+        self.via_mqtt = packet.get('viaMqtt')
+        self.encrypted = 'encrypted' in packet
+
+    @property
+    def is_decoded(self):
+        return self.portnum is not None
+
+
+class DispatchStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._total = {}
+        self._max = {}
+        self._errors = {}
+
+    def record(self, portnum, elapsed, failed=False):
+        with self._lock:
+            self._counts[portnum] = self._counts.get(portnum, 0) + 1
+            if failed:
+                self._errors[portnum] = self._errors.get(portnum, 0) + 1
+            self._total[portnum] = self._total.get(portnum, 0.0) + elapsed
+            if elapsed > self._max.get(portnum, 0.0):
+                self._max[portnum] = elapsed
+
+    def snapshot(self):
+        with self._lock:
+            stats = {}
+            for portnum, count in self._counts.items():
+                total = self._total[portnum]
+                stats[portnum] = {
+                    'count': count,
+                    'totalMs': round(total * 1000, 3),
+                    'avgMs': round(total * 1000 / count, 3),
+                    'maxMs': round(self._max[portnum] * 1000, 3),
+                    'errors': self._errors.get(portnum, 0)
+                }
+            return stats
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+            self._total.clear()
+            self._max.clear()
+            self._errors.clear()
+
+
+class PacketHandlerRegistry:
+    UNHANDLED = 'UNHANDLED'
+
+    def __init__(self):
+        self._handlers = {}
+        self._fallback = None
+        self.stats = DispatchStats()
+
+    def on(self, portnum):
+        def decorator(handler):
+            self.register(portnum, handler)
+            return handler
+        return decorator
+
+    def register(self, portnum, handler):
+        portnum = normalize_portnum(portnum)
+        if portnum in self._handlers:
+            logging.warning(f"Replacing packet handler for {portnum}")
+        self._handlers[portnum] = handler
+
+    def unregister(self, portnum):
+        return self._handlers.pop(normalize_portnum(portnum), None)
+
+    def set_fallback(self, handler):
+        self._fallback = handler
+
+    def handler_for(self, portnum):
+        return self._handlers.get(normalize_portnum(portnum))
+
+    def portnums(self):
+        return sorted(self._handlers)
+
+    def dispatch(self, view):
+        handler = self._handlers.get(view.portnum)
+        key = view.portnum
+        if handler is None:
+            handler = self._fallback
+            key = self.UNHANDLED
+            if handler is None:
+                return False
+        # A failing handler is logged and counted; the rest of the packet's
+        # processing goes on.
+        start = time.perf_counter()
+        failed = False
+        try:
+            handler(view)
+        except Exception as e:
+            failed = True
+            logging.error(f"Error in {view.portnum} handler: {e}")
+            logging.exception("Stack trace:")
+        self.stats.record(key, time.perf_counter() - start, failed)
+        return True
@@ -0,0 +1,152 @@
+import logging
+import threading
+import time
+
+
+def latest(old, new):
+    return new
+
+
+class EmitBatcher:
+    # Buffers outgoing Socket.IO events per target (None = broadcast, or a
+    # room/sid) and flushes them once per window. merge_rules maps event ->
+    # (key(data), combine(old, new)); events with the same key inside one
+    # window are combined in place, combine may return None to keep both. A
+    # window of 0 disables batching.
+    #
+    # With recipients(target) -> sids, each client gets one 'batch' frame per
+    # window holding the events of every target it is in, in emit order;
+    # clients in the same set of targets share one frame, sent to the list
+    # of their sids. Without it (the clients live in another process) each
+    # target gets its own frame.
+    def __init__(self, emit, window=0.1, merge_rules=None, clock=time.monotonic, recipients=None):
+        self.emit_frame = emit
+        self.window = window
+        self.merge_rules = merge_rules or {}
+        self.clock = clock
+        self.recipients = recipients
+        self._buffers = {}
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._events_in = 0
+        self._events_out = 0
+        self._merged = 0
+        self._batches = 0
+        self._max_batch = 0
+        self._latency_total = 0.0
+        self._max_latency = 0.0
+        self._errors = 0
+
+    def emit(self, event, data=None, to=None):
+        if not self.window:
+            self._send(event, data, to)
+            return
+        rule = self.merge_rules.get(event)
+        key = rule[0](data) if rule is not None else None
+        with self._lock:
+            self._events_in += 1
+            buffer = self._buffers.get(to)
+            if buffer is None:
+                buffer = self._buffers[to] = [self.clock(), [], {}, []]
+            if key is not None:
+                slot = buffer[2].get((event, key))
+                if slot is not None:
+                    combined = rule[1](slot[1], data)
+                    if combined is not None:
+                        slot[1] = combined
+                        self._merged += 1
+                        return
+            slot = [event, data]
+            buffer[1].append(slot)
+            buffer[3].append(self._seq)
+            self._seq += 1
+            if key is not None:
+                buffer[2][(event, key)] = slot
+
+    def _send(self, event, data, to):
+        try:
+            self.emit_frame(event, data, to)
+        except Exception as e:
+            self._errors += 1
+            logging.error(f"Error emitting {event}: {e}")
+
+    def flush(self):
+        with self._lock:
+            buffers, self._buffers = self._buffers, {}
+        if not buffers:
+            return 0
+        if self.recipients is None:
+            frames = [(to, [to]) for to in buffers]
+        else:
+            frames = self._group(buffers)
+        now = self.clock()
+        for to, targets in frames:
+            if len(targets) == 1:
+                first, slots = buffers[targets[0]][:2]
+            else:
+                first = min(buffers[target][0] for target in targets)
+                ordered = sorted((seq, slot) for target in targets
+                                 for seq, slot in zip(buffers[target][3], buffers[target][1]))
+                slots = [slot for _, slot in ordered]
+            self._send('batch', {'events': slots}, to)
+            latency = now - first
+            with self._lock:
+                self._batches += 1
+                self._events_out += len(slots)
+                self._max_batch = max(self._max_batch, len(slots))
+                self._latency_total += latency
+                self._max_latency = max(self._max_latency, latency)
+        return len(frames)
+
+    def _group(self, buffers):
+        # sid -> the buffered targets it is in, then one frame per distinct
+        # set of targets. Targets are visited in first-emit order so equal
+        # sets come out as equal tuples.
+        membership = {}
+        for to in sorted(buffers, key=lambda target: buffers[target][3][0]):
+            for sid in self.recipients(to):
+                membership.setdefault(sid, []).append(to)
+        groups = {}
+        for sid, targets in membership.items():
+            groups.setdefault(tuple(targets), []).append(sid)
+        return [(sids, list(targets)) for targets, sids in groups.items()]
+
+    def start(self):
+        if not self.window or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='emit-batcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(self.window * 4)
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.window):
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Error flushing batched events: {e}")
+                logging.exception("Stack trace:")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'windowMs': int(self.window * 1000),
+                'pendingTargets': len(self._buffers),
+                'eventsIn': self._events_in,
+                'eventsOut': self._events_out,
+                'merged': self._merged,
+                'batches': self._batches,
+                'avgBatchSize': round(self._events_out / self._batches, 2) if self._batches else 0.0,
+                'maxBatchSize': self._max_batch,
+                'avgFlushLatencyMs': round(self._latency_total * 1000 / self._batches, 1) if self._batches else 0.0,
+                'maxFlushLatencyMs': round(self._max_latency * 1000, 1),
+                'errors': self._errors
+            }
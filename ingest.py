@@ -0,0 +1,178 @@
+import logging
+import threading
+from collections import deque
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+PRIORITY_NAMES = ('high', 'normal', 'low')
+
+
+def default_classify(item):
+    return PRIORITY_NORMAL, None
+
+
+class IngestQueue:
+    DROP_NEWEST = 'drop_newest'
+    DROP_OLDEST = 'drop_oldest'
+    BLOCK = 'block'
+    POLICIES = (DROP_NEWEST, DROP_OLDEST, BLOCK)
+
+    # classify(item) -> (priority, coalesce_key). Items with a coalesce key
+    # replace an already queued item with the same key once the queue is
+    # past shed_threshold, so only the latest state per key is processed.
+    def __init__(self, maxsize=1000, overflow=DROP_OLDEST, block_timeout=0.5,
+                 classify=default_classify, shed_threshold=None):
+        if overflow not in self.POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.classify = classify
+        self.shed_threshold = maxsize // 2 if shed_threshold is None else shed_threshold
+        self._queues = tuple(deque() for _ in PRIORITY_NAMES)
+        self._pending = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._enqueued = 0
+        self._processed = 0
+        self._max_depth = 0
+        self._dropped = [0] * len(PRIORITY_NAMES)
+        self._coalesced = [0] * len(PRIORITY_NAMES)
+
+    def put(self, item):
+        priority, key = self.classify(item)
+        with self._lock:
+            if key is not None and self._size >= self.shed_threshold:
+                slot = self._pending.get(key)
+                if slot is not None:
+                    slot[1] = item
+                    self._coalesced[priority] += 1
+                    return True
+
+            if self._size >= self.maxsize and not self._make_room(priority):
+                self._dropped[priority] += 1
+                return False
+
+            slot = [key, item]
+            self._queues[priority].append(slot)
+            if key is not None:
+                self._pending[key] = slot
+            self._size += 1
+            self._enqueued += 1
+            if self._size > self._max_depth:
+                self._max_depth = self._size
+            self._not_empty.notify()
+            return True
+
+    def _make_room(self, priority):
+        # Shed the oldest item of the lowest class below the incoming one first.
+        for lower in range(len(self._queues) - 1, priority, -1):
+            if self._queues[lower]:
+                self._evict(lower)
+                return True
+        if self.overflow == self.DROP_NEWEST:
+            return False
+        if self.overflow == self.DROP_OLDEST:
+            # Never evict a higher class to make room for a lower one.
+            if not self._queues[priority]:
+                return False
+            self._evict(priority)
+            return True
+        return self._not_full.wait_for(lambda: self._size < self.maxsize, self.block_timeout)
+
+    def _evict(self, priority):
+        self._pop(priority)
+        self._dropped[priority] += 1
+
+    def _pop(self, priority):
+        slot = self._queues[priority].popleft()
+        key, item = slot
+        if key is not None and self._pending.get(key) is slot:
+            del self._pending[key]
+        self._size -= 1
+        return item
+
+    def get(self, timeout=None):
+        with self._lock:
+            if not self._not_empty.wait_for(lambda: self._size, timeout):
+                return None
+            for priority, queue in enumerate(self._queues):
+                if queue:
+                    item = self._pop(priority)
+                    break
+            self._not_full.notify()
+            return item
+
+    def task_done(self):
+        with self._lock:
+            self._processed += 1
+
+    def __len__(self):
+        return self._size
+
+    def stats(self):
+        with self._lock:
+            return {
+                'depth': self._size,
+                'maxDepth': self._max_depth,
+                'capacity': self.maxsize,
+                'shedThreshold': self.shed_threshold,
+                'policy': self.overflow,
+                'enqueued': self._enqueued,
+                'processed': self._processed,
+                'dropped': sum(self._dropped),
+                'coalesced': sum(self._coalesced),
+                'classes': {
+                    name: {
+                        'depth': len(self._queues[priority]),
+                        'dropped': self._dropped[priority],
+                        'coalesced': self._coalesced[priority]
+                    }
+                    for priority, name in enumerate(PRIORITY_NAMES)
+                }
+            }
+
+
+class IngestWorker:
+    def __init__(self, queue, process, name='ingest-worker', poll_interval=0.5):
+        self.queue = queue
+        self.process = process
+        self.name = name
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        logging.info(f"Started {self.name}")
+
+    def stop(self, timeout=2):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def is_alive(self):
+        return bool(self._thread and self._thread.is_alive())
+
+    def _run(self):
+        while not self._stop.is_set():
+            item = self.queue.get(timeout=self.poll_interval)
+            if item is None:
+                continue
+            try:
+                self.process(item)
+            except Exception as e:
+                logging.error(f"Error in {self.name}: {e}")
+                logging.exception("Stack trace:")
+            finally:
+                self.queue.task_done()
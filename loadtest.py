@@ -0,0 +1,126 @@
+from gevent import monkey
+monkey.patch_all()
+
+import argparse
+import json
+import time
+
+import gevent
+import simple_websocket
+
+# Opens many Socket.IO clients against a running server and reports how many
+# stay connected and how fast the active ones get answers. Idle clients only
+# answer pings; active clients ask for a page of messages every interval.
+#
+#   MESHTASTIC_ASYNC_MODE=gevent python app.py
+#   python loadtest.py --idle 2000 --active 50 --duration 60
+#
+# Repeat --url to spread the clients round robin over several web workers.
+
+
+class Results:
+    def __init__(self):
+        self.connected = 0
+        self.failed = 0
+        self.dropped = 0
+        self.requests = 0
+        self.replies = 0
+        self.latencies = []
+
+    def take_latencies(self):
+        latencies, self.latencies = sorted(self.latencies), []
+        return latencies
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_client(url, wire, active, interval, results, deadline):
+    try:
+        ws = simple_websocket.Client.connect(url)
+        # Don't wait for the open packet: simple-websocket only surfaces it
+        # with the next read when it shares a segment with the handshake.
+        ws.send('40' + json.dumps({'wire': wire}))
+    except Exception:
+        results.failed += 1
+        return
+    results.connected += 1
+    sent_at = None
+    next_request = time.monotonic() + interval
+    try:
+        while time.monotonic() < deadline:
+            timeout = max(0.0, next_request - time.monotonic()) if active else 1.0
+            frame = ws.receive(timeout=timeout)
+            now = time.monotonic()
+            if frame == '2':
+                ws.send('3')
+            elif isinstance(frame, str) and sent_at is not None and (
+                    frame.startswith('42["messages_page"') or frame.startswith('42["packed",["messages_page"')):
+                results.replies += 1
+                results.latencies.append(now - sent_at)
+                sent_at = None
+            if active and now >= next_request:
+                ws.send('42' + json.dumps(['get_messages', {'channel': 0, 'limit': 20}]))
+                results.requests += 1
+                sent_at = now
+                next_request = now + interval
+    except Exception:
+        results.dropped += 1
+    finally:
+        results.connected -= 1
+        try:
+            ws.close()
+        except Exception:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Socket.IO connection load test')
+    parser.add_argument('--url', action='append', help='websocket URL, may be repeated '
+                        '(default ws://127.0.0.1:5678/socket.io/?EIO=4&transport=websocket)')
+    parser.add_argument('--idle', type=int, default=1000, help='clients that only answer pings')
+    parser.add_argument('--active', type=int, default=50, help='clients sending a request every interval')
+    parser.add_argument('--interval', type=float, default=1.0, help='seconds between requests per active client')
+    parser.add_argument('--duration', type=float, default=60.0, help='seconds to hold the connections')
+    parser.add_argument('--ramp', type=int, default=200, help='new connections per second')
+    parser.add_argument('--wire', default='json', choices=('json', 'compact'))
+    parser.add_argument('--report', type=float, default=5.0, help='seconds between reports')
+    args = parser.parse_args()
+    urls = args.url or ['ws://127.0.0.1:5678/socket.io/?EIO=4&transport=websocket']
+
+    results = Results()
+    total = args.idle + args.active
+    deadline = time.monotonic() + total / args.ramp + args.duration
+    clients = []
+
+    def ramp():
+        for i in range(total):
+            clients.append(gevent.spawn(run_client, urls[i % len(urls)], args.wire, i < args.active,
+                                        args.interval, results, deadline))
+            gevent.sleep(1.0 / args.ramp)
+
+    gevent.spawn(ramp)
+    started = time.monotonic()
+    replies = 0
+    worst = 0.0
+    while time.monotonic() < deadline:
+        gevent.sleep(args.report)
+        latencies = results.take_latencies()
+        worst = max([worst] + latencies)
+        rate = (results.replies - replies) / args.report
+        replies = results.replies
+        print(f"{time.monotonic() - started:6.0f}s  connected {results.connected:5d}/{total}  "
+              f"failed {results.failed}  dropped {results.dropped}  replies/s {rate:7.1f}  "
+              f"p50 {percentile(latencies, 0.5) * 1000:7.1f}ms  p95 {percentile(latencies, 0.95) * 1000:7.1f}ms",
+              flush=True)
+    gevent.joinall(clients, timeout=5)
+    print(f"done: {total} clients ({args.idle} idle, {args.active} active), failed {results.failed}, "
+          f"dropped {results.dropped}, requests {results.requests}, replies {results.replies}, "
+          f"worst latency {worst * 1000:.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+import functools
+import logging
+import time
+from collections import deque
+
+
+class LoopBridge:
+    # Hands calls from foreign OS threads (the radio reader) to the server's
+    # event loop. In 'threading' mode every call runs in place; under gevent
+    # the calls queue up and one greenlet on the server hub runs them in
+    # order, woken through the loop's thread-safe callback. The deque is the
+    # only state both threads touch; its append and popleft are atomic.
+    def __init__(self, async_mode='threading'):
+        self.async_mode = async_mode
+        self.green = async_mode == 'gevent'
+        self._calls = deque()
+        self._loop = None
+        self._ready = None
+        self._bridged = 0
+        self._errors = 0
+        self._max_depth = 0
+        self._max_delay = 0.0
+        self._delay_total = 0.0
+        self._radio_threads = 0
+
+    def start(self):
+        # Must run on the server hub (the main thread).
+        if not self.green or self._loop is not None:
+            return
+        import gevent
+        import gevent.event
+        self._loop = gevent.get_hub().loop
+        self._ready = gevent.event.Event()
+        gevent.spawn(self._run)
+
+    def call(self, fn, *args, **kwargs):
+        if self._loop is None:
+            return fn(*args, **kwargs)
+        self._calls.append((time.monotonic(), fn, args, kwargs))
+        self._max_depth = max(self._max_depth, len(self._calls))
+        self._loop.run_callback_threadsafe(self._ready.set)
+
+    def wrap(self, fn):
+        # functools.wraps keeps fn's signature visible to pypubsub.
+        @functools.wraps(fn)
+        def bridged(*args, **kwargs):
+            return self.call(fn, *args, **kwargs)
+        return bridged
+
+    def run_in_thread(self, fn, *args):
+        # Runs fn in a dedicated OS thread with its own hub and returns its
+        # result. The thread stays alive while greenlets fn started (such as
+        # the meshtastic reader) are running, so blocking serial I/O never
+        # stalls the server hub.
+        if self._loop is None:
+            return fn(*args)
+        import gevent
+        import gevent.event
+        from gevent.monkey import get_original
+        result = gevent.event.AsyncResult()
+
+        def target():
+            self._radio_threads += 1
+            try:
+                try:
+                    value = fn(*args)
+                except BaseException as e:
+                    self._loop.run_callback_threadsafe(result.set_exception, e)
+                    return
+                self._loop.run_callback_threadsafe(result.set, value)
+                gevent.get_hub().join()
+            finally:
+                self._radio_threads -= 1
+
+        # The callbacks above do not keep the hub alive; without this, waiting
+        # on a hub with nothing else to do raises LoopExit.
+        keepalive = self._loop.async_()
+        keepalive.start(lambda: None)
+        try:
+            get_original('_thread', 'start_new_thread')(target, ())
+            return result.get()
+        finally:
+            keepalive.close()
+
+    def _run(self):
+        while True:
+            self._ready.wait()
+            self._ready.clear()
+            while self._calls:
+                queued, fn, args, kwargs = self._calls.popleft()
+                delay = time.monotonic() - queued
+                self._bridged += 1
+                self._delay_total += delay
+                self._max_delay = max(self._max_delay, delay)
+                try:
+                    fn(*args, **kwargs)
+                except Exception as e:
+                    self._errors += 1
+                    logging.error(f"Error in bridged call {getattr(fn, '__name__', fn)}: {e}")
+                    logging.exception("Stack trace:")
+
+    def stats(self):
+        return {
+            'asyncMode': self.async_mode,
+            'pending': len(self._calls),
+            'bridged': self._bridged,
+            'errors': self._errors,
+            'maxDepth': self._max_depth,
+            'avgDelayMs': round(self._delay_total * 1000 / self._bridged, 2) if self._bridged else 0.0,
+            'maxDelayMs': round(self._max_delay * 1000, 2),
+            'radioThreads': self._radio_threads
+        }
@@ -0,0 +1,258 @@
+import logging
+import pickle
+import queue
+import socket
+import struct
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import answer_challenge, deliver_challenge
+
+from socketio import PubSubManager
+
+from send_queue import backoff_delay
+
+ROLE_STANDALONE = 'standalone'
+ROLE_INGEST = 'ingest'
+ROLE_WEB = 'web'
+ROLES = (ROLE_STANDALONE, ROLE_INGEST, ROLE_WEB)
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+class SocketConnection:
+    # Length-prefixed pickles over a plain socket, with the send/recv
+    # interface of a multiprocessing Connection. multiprocessing's own
+    # Connection reads the raw file descriptor, which breaks under gevent.
+    def __init__(self, sock):
+        self.sock = sock
+
+    def send_bytes(self, data):
+        self.sock.sendall(struct.pack('!I', len(data)) + data)
+
+    def recv_bytes(self, maxlength=None):
+        size = struct.unpack('!I', self._recv_exact(4))[0]
+        if maxlength is not None and size > maxlength:
+            raise OSError(f"Message of {size} bytes exceeds {maxlength}")
+        return self._recv_exact(size)
+
+    def _recv_exact(self, size):
+        chunks = []
+        while size:
+            chunk = self.sock.recv(min(size, 65536))
+            if not chunk:
+                raise EOFError()
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    def send(self, message):
+        self.send_bytes(pickle.dumps(message, pickle.HIGHEST_PROTOCOL))
+
+    def recv(self):
+        return pickle.loads(self.recv_bytes())
+
+    def close(self):
+        self.sock.close()
+
+
+def connect_bus(address, authkey):
+    # Mutual HMAC challenge (as in multiprocessing) before any pickle is read.
+    conn = SocketConnection(socket.create_connection(address))
+    try:
+        answer_challenge(conn, authkey)
+        deliver_challenge(conn, authkey)
+    except Exception:
+        conn.close()
+        raise
+    return conn
+
+
+class MessageBroker:
+    # Relays every message a connection sends to all the other connections.
+    # Each subscriber gets its own bounded outbox and writer thread, so one
+    # slow web worker drops its own oldest messages instead of stalling the
+    # rest. Messages are pickles, so peers must pass the authkey challenge
+    # before anything they send is read.
+    def __init__(self, address, authkey, outbox_size=10000):
+        self.address = address
+        self.authkey = authkey
+        self.outbox_size = outbox_size
+        self._listener = None
+        self._subscribers = {}
+        self._ids = 0
+        self._lock = threading.Lock()
+        self._relayed = 0
+        self._dropped = 0
+
+    def start(self):
+        if self._listener is not None:
+            return
+        self._listener = socket.create_server(self.address)
+        threading.Thread(target=self._accept, name='bus-accept', daemon=True).start()
+        logging.info(f"Message bus listening on {self.address[0]}:{self.address[1]}")
+
+    def stop(self):
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+
+    def _accept(self):
+        while self._listener is not None:
+            try:
+                sock, peer = self._listener.accept()
+            except OSError as e:
+                if self._listener is not None:
+                    logging.error(f"Error accepting bus connection: {e}")
+                continue
+            threading.Thread(target=self._authenticate, args=(SocketConnection(sock), peer),
+                             name='bus-auth', daemon=True).start()
+
+    def _authenticate(self, conn, peer):
+        try:
+            deliver_challenge(conn, self.authkey)
+            answer_challenge(conn, self.authkey)
+        except Exception as e:
+            logging.warning(f"Rejected message bus connection from {peer[0]}: {e}")
+            conn.close()
+            return
+        self.attach(conn)
+
+    def attach(self, conn):
+        outbox = queue.Queue(self.outbox_size)
+        with self._lock:
+            self._ids += 1
+            subscriber_id = self._ids
+            self._subscribers[subscriber_id] = outbox
+        threading.Thread(target=self._read, args=(subscriber_id, conn), name='bus-read', daemon=True).start()
+        threading.Thread(target=self._write, args=(subscriber_id, conn, outbox), name='bus-write', daemon=True).start()
+        return subscriber_id
+
+    def _read(self, subscriber_id, conn):
+        try:
+            while True:
+                self.publish(conn.recv(), sender=subscriber_id)
+        except (EOFError, OSError):
+            pass
+        finally:
+            with self._lock:
+                outbox = self._subscribers.pop(subscriber_id, None)
+            if outbox is not None:
+                outbox.put(None)
+
+    def _write(self, subscriber_id, conn, outbox):
+        try:
+            while True:
+                message = outbox.get()
+                if message is None:
+                    break
+                conn.send(message)
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+
+    def publish(self, message, sender=None):
+        with self._lock:
+            outboxes = [outbox for subscriber_id, outbox in self._subscribers.items() if subscriber_id != sender]
+            self._relayed += 1
+        for outbox in outboxes:
+            while True:
+                try:
+                    outbox.put_nowait(message)
+                    break
+                except queue.Full:
+                    try:
+                        outbox.get_nowait()
+                        with self._lock:
+                            self._dropped += 1
+                    except queue.Empty:
+                        pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'relayed': self._relayed,
+                'dropped': self._dropped,
+                'maxOutbox': max((outbox.qsize() for outbox in self._subscribers.values()), default=0)
+            }
+
+
+class BusManager(PubSubManager):
+    # Socket.IO client manager on top of the message bus. Emits go out to
+    # every process; each web worker delivers them to its own clients. Web
+    # workers also forward client events that need the radio or the ingest
+    # process's state as 'client_event' messages, handed to on_client_event.
+    name = 'meshbus'
+
+    def __init__(self, address, authkey=None, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.address = address
+        self.authkey = authkey
+        self.on_client_event = None
+        self._conn = None
+        self._send_lock = threading.Lock()
+        self._connected = threading.Event()
+        self._published = 0
+        self._received = 0
+        self._forwarded = 0
+
+    def _ensure_connection(self):
+        attempt = 0
+        while self._conn is None:
+            try:
+                self._conn = connect_bus(self.address, self.authkey)
+                self._connected.set()
+            except (OSError, EOFError, AuthenticationError) as e:
+                attempt += 1
+                delay = backoff_delay(attempt, base=0.5, cap=10.0)
+                logging.warning(f"Message bus unavailable ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+        return self._conn
+
+    def _publish(self, data):
+        if self.write_only:
+            self._ensure_connection()
+        elif not self._connected.wait(10):
+            logging.error(f"Message bus not connected, dropping {data.get('method')} message")
+            return
+        with self._send_lock:
+            try:
+                self._conn.send(data)
+                self._published += 1
+            except (AttributeError, OSError) as e:
+                logging.error(f"Error publishing {data.get('method')} to the message bus: {e}")
+
+    def forward(self, sid, event, args):
+        self._forwarded += 1
+        self._publish({'method': 'client_event', 'sid': sid, 'event': event, 'args': list(args),
+                       'host_id': self.host_id})
+
+    def _listen(self):
+        while True:
+            conn = self._ensure_connection()
+            try:
+                message = conn.recv()
+            except (EOFError, OSError) as e:
+                logging.error(f"Lost message bus connection: {e}")
+                self._connected.clear()
+                self._conn = None
+                continue
+            self._received += 1
+            if message.get('method') == 'client_event':
+                if self.on_client_event is not None:
+                    self.on_client_event(message)
+                continue
+            yield message
+
+    def stats(self):
+        return {
+            'connected': self._connected.is_set(),
+            'published': self._published,
+            'received': self._received,
+            'forwardedEvents': self._forwarded
+        }
@@ -0,0 +1,101 @@
+import threading
+from collections import deque
+
+# Allowed status transitions. A late ACK may still rescue a message that was
+# already marked as timed out or failed; nothing leaves 'acked'.
+TRANSITIONS = {
+    None: {'pending', 'acked', 'timeout', 'failed'},
+    'pending': {'acked', 'timeout', 'failed'},
+    'timeout': {'acked', 'failed'},
+    'failed': {'acked'},
+    'acked': set()
+}
+
+
+class MessageIndex:
+    # Recent messages keyed by packetId, plus a bounded, arrival-ordered view
+    # per channel. Lookups and status changes are dict operations.
+    def __init__(self, per_channel=500):
+        self.per_channel = per_channel
+        self._by_id = {}
+        self._channels = {}
+        self._lock = threading.Lock()
+        self._transitions = 0
+        self._rejected = 0
+        self._misses = 0
+
+    def add(self, message):
+        packet_id = message.get('packetId')
+        channel = message.get('channel') or 0
+        with self._lock:
+            existing = self._by_id.get(packet_id) if packet_id is not None else None
+            if existing is not None:
+                existing.update(message)
+                return existing
+            view = self._channels.get(channel)
+            if view is None:
+                view = self._channels[channel] = deque()
+            if len(view) >= self.per_channel:
+                dropped = view.popleft()
+                for dropped_id in [dropped.get('packetId')] + dropped.get('attempts', []):
+                    if self._by_id.get(dropped_id) is dropped:
+                        del self._by_id[dropped_id]
+            view.append(message)
+            if packet_id is not None:
+                self._by_id[packet_id] = message
+            return message
+
+    def alias(self, packet_id, message):
+        # Retransmissions get new packet ids; they all resolve to the
+        # original entry so an ACK for any attempt lands on it.
+        with self._lock:
+            self._by_id[packet_id] = message
+
+    def get(self, packet_id):
+        return self._by_id.get(packet_id)
+
+    def set_status(self, packet_id, status):
+        # Returns (message, applied). message is None for unknown packet ids.
+        with self._lock:
+            message = self._by_id.get(packet_id)
+            if message is None:
+                self._misses += 1
+                return None, False
+            if status not in TRANSITIONS.get(message.get('status'), ()):
+                self._rejected += 1
+                return message, False
+            message['status'] = status
+            self._transitions += 1
+            return message, True
+
+    def recent(self, channel, limit=None):
+        with self._lock:
+            view = list(self._channels.get(channel, ()))
+        return view[-limit:] if limit else view
+
+    def pending(self):
+        with self._lock:
+            return list({id(m): m for m in self._by_id.values() if m.get('status') == 'pending'}.values())
+
+    def clear(self):
+        with self._lock:
+            self._by_id.clear()
+            self._channels.clear()
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def stats(self):
+        with self._lock:
+            statuses = {}
+            for message in {id(m): m for m in self._by_id.values()}.values():
+                status = message.get('status') or 'none'
+                statuses[status] = statuses.get(status, 0) + 1
+            return {
+                'indexed': len(self._by_id),
+                'channels': {channel: len(view) for channel, view in self._channels.items()},
+                'statuses': statuses,
+                'transitions': self._transitions,
+                'rejectedTransitions': self._rejected,
+                'misses': self._misses
+            }
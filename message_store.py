@@ -0,0 +1,471 @@
+import base64
+import json
+import logging
+import math
+import queue
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    packet_id INTEGER,
+    channel INTEGER NOT NULL DEFAULT 0,
+    sender TEXT,
+    sender_num INTEGER,
+    to_id TEXT,
+    text TEXT,
+    timestamp INTEGER NOT NULL,
+    direction TEXT NOT NULL DEFAULT 'rx',
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_messages_channel_ts ON messages (channel, timestamp);
+CREATE INDEX IF NOT EXISTS idx_messages_sender_ts ON messages (sender_num, timestamp);
+CREATE INDEX IF NOT EXISTS idx_messages_ts ON messages (timestamp);
+CREATE INDEX IF NOT EXISTS idx_messages_packet_id ON messages (packet_id);
+
+CREATE TABLE IF NOT EXISTS packets (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    packet_id INTEGER,
+    from_num INTEGER,
+    to_id TEXT,
+    portnum TEXT,
+    channel INTEGER,
+    rx_time INTEGER NOT NULL,
+    rx_snr REAL,
+    rx_rssi INTEGER,
+    hop_start INTEGER,
+    decoded TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_packets_from_ts ON packets (from_num, rx_time);
+CREATE INDEX IF NOT EXISTS idx_packets_portnum_ts ON packets (portnum, rx_time);
+CREATE INDEX IF NOT EXISTS idx_packets_ts ON packets (rx_time);
+CREATE INDEX IF NOT EXISTS idx_packets_packet_id ON packets (packet_id);
+'''
+
+MESSAGE_COLUMNS = 'id, packet_id, channel, sender, sender_num, to_id, text, timestamp, direction, status'
+
+INSERT_MESSAGE = (
+    'INSERT OR IGNORE INTO messages (packet_id, channel, sender, sender_num, to_id, text, timestamp, direction, status) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'
+)
+INSERT_PACKET = (
+    'INSERT INTO packets (packet_id, from_num, to_id, portnum, channel, rx_time, rx_snr, rx_rssi, hop_start, decoded) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+)
+# The radio hands back the messages it stored on every reconnect, so the same
+# received message can arrive more than once. (sender, packet id, timestamp)
+# identifies it; rows written before the index existed are deduplicated once
+# when it is created.
+RX_DEDUP_INDEX = (
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_rx_unique '
+    "ON messages (IFNULL(sender_num, -1), IFNULL(packet_id, -1), timestamp) WHERE direction = 'rx'"
+)
+RX_DEDUP_CLEANUP = (
+    "DELETE FROM messages WHERE direction = 'rx' AND id NOT IN ("
+    "SELECT MIN(id) FROM messages WHERE direction = 'rx' GROUP BY IFNULL(sender_num, -1), IFNULL(packet_id, -1), timestamp)"
+)
+
+UPDATE_STATUS = 'UPDATE messages SET status = ? WHERE packet_id = ? AND direction = ?'
+
+# External-content FTS5 index over messages.text, kept in sync by triggers so
+# the writer thread does not need to know about it.
+FTS_SCHEMA = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    text, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF text ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    INSERT INTO messages_fts (rowid, text) VALUES (new.id, new.text);
+END;
+'''
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def _json_default(value):
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode('ascii')
+    return str(value)
+
+
+def make_cursor(message):
+    return f"{message['timestamp']}:{message['id']}"
+
+
+def parse_cursor(cursor):
+    try:
+        ts, row_id = str(cursor).split(':', 1)
+        return int(ts), int(row_id)
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def search_terms(text):
+    return [term for term in str(text or '').split() if term.strip('"*')]
+
+
+def fts_query(terms):
+    # Every term is quoted so user input can't inject FTS syntax; the last one
+    # is a prefix match so results show up while typing.
+    quoted = ['"' + term.replace('"', '""') + '"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def text_tokens(text):
+    # Roughly what the unicode61 tokenizer indexes: lower case, no diacritics.
+    text = str(text or '').lower()
+    if not text.isascii():
+        text = ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+    return TOKEN_PATTERN.findall(text)
+
+
+def rank_rows(rows, terms):
+    # bm25 over the candidate window, with term weights taken from the
+    # window itself. The last term is a prefix, as in fts_query().
+    docs = [text_tokens(row[6]) for row in rows]
+    if not docs:
+        return []
+    tokens = text_tokens(' '.join(terms))
+    average = sum(len(doc) for doc in docs) / len(docs) or 1.0
+    scores = [0.0] * len(docs)
+    for position, token in enumerate(tokens):
+        prefix = position == len(tokens) - 1
+        if prefix:
+            counts = [sum(1 for word in doc if word.startswith(token)) for doc in docs]
+        else:
+            counts = [doc.count(token) for doc in docs]
+        found = sum(1 for count in counts if count)
+        idf = math.log((len(docs) - found + 0.5) / (found + 0.5) + 1)
+        for i, count in enumerate(counts):
+            if count:
+                scores[i] += idf * count * 2.2 / (count + 1.2 * (0.25 + 0.75 * len(docs[i]) / average))
+    order = sorted(range(len(rows)), key=lambda i: (-scores[i], -rows[i][7], -rows[i][0]))
+    return [rows[i] + (scores[i],) for i in order]
+
+
+def message_from_row(row):
+    return {
+        'id': row[0],
+        'packetId': row[1],
+        'channel': row[2],
+        'sender': row[3],
+        'senderNum': row[4],
+        'to': row[5],
+        'text': row[6],
+        'timestamp': row[7],
+        'direction': row[8],
+        'status': row[9]
+    }
+
+
+class MessageStore:
+    # All writes go through one queue and one writer thread, which commits
+    # them in batches; readers use their own connection thanks to WAL.
+    def __init__(self, path, batch_size=200, flush_interval=0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._write_conn = self._connect()
+        self._write_conn.executescript(SCHEMA)
+        self._write_conn.commit()
+        self.fts = self._create_fts()
+        self._create_dedup_index()
+        self._read_conn = self._connect()
+        self._read_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._batches = 0
+        self._ops = 0
+        self._max_batch = 0
+        self._errors = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _create_fts(self):
+        conn = self._write_conn
+        try:
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+            ).fetchone()
+            conn.executescript(FTS_SCHEMA)
+            if not exists:
+                conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+            conn.commit()
+            return True
+        except sqlite3.OperationalError as e:
+            logging.warning(f"SQLite FTS5 unavailable, message search falls back to LIKE scans: {e}")
+            return False
+
+    def _create_dedup_index(self):
+        conn = self._write_conn
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_messages_rx_unique'"
+        ).fetchone()
+        if exists:
+            return
+        with conn:
+            removed = conn.execute(RX_DEDUP_CLEANUP).rowcount
+            conn.execute(RX_DEDUP_INDEX)
+        if removed:
+            logging.info(f"Removed {removed} duplicate stored messages")
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='message-store-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self.flush(timeout)
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def flush(self, timeout=5):
+        if not (self._thread and self._thread.is_alive()):
+            self._write(self._drain())
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def _drain(self):
+        ops = []
+        while True:
+            try:
+                ops.append(self._queue.get_nowait())
+            except queue.Empty:
+                return ops
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                op = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = [op]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch):
+        waiters = [op for op in batch if isinstance(op, threading.Event)]
+        ops = [op for op in batch if not isinstance(op, threading.Event)]
+        try:
+            if ops:
+                with self._write_conn:
+                    # Consecutive statements with the same SQL go through executemany.
+                    start = 0
+                    for index in range(1, len(ops) + 1):
+                        if index == len(ops) or ops[index][0] != ops[start][0]:
+                            self._write_conn.executemany(ops[start][0], [op[1] for op in ops[start:index]])
+                            start = index
+                self._batches += 1
+                self._ops += len(ops)
+                self._max_batch = max(self._max_batch, len(ops))
+        except Exception as e:
+            self._errors += 1
+            logging.error(f"Error writing message store batch: {e}")
+            logging.exception("Stack trace:")
+        finally:
+            for waiter in waiters:
+                waiter.set()
+
+    def add_message(self, message):
+        self._queue.put((INSERT_MESSAGE, (
+            message.get('packetId'),
+            message.get('channel') or 0,
+            message.get('sender'),
+            message.get('senderNum'),
+            message.get('to'),
+            message.get('text'),
+            int(message.get('timestamp') or time.time()),
+            message.get('direction', 'rx'),
+            message.get('status')
+        )))
+
+    def add_packet(self, view):
+        decoded = json.dumps(view.decoded, default=_json_default) if view.decoded else None
+        self._queue.put((INSERT_PACKET, (
+            view.packet_id,
+            view.node_num,
+            view.to_id if view.to_id is None else str(view.to_id),
+            view.portnum,
+            view.channel,
+            int(view.rx_time or time.time()),
+            view.rx_snr,
+            view.rx_rssi,
+            view.hop_start,
+            decoded
+        )))
+
+    def update_status(self, packet_id, status, direction='tx'):
+        self._queue.put((UPDATE_STATUS, (status, packet_id, direction)))
+
+    def prune_packets(self, older_than):
+        self._queue.put(('DELETE FROM packets WHERE rx_time < ?', (int(older_than),)))
+
+    def query(self, sql, params=()):
+        with self._read_lock:
+            return self._read_conn.execute(sql, params).fetchall()
+
+    def recent(self, channel=None, limit=100):
+        if channel is None:
+            rows = self.query(f'SELECT {MESSAGE_COLUMNS} FROM messages ORDER BY timestamp DESC, id DESC LIMIT ?', (limit,))
+        else:
+            rows = self.query(
+                f'SELECT {MESSAGE_COLUMNS} FROM messages WHERE channel = ? ORDER BY timestamp DESC, id DESC LIMIT ?',
+                (channel, limit)
+            )
+        return [message_from_row(row) for row in reversed(rows)]
+
+    def page(self, channel=0, before=None, after=None, limit=50):
+        # Keyset pagination on (timestamp, id); cursors are opaque "timestamp:id"
+        # strings taken from the first/last message of a page.
+        if before is not None and after is not None:
+            raise ValueError("Pass either before or after, not both")
+        if after is not None:
+            ts, row_id = parse_cursor(after)
+            rows = self.query(
+                f'SELECT {MESSAGE_COLUMNS} FROM messages WHERE channel = ? '
+                'AND (timestamp > ? OR (timestamp = ? AND id > ?)) '
+                'ORDER BY timestamp ASC, id ASC LIMIT ?',
+                (channel, ts, ts, row_id, limit + 1)
+            )
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+        else:
+            if before is not None:
+                ts, row_id = parse_cursor(before)
+                rows = self.query(
+                    f'SELECT {MESSAGE_COLUMNS} FROM messages WHERE channel = ? '
+                    'AND (timestamp < ? OR (timestamp = ? AND id < ?)) '
+                    'ORDER BY timestamp DESC, id DESC LIMIT ?',
+                    (channel, ts, ts, row_id, limit + 1)
+                )
+            else:
+                rows = self.query(
+                    f'SELECT {MESSAGE_COLUMNS} FROM messages WHERE channel = ? '
+                    'ORDER BY timestamp DESC, id DESC LIMIT ?',
+                    (channel, limit + 1)
+                )
+            has_more = len(rows) > limit
+            rows = list(reversed(rows[:limit]))
+        messages = [message_from_row(row) for row in rows]
+        return {
+            'channel': channel,
+            'messages': messages,
+            'before': make_cursor(messages[0]) if messages else before,
+            'after': make_cursor(messages[-1]) if messages else after,
+            'hasMore': has_more
+        }
+
+    def search(self, text, channel=None, sender_num=None, start=None, end=None, limit=20, offset=0,
+               candidates=2000, before=None):
+        terms = search_terms(text)
+        if not terms:
+            return {'query': text, 'results': [], 'offset': offset, 'hasMore': False,
+                    'truncated': False, 'before': None, 'elapsedMs': 0.0}
+        filters, params = [], []
+        if channel is not None:
+            filters.append('m.channel = ?')
+            params.append(channel)
+        if sender_num is not None:
+            filters.append('m.sender_num = ?')
+            params.append(sender_num)
+        if start is not None:
+            filters.append('m.timestamp >= ?')
+            params.append(int(start))
+        if end is not None:
+            filters.append('m.timestamp < ?')
+            params.append(int(end))
+        columns = ', '.join('m.' + column for column in MESSAGE_COLUMNS.split(', '))
+        truncated, cursor = False, None
+        began = time.perf_counter()
+        if self.fts:
+            # Only the newest `candidates` matches are ranked. FTS5 walks them
+            # in rowid order and stops at the LIMIT; its bm25() would visit
+            # every match to weigh the terms, so ranking happens here over the
+            # window instead. When there are more, `before` is the cursor for
+            # the next older window.
+            if before is not None:
+                filters.append('messages_fts.rowid < ?')
+                params.append(int(before))
+            sql = (
+                f'SELECT {columns} FROM messages_fts '
+                'JOIN messages m ON m.id = messages_fts.rowid WHERE messages_fts MATCH ?'
+            )
+            params.insert(0, fts_query(terms))
+            if filters:
+                sql += ' AND ' + ' AND '.join(filters)
+            sql += ' ORDER BY messages_fts.rowid DESC LIMIT ?'
+            params.append(candidates)
+            window = self.query(sql, params)
+            if len(window) >= candidates:
+                truncated, cursor = True, window[-1][0]
+            rows = rank_rows(window, terms)[offset:offset + limit + 1]
+        else:
+            sql = f'SELECT {columns}, 0.0 AS rank FROM messages m WHERE ' + ' AND '.join(
+                "m.text LIKE ? ESCAPE '\\'" for _ in terms
+            )
+            escaped = [term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') for term in terms]
+            params[:0] = ['%' + term + '%' for term in escaped]
+            if filters:
+                sql += ' AND ' + ' AND '.join(filters)
+            sql += ' ORDER BY m.timestamp DESC, m.id DESC LIMIT ? OFFSET ?'
+            params += [limit + 1, offset]
+            rows = self.query(sql, params)
+        elapsed = time.perf_counter() - began
+        results = []
+        for row in rows[:limit]:
+            message = message_from_row(row)
+            message['rank'] = round(row[10], 4)
+            results.append(message)
+        return {
+            'query': text,
+            'results': results,
+            'offset': offset,
+            'hasMore': len(rows) > limit,
+            'truncated': truncated,
+            'before': cursor,
+            'elapsedMs': round(elapsed * 1000, 3)
+        }
+
+    def close(self):
+        self.stop()
+        self._write_conn.close()
+        with self._read_lock:
+            self._read_conn.close()
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'pending': self._queue.qsize(),
+            'batches': self._batches,
+            'rowsWritten': self._ops,
+            'maxBatch': self._max_batch,
+            'avgBatch': round(self._ops / self._batches, 2) if self._batches else 0.0,
+            'errors': self._errors,
+            'fullTextSearch': self.fts
+        }
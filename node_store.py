@@ -0,0 +1,600 @@
+import copy
+import json
+import logging
+import sqlite3
+import sys
+import threading
+import time
+
+
+class Record:
+    # Slot-backed mirror of one level of a node's JSON. FIELDS are scalar keys,
+    # NESTED maps a key to the Record subclass holding it. Anything else the
+    # radio sends lands in `extra` so nothing is silently lost.
+    __slots__ = ('extra',)
+    FIELDS = ()
+    NESTED = {}
+    _field_set = frozenset()
+
+    def __init__(self):
+        for name in self.FIELDS:
+            setattr(self, name, None)
+        for name in self.NESTED:
+            setattr(self, name, None)
+        self.extra = None
+
+    def update(self, data, prefix='', overwrite=True):
+        changed = []
+        nested = self.NESTED
+        fields = self._field_set
+        for key, value in data.items():
+            if value is None:
+                continue
+            if key in nested:
+                if not isinstance(value, dict) or not value:
+                    continue
+                child = getattr(self, key)
+                if child is None:
+                    child = nested[key]()
+                    setattr(self, key, child)
+                changed.extend(child.update(value, f"{prefix}{key}.", overwrite))
+            elif key in fields:
+                current = getattr(self, key)
+                if current != value and (overwrite or current is None):
+                    setattr(self, key, value)
+                    changed.append(prefix + key)
+            else:
+                if self.extra is None:
+                    self.extra = {}
+                current = self.extra.get(key)
+                if current != value and (overwrite or current is None):
+                    self.extra[key] = value
+                    changed.append(prefix + key)
+        return changed
+
+    def to_dict(self):
+        result = {}
+        for name in self.FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                result[name] = value
+        for name in self.NESTED:
+            child = getattr(self, name)
+            if child is not None:
+                result[name] = child.to_dict()
+        if self.extra:
+            result.update(self.extra)
+        return result
+
+    def get(self, path):
+        value = self
+        for part in path.split('.'):
+            if isinstance(value, Record):
+                if part in value._field_set or part in value.NESTED:
+                    value = getattr(value, part)
+                else:
+                    value = value.extra.get(part) if value.extra else None
+            elif isinstance(value, dict):
+                value = value.get(part)
+            else:
+                return None
+            if value is None:
+                return None
+        return value.to_dict() if isinstance(value, Record) else value
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._field_set = frozenset(cls.FIELDS)
+
+
+class UserRecord(Record):
+    FIELDS = ('id', 'longName', 'shortName', 'macaddr', 'hwModel', 'isLicensed', 'role', 'publicKey')
+    __slots__ = FIELDS
+
+
+class PositionRecord(Record):
+    FIELDS = (
+        'latitude', 'longitude', 'latitudeI', 'longitudeI', 'altitude', 'time', 'timestamp',
+        'PDOP', 'groundSpeed', 'groundTrack', 'satsInView', 'precisionBits', 'sender'
+    )
+    __slots__ = FIELDS
+
+
+class DeviceMetricsRecord(Record):
+    FIELDS = ('batteryLevel', 'voltage', 'channelUtilization', 'airUtilTx', 'uptimeSeconds', 'snr')
+    __slots__ = FIELDS
+
+
+class TelemetryRecord(Record):
+    FIELDS = ('time',)
+    NESTED = {'deviceMetrics': DeviceMetricsRecord}
+    __slots__ = FIELDS + tuple(NESTED)
+
+
+class NodeRecord(Record):
+    FIELDS = ('num', 'snr', 'lastHeard', 'hopsAway', 'viaMqtt', 'lastUpdated')
+    NESTED = {
+        'user': UserRecord,
+        'position': PositionRecord,
+        'deviceMetrics': DeviceMetricsRecord,
+        'telemetry': TelemetryRecord
+    }
+    __slots__ = FIELDS + tuple(NESTED) + ('version',)
+
+    def __init__(self):
+        super().__init__()
+        self.version = 0
+
+    def to_dict(self):
+        result = super().to_dict()
+        result['version'] = self.version
+        return result
+
+    def delta(self, paths):
+        changes = {}
+        for path in paths:
+            parts = path.split('.')
+            target = changes
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = self.get(path)
+        return changes
+
+
+def _deep_size(obj, seen):
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, Record):
+        for name in obj.FIELDS + tuple(obj.NESTED) + ('extra',):
+            size += _deep_size(getattr(obj, name), seen)
+    elif isinstance(obj, dict):
+        for key, value in obj.items():
+            size += _deep_size(key, seen) + _deep_size(value, seen)
+    elif isinstance(obj, (list, tuple, set)):
+        for item in obj:
+            size += _deep_size(item, seen)
+    return size
+
+
+class NodeSpill:
+    # Disk tier for evicted nodes so they come back intact if heard again.
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS spilled_nodes '
+            '(num INTEGER PRIMARY KEY, last_heard INTEGER, data TEXT NOT NULL)'
+        )
+        self._conn.commit()
+
+    def save(self, num, data, last_heard):
+        self.save_many([(num, data, last_heard)])
+
+    def save_many(self, nodes):
+        # One transaction (one fsync) for a whole eviction pass.
+        rows = [(num, last_heard, json.dumps(data)) for num, data, last_heard in nodes]
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO spilled_nodes (num, last_heard, data) VALUES (?, ?, ?)', rows
+            )
+            self._conn.commit()
+
+    def discard_many(self, nums):
+        with self._lock:
+            self._conn.executemany('DELETE FROM spilled_nodes WHERE num = ?', [(num,) for num in nums])
+            self._conn.commit()
+
+    def pop(self, num):
+        with self._lock:
+            row = self._conn.execute('SELECT data FROM spilled_nodes WHERE num = ?', (num,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute('DELETE FROM spilled_nodes WHERE num = ?', (num,))
+            self._conn.commit()
+            return json.loads(row[0])
+
+    def ids(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute('SELECT num FROM spilled_nodes')]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def node_num(key):
+    if isinstance(key, bool):
+        return None
+    if isinstance(key, int):
+        return key
+    if isinstance(key, str):
+        if key.startswith('!'):
+            try:
+                return int(key[1:], 16)
+            except ValueError:
+                return None
+        if key.isdigit():
+            return int(key)
+    return None
+
+
+def node_hex_id(num):
+    return f"!{num:08x}"
+
+
+class NodeStore:
+    # Nodes are keyed by their numeric node number. Hex ids ('!abcd1234')
+    # convert directly; short and long names go through a name index.
+    NAME_FIELDS = ('user.shortName', 'user.longName')
+
+    def __init__(self, clock=time.time, on_merge=None, max_nodes=None, max_age=None,
+                 spill=None, on_evict=None):
+        self.clock = clock
+        self.on_merge = on_merge
+        self.on_evict = on_evict
+        self.max_nodes = max_nodes
+        self.max_age = max_age
+        self.spill = spill
+        self._nodes = {}
+        self._names = {}
+        self._node_names = {}
+        self._pinned = set()
+        self._spilled = set(spill.ids()) if spill is not None else set()
+        self._spill_pending = {}
+        self._spill_write_lock = threading.Lock()
+        self._merges = 0
+        self._evicted = 0
+        self._expired = 0
+        self._restored = 0
+        self._lock = threading.RLock()
+
+    def resolve(self, key):
+        # An all-digit string is either a decimal node number or a name;
+        # a known name wins.
+        if isinstance(key, str) and key.isdigit() and key in self._names:
+            return self._names[key]
+        num = node_num(key)
+        if num is not None:
+            return num
+        if isinstance(key, str):
+            return self._names.get(key.lower())
+        return None
+
+    def update(self, node_id, data):
+        with self._lock:
+            num = self.resolve(node_id)
+            if num is None:
+                return None, []
+            changed = []
+            user = data.get('user')
+            user_num = node_num(user.get('id')) if isinstance(user, dict) else None
+            if user_num is not None and user_num != num and user_num in self._nodes:
+                changed.extend(self._merge(user_num, num))
+            record = self._nodes.get(num)
+            if record is None:
+                record = NodeRecord()
+                record.num = num
+                self._nodes[num] = record
+                if num in self._spilled:
+                    changed.extend(self._restore(num, record))
+            changed.extend(record.update(data))
+            record.lastUpdated = int(self.clock())
+            if changed:
+                record.version += 1
+                if any(path in self.NAME_FIELDS for path in changed):
+                    self._index_names(num, record)
+            if self.max_nodes and len(self._nodes) > self.max_nodes:
+                self._shrink(keep=num)
+        self.flush_spill()
+        return record, changed
+
+    def _restore(self, num, record):
+        self._spilled.discard(num)
+        data = self._spill_pending.pop(num, None)
+        if data is not None:
+            data = data[0]
+        else:
+            data = self.spill.pop(num)
+        if not data:
+            return []
+        data.pop('num', None)
+        data.pop('version', None)
+        self._restored += 1
+        return record.update(data)
+
+    def pin(self, node_id):
+        num = self.resolve(node_id)
+        if num is not None:
+            self._pinned.add(num)
+
+    def _last_seen(self, record):
+        return record.lastHeard or record.lastUpdated or 0
+
+    def _shrink(self, keep=None):
+        # Evict the least recently heard tenth in one pass so a full table
+        # does not pay for a scan on every new node.
+        target = self.max_nodes - max(1, self.max_nodes // 10)
+        candidates = sorted(
+            (self._last_seen(record), num) for num, record in self._nodes.items()
+            if num != keep and num not in self._pinned
+        )
+        for _, num in candidates[:max(0, len(self._nodes) - target)]:
+            self._evict(num)
+            self._evicted += 1
+
+    def expire(self, now=None):
+        if not self.max_age:
+            return 0
+        cutoff = (now if now is not None else self.clock()) - self.max_age
+        with self._lock:
+            stale = [
+                num for num, record in self._nodes.items()
+                if num not in self._pinned and self._last_seen(record) < cutoff
+            ]
+            for num in stale:
+                self._evict(num)
+            self._expired += len(stale)
+        self.flush_spill()
+        return len(stale)
+
+    def _evict(self, num):
+        record = self._nodes.pop(num)
+        self._unindex_names(num)
+        if self.spill is not None:
+            self._spill_pending[num] = (record.to_dict(), self._last_seen(record))
+            self._spilled.add(num)
+        if self.on_evict:
+            self.on_evict(num)
+
+    def flush_spill(self):
+        # Evicted nodes wait in _spill_pending (still restorable from there)
+        # and are written in one transaction after the store lock is released.
+        if self.spill is None or not self._spill_pending:
+            return 0
+        with self._spill_write_lock:
+            with self._lock:
+                pending = dict(self._spill_pending)
+            if not pending:
+                return 0
+            self.spill.save_many([(num, data, last_heard) for num, (data, last_heard) in pending.items()])
+            with self._lock:
+                for num, entry in pending.items():
+                    if self._spill_pending.get(num) is entry:
+                        del self._spill_pending[num]
+                # Heard again while the batch was being written.
+                restored = [num for num in pending if num not in self._spilled]
+            if restored:
+                self.spill.discard_many(restored)
+            return len(pending)
+
+    def merge(self, src_id, dst_id):
+        with self._lock:
+            src, dst = self.resolve(src_id), self.resolve(dst_id)
+            if src is None or dst is None or src == dst or src not in self._nodes:
+                return []
+            changed = self._merge(src, dst)
+            if changed:
+                self._nodes[dst].version += 1
+            return changed
+
+    def _merge(self, src, dst):
+        src_record = self._nodes.pop(src)
+        self._unindex_names(src)
+        data = src_record.to_dict()
+        data.pop('num', None)
+        data.pop('version', None)
+        record = self._nodes.get(dst)
+        if record is None:
+            record = NodeRecord()
+            record.num = dst
+            self._nodes[dst] = record
+        changed = record.update(data, overwrite=False)
+        self._index_names(dst, record)
+        self._merges += 1
+        if self.on_merge:
+            self.on_merge(src, dst)
+        return changed
+
+    def _index_names(self, num, record):
+        self._unindex_names(num)
+        user = record.user
+        if user is None:
+            return
+        names = tuple(name.lower() for name in (user.shortName, user.longName) if name)
+        for name in names:
+            self._names[name] = num
+        self._node_names[num] = names
+
+    def _unindex_names(self, num):
+        for name in self._node_names.pop(num, ()):
+            if self._names.get(name) == num:
+                del self._names[name]
+
+    def lookup(self, key):
+        return self._nodes.get(self.resolve(key))
+
+    def get(self, node_id):
+        return self.lookup(node_id)
+
+    def get_dict(self, node_id):
+        with self._lock:
+            record = self.lookup(node_id)
+            return record.to_dict() if record is not None else None
+
+    def display_name(self, node_id, default=None):
+        record = self.lookup(node_id)
+        user = record.user if record is not None else None
+        if user is not None and (user.longName or user.shortName):
+            return user.longName or user.shortName
+        return default
+
+    def delta(self, node_id, paths):
+        with self._lock:
+            record = self.lookup(node_id)
+            if record is None:
+                return None, None
+            return record.version, record.delta(paths)
+
+    def remove(self, node_id):
+        with self._lock:
+            num = self.resolve(node_id)
+            self._unindex_names(num)
+            return self._nodes.pop(num, None)
+
+    def clear(self):
+        with self._lock:
+            self._nodes.clear()
+            self._names.clear()
+            self._node_names.clear()
+
+    def ids(self):
+        with self._lock:
+            return list(self._nodes)
+
+    def to_dict(self):
+        with self._lock:
+            return {num: record.to_dict() for num, record in self._nodes.items()}
+
+    def memory_usage(self):
+        with self._lock:
+            seen = set()
+            total = sys.getsizeof(self._nodes) + sys.getsizeof(self._names) + sys.getsizeof(self._node_names)
+            for num, record in self._nodes.items():
+                total += _deep_size(num, seen) + _deep_size(record, seen)
+            for name in self._names:
+                total += _deep_size(name, seen)
+            return {
+                'nodes': len(self._nodes),
+                'approxBytes': total,
+                'avgBytesPerNode': total // len(self._nodes) if self._nodes else 0
+            }
+
+    def stats(self):
+        with self._lock:
+            return {
+                'nodes': len(self._nodes),
+                'maxNodes': self.max_nodes,
+                'maxAgeSeconds': self.max_age,
+                'names': len(self._names),
+                'pinned': len(self._pinned),
+                'merges': self._merges,
+                'evicted': self._evicted,
+                'expired': self._expired,
+                'spilled': len(self._spilled),
+                'spillPending': len(self._spill_pending),
+                'restored': self._restored
+            }
+
+    def __contains__(self, node_id):
+        return self.resolve(node_id) in self._nodes
+
+    def __len__(self):
+        return len(self._nodes)
+
+
+class NodeDeltaBatcher:
+    # Collects changed field paths per node and flushes them as one
+    # node_delta per node per interval. baseVersion is the version the
+    # client must hold for the delta to apply; otherwise it asks for a resync.
+    def __init__(self, store, emit, interval=0.25):
+        self.store = store
+        self.emit = emit
+        self.interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._marks = 0
+        self._deltas = 0
+        self._fields = 0
+        self._flushes = 0
+        self._coalesced = 0
+
+    def mark(self, node_id, changed, version):
+        if not changed:
+            return
+        with self._lock:
+            self._marks += 1
+            entry = self._pending.get(node_id)
+            if entry is None:
+                self._pending[node_id] = [version - 1, set(changed)]
+            else:
+                entry[1].update(changed)
+                self._coalesced += 1
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        sent = 0
+        for node_id, (base_version, paths) in pending.items():
+            version, changes = self.store.delta(node_id, paths)
+            if version is None:
+                continue
+            self.emit('node_delta', {
+                'num': node_id,
+                'baseVersion': base_version,
+                'version': version,
+                'changes': changes
+            })
+            sent += 1
+            self._fields += len(paths)
+        with self._lock:
+            self._deltas += sent
+            if sent:
+                self._flushes += 1
+        return sent
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='node-delta-batcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(self.interval * 4)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Error flushing node deltas: {e}")
+                logging.exception("Stack trace:")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'intervalMs': int(self.interval * 1000),
+                'pending': len(self._pending),
+                'updates': self._marks,
+                'deltasSent': self._deltas,
+                'fieldsSent': self._fields,
+                'coalesced': self._coalesced,
+                'flushes': self._flushes
+            }
+
+
+def _merge_changes(target, changes):
+    for key, value in changes.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge_changes(target[key], value)
+        else:
+            target[key] = value
+    return target
+
+
+def merge_node_deltas(old, new):
+    # Folds two consecutive node_delta payloads into one; returns None when
+    # they don't chain (the client must see both to detect the gap).
+    if old['version'] != new['baseVersion']:
+        return None
+    merged = dict(new, baseVersion=old['baseVersion'])
+    merged['changes'] = _merge_changes(copy.deepcopy(old['changes']), new['changes'])
+    return merged
@@ -0,0 +1,48 @@
+import math
+
+from spatial import normalize_longitude
+
+# Socket.IO room names. Clients join the rooms for what they are looking at
+# and the server emits into the narrowest room that covers an event.
+BROADCAST_ROOM = 'all'
+NODES_ROOM = 'nodes'
+DEBUG_ROOM = 'debug'
+MAP_ALL_ROOM = 'map:all'
+TOPIC_ROOMS = {'nodes': NODES_ROOM, 'debug': DEBUG_ROOM}
+
+
+def channel_room(channel):
+    return f'channel:{int(channel or 0)}'
+
+
+def map_cell(lat, lon, cell_size):
+    # The pole belongs to the top row, as in map_rooms_for_bbox.
+    lat = min(lat, 90.0 - 1e-9)
+    return int(math.floor(lat / cell_size)), int(math.floor(normalize_longitude(lon) / cell_size))
+
+
+def map_cell_room(row, col):
+    return f'map:{row}:{col}'
+
+
+def map_rooms_for_point(lat, lon, cell_size):
+    # Rooms a position belongs to: its grid cell plus the whole-map room.
+    return (MAP_ALL_ROOM, map_cell_room(*map_cell(lat, lon, cell_size)))
+
+
+def map_rooms_for_bbox(south, west, north, east, cell_size, max_cells):
+    # Cell rooms covering a viewport, or the whole-map room when the view
+    # is wider than max_cells.
+    south, north = max(-90.0, min(south, north)), min(90.0, max(south, north))
+    if east - west >= 360.0:
+        return [MAP_ALL_ROOM]
+    west, east = normalize_longitude(west), normalize_longitude(east)
+    spans = [(west, east)] if west <= east else [(west, 180.0), (-180.0, east)]
+    row_lo = int(math.floor(south / cell_size))
+    row_hi = int(math.floor(min(north, 90.0 - 1e-9) / cell_size))
+    cols = []
+    for lo, hi in spans:
+        cols.extend(range(int(math.floor(lo / cell_size)), int(math.floor(min(hi, 180.0 - 1e-9) / cell_size)) + 1))
+    if (row_hi - row_lo + 1) * len(cols) > max_cells:
+        return [MAP_ALL_ROOM]
+    return [map_cell_room(row, col) for row in range(row_lo, row_hi + 1) for col in cols]
@@ -0,0 +1,356 @@
+import heapq
+import itertools
+import logging
+import math
+import random
+import threading
+import time
+from collections import deque
+
+from ingest import PRIORITY_NORMAL, PRIORITY_NAMES
+
+# Meshtastic packet header plus the protobuf wrapper around a text payload.
+MESH_OVERHEAD_BYTES = 32
+
+
+def lora_airtime(payload_bytes, spreading_factor=11, bandwidth=250000, coding_rate=5, preamble=16):
+    # LoRa time on air (Semtech AN1200.13) with explicit header and CRC.
+    # Defaults match Meshtastic's LONG_FAST preset; coding_rate is the 4/x denominator.
+    symbol_time = (2 ** spreading_factor) / bandwidth
+    low_data_rate = 1 if symbol_time > 0.016 else 0
+    numerator = 8 * payload_bytes - 4 * spreading_factor + 28 + 16
+    payload_symbols = 8 + max(
+        math.ceil(numerator / (4 * (spreading_factor - 2 * low_data_rate))) * coding_rate, 0
+    )
+    return (preamble + 4.25 + payload_symbols) * symbol_time
+
+
+def text_airtime(text, **radio):
+    return lora_airtime(len(text.encode('utf-8')) + MESH_OVERHEAD_BYTES, **radio)
+
+
+def payload_airtime(payload, **radio):
+    # Pre-encoded payloads (e.g. compressed text) cost what they weigh on air.
+    if payload.get('data'):
+        return lora_airtime(len(payload['data']) + MESH_OVERHEAD_BYTES, **radio)
+    return text_airtime(payload.get('text', ''), **radio)
+
+
+def backoff_delay(attempt, base=15.0, cap=120.0, rng=random.random):
+    # Exponential backoff with equal jitter: half the delay is fixed, the
+    # other half random, so retries from many senders don't line up.
+    delay = min(cap, base * 2 ** (attempt - 1))
+    return delay / 2 + rng() * delay / 2
+
+
+class OutboundJob:
+    __slots__ = ('id', 'priority', 'payload', 'sid', 'cost', 'ready_at')
+
+    def __init__(self, job_id, priority, payload, sid, cost, ready_at):
+        self.id = job_id
+        self.priority = priority
+        self.payload = payload
+        self.sid = sid
+        self.cost = cost
+        self.ready_at = ready_at
+
+
+class FairQueue:
+    # Deficit round robin across senders (one flow per sid) within a single
+    # priority. Each turn a flow earns `quantum` seconds of airtime credit,
+    # so a client sending long messages gets fewer of them, not more airtime.
+    def __init__(self, quantum=1.0):
+        self.quantum = quantum
+        self._flows = {}
+        self._active = deque()
+        self._credited = False
+        self._size = 0
+
+    def append(self, job):
+        flow = self._flows.get(job.sid)
+        if flow is None:
+            flow = self._flows[job.sid] = [deque(), 0.0]
+            self._active.append(job.sid)
+        flow[0].append(job)
+        self._size += 1
+
+    def peek(self):
+        if not self._active:
+            return None
+        while True:
+            flow = self._flows[self._active[0]]
+            if not self._credited:
+                flow[1] += self.quantum
+                self._credited = True
+            if flow[1] >= flow[0][0].cost:
+                return flow[0][0]
+            self._active.rotate(-1)
+            self._credited = False
+
+    def popleft(self):
+        job = self.peek()
+        flow = self._flows[job.sid]
+        flow[0].popleft()
+        flow[1] -= job.cost
+        self._size -= 1
+        if not flow[0]:
+            del self._flows[job.sid]
+            self._active.popleft()
+            self._credited = False
+        return job
+
+    def queued(self, sid):
+        flow = self._flows.get(sid)
+        return len(flow[0]) if flow is not None else 0
+
+    def __iter__(self):
+        # Approximate service order: one job per flow per round.
+        queues = [self._flows[sid][0] for sid in self._active]
+        for depth in range(max((len(jobs) for jobs in queues), default=0)):
+            for jobs in queues:
+                if depth < len(jobs):
+                    yield jobs[depth]
+
+    def __len__(self):
+        return self._size
+
+    def __bool__(self):
+        return self._size > 0
+
+
+class ClientQuota:
+    # Per-client admission control in front of the queue: at most
+    # `max_queued` waiting jobs per sid and a per-sid message bucket of
+    # `burst` messages refilled at `per_minute`.
+    def __init__(self, max_queued=5, per_minute=10, burst=3, clock=time.monotonic):
+        self.max_queued = max_queued
+        self.per_minute = per_minute
+        self.burst = burst
+        self.clock = clock
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._throttled = 0
+
+    def admit(self, sid, queued):
+        # Returns (allowed, reason, retry_after_seconds).
+        now = self.clock()
+        with self._lock:
+            if self.max_queued and queued >= self.max_queued:
+                self._throttled += 1
+                return False, f"Too many queued messages (limit {self.max_queued})", None
+            if not self.per_minute:
+                return True, None, 0
+            tokens, updated = self._buckets.get(sid, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.per_minute / 60.0)
+            if tokens < 1:
+                self._buckets[sid] = (tokens, now)
+                self._throttled += 1
+                return False, f"Rate limit of {self.per_minute} messages per minute", (1 - tokens) * 60.0 / self.per_minute
+            self._buckets[sid] = (tokens - 1, now)
+            return True, None, 0
+
+    def forget(self, sid):
+        with self._lock:
+            self._buckets.pop(sid, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'clients': len(self._buckets),
+                'maxQueuedPerClient': self.max_queued,
+                'messagesPerMinute': self.per_minute,
+                'burst': self.burst,
+                'throttled': self._throttled
+            }
+
+
+class OutboundQueue:
+    # Paces transmissions with a token bucket measured in seconds of airtime:
+    # `rate` is the sustained airtime budget per wall-clock second (duty
+    # cycle), `burst` how much may go out back to back. Higher priorities
+    # always go first; within a priority senders share fairly (FairQueue).
+    # Jobs put with a delay wait in a heap and join their queue once due.
+    def __init__(self, send, rate=0.1, burst=6.0, maxsize=200, cost=None,
+                 on_position=None, quantum=1.0, clock=time.monotonic):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.send = send
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize
+        self.cost = cost or payload_airtime
+        self.on_position = on_position
+        self.clock = clock
+        self._queues = tuple(FairQueue(quantum) for _ in PRIORITY_NAMES)
+        self._delayed = []
+        self._size = 0
+        self._tokens = burst
+        self._updated = clock()
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = None
+        self._enqueued = 0
+        self._sent = 0
+        self._failed = 0
+        self._rejected = 0
+        self._airtime = 0.0
+        self._wait_total = 0.0
+        self._max_wait = 0.0
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def put(self, payload, priority=PRIORITY_NORMAL, sid=None, delay=0):
+        # Returns the queued job, or None if the queue is full.
+        cost = min(self.cost(payload), self.burst)
+        with self._cond:
+            if self._size + len(self._delayed) >= self.maxsize:
+                self._rejected += 1
+                return None
+            job = OutboundJob(next(self._ids), priority, payload, sid, cost, self.clock() + delay)
+            self._enqueued += 1
+            self._cond.notify()
+            if delay > 0:
+                heapq.heappush(self._delayed, (job.ready_at, job.id, job))
+                return job
+            self._queues[priority].append(job)
+            self._size += 1
+            # Everything behind the new job moved back one place.
+            positions = self._positions(since=job)
+        self._report(positions)
+        return job
+
+    def _ordered(self):
+        for jobs in self._queues:
+            yield from jobs
+
+    def _positions(self, since=None):
+        # (job, position, eta seconds) for queued jobs, optionally only from
+        # `since` onwards. Must hold the lock.
+        self._refill(self.clock())
+        result = []
+        ahead = -self._tokens
+        reporting = since is None
+        for position, job in enumerate(self._ordered(), 1):
+            reporting = reporting or job is since
+            ahead += job.cost
+            if reporting:
+                result.append((job, position, max(0.0, ahead / self.rate)))
+        return result
+
+    def queued(self, sid):
+        with self._cond:
+            return (sum(jobs.queued(sid) for jobs in self._queues)
+                    + sum(1 for _, _, job in self._delayed if job.sid == sid))
+
+    def positions(self):
+        with self._cond:
+            return [(job.id, position, eta) for job, position, eta in self._positions()]
+
+    def _report(self, positions):
+        if self.on_position is None:
+            return
+        for job, position, eta in positions:
+            try:
+                self.on_position(job, position, eta)
+            except Exception as e:
+                logging.error(f"Error reporting send queue position for job {job.id}: {e}")
+
+    def _promote(self, now):
+        promoted = []
+        while self._delayed and self._delayed[0][0] <= now:
+            job = heapq.heappop(self._delayed)[2]
+            self._queues[job.priority].append(job)
+            self._size += 1
+            promoted.append(job)
+        return promoted
+
+    def _next(self):
+        # Waits until the head job fits the bucket, then takes it.
+        with self._cond:
+            while not self._stop:
+                now = self.clock()
+                if self._promote(now):
+                    positions = self._positions()
+                    self._cond.release()
+                    try:
+                        self._report(positions)
+                    finally:
+                        self._cond.acquire()
+                    continue
+                due = self._delayed[0][0] - now if self._delayed else None
+                head = next((jobs.peek() for jobs in self._queues if jobs), None)
+                if head is None:
+                    self._cond.wait(due)
+                    continue
+                self._refill(now)
+                if self._tokens < head.cost:
+                    # A higher priority job arriving meanwhile re-runs the choice.
+                    wait = (head.cost - self._tokens) / self.rate
+                    self._cond.wait(wait if due is None else min(wait, due))
+                    continue
+                self._queues[head.priority].popleft()
+                self._size -= 1
+                self._tokens -= head.cost
+                waited = now - head.ready_at
+                self._wait_total += waited
+                self._max_wait = max(self._max_wait, waited)
+                self._airtime += head.cost
+                return head, self._positions()
+            return None, []
+
+    def _run(self):
+        while True:
+            job, positions = self._next()
+            if job is None:
+                return
+            try:
+                self.send(job)
+                self._sent += 1
+            except Exception as e:
+                self._failed += 1
+                logging.error(f"Error sending queued job {job.id}: {e}")
+                logging.exception("Stack trace:")
+            self._report(positions)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._cond:
+            self._stop = False
+        self._thread = threading.Thread(target=self._run, name='outbound-queue', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(1)
+            self._thread = None
+
+    def __len__(self):
+        return self._size
+
+    def stats(self):
+        with self._cond:
+            self._refill(self.clock())
+            dispatched = self._sent + self._failed
+            return {
+                'depth': self._size,
+                'delayed': len(self._delayed),
+                'maxsize': self.maxsize,
+                'byPriority': {name: len(jobs) for name, jobs in zip(PRIORITY_NAMES, self._queues)},
+                'enqueued': self._enqueued,
+                'sent': self._sent,
+                'failed': self._failed,
+                'rejected': self._rejected,
+                'airtimeBudgetPerSecond': self.rate,
+                'burstSeconds': self.burst,
+                'tokens': round(self._tokens, 3),
+                'airtimeSpentSeconds': round(self._airtime, 3),
+                'avgWaitSeconds': round(self._wait_total / dispatched, 3) if dispatched else 0.0,
+                'maxWaitSeconds': round(self._max_wait, 3)
+            }
@@ -0,0 +1,137 @@
+import math
+import threading
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = 111320.0
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def normalize_longitude(lon):
+    return ((lon + 180.0) % 360.0) - 180.0
+
+
+def valid_coordinates(lat, lon):
+    return (
+        isinstance(lat, (int, float)) and isinstance(lon, (int, float))
+        and -90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0
+        and not (math.isnan(lat) or math.isnan(lon))
+    )
+
+
+class GridIndex:
+    # Fixed-size lat/lon grid. Each key lives in exactly one cell, so a move
+    # is one set removal and one insert; queries only touch overlapping cells.
+    def __init__(self, cell_size=0.5):
+        self.cell_size = cell_size
+        self._cells = {}
+        self._points = {}
+        self._lock = threading.RLock()
+        self._queries = 0
+        self._moves = 0
+
+    def _cell(self, lat, lon):
+        return int(math.floor(lat / self.cell_size)), int(math.floor(lon / self.cell_size))
+
+    def update(self, key, lat, lon):
+        if not valid_coordinates(lat, lon):
+            self.remove(key)
+            return False
+        cell = self._cell(lat, lon)
+        with self._lock:
+            old = self._points.get(key)
+            if old is not None and old[2] != cell:
+                self._discard(key, old[2])
+                self._moves += 1
+            self._cells.setdefault(cell, set()).add(key)
+            self._points[key] = (lat, lon, cell)
+            return True
+
+    def remove(self, key):
+        with self._lock:
+            old = self._points.pop(key, None)
+            if old is not None:
+                self._discard(key, old[2])
+
+    def _discard(self, key, cell):
+        members = self._cells.get(cell)
+        if members is not None:
+            members.discard(key)
+            if not members:
+                del self._cells[cell]
+
+    def position(self, key):
+        point = self._points.get(key)
+        return (point[0], point[1]) if point is not None else None
+
+    def query_bbox(self, south, west, north, east, limit=None):
+        south, north = max(-90.0, min(south, north)), min(90.0, max(south, north))
+        if east - west >= 360.0:
+            ranges = [(-180.0, 180.0)]
+        else:
+            west, east = normalize_longitude(west), normalize_longitude(east)
+            ranges = [(west, east)] if west <= east else [(west, 180.0), (-180.0, east)]
+        with self._lock:
+            self._queries += 1
+            results = []
+            for lo, hi in ranges:
+                self._collect(south, lo, north, hi, results, limit)
+                if limit is not None and len(results) >= limit:
+                    break
+            return results
+
+    def _collect(self, south, west, north, east, results, limit):
+        row_lo, col_lo = self._cell(south, west)
+        row_hi, col_hi = self._cell(north, east)
+        span = (row_hi - row_lo + 1) * (col_hi - col_lo + 1)
+        if span > len(self._cells):
+            cells = [
+                members for (row, col), members in self._cells.items()
+                if row_lo <= row <= row_hi and col_lo <= col <= col_hi
+            ]
+        else:
+            cells = [
+                self._cells[(row, col)]
+                for row in range(row_lo, row_hi + 1)
+                for col in range(col_lo, col_hi + 1)
+                if (row, col) in self._cells
+            ]
+        for members in cells:
+            for key in members:
+                lat, lon, _ = self._points[key]
+                if south <= lat <= north and west <= lon <= east:
+                    results.append((key, lat, lon))
+                    if limit is not None and len(results) >= limit:
+                        return
+
+    def query_radius(self, lat, lon, radius_m, limit=None):
+        dlat = radius_m / METERS_PER_DEGREE
+        coslat = math.cos(math.radians(lat))
+        dlon = 360.0 if coslat < 1e-6 else min(360.0, dlat / coslat)
+        candidates = self.query_bbox(lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+        results = []
+        for key, plat, plon in candidates:
+            distance = haversine(lat, lon, plat, plon)
+            if distance <= radius_m:
+                results.append((key, plat, plon, distance))
+        results.sort(key=lambda item: item[3])
+        return results[:limit] if limit is not None else results
+
+    def __len__(self):
+        return len(self._points)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'points': len(self._points),
+                'cells': len(self._cells),
+                'cellSizeDegrees': self.cell_size,
+                'queries': self._queries,
+                'cellMoves': self._moves
+            }
@@ -6,14 +6,46 @@ function hasValidPosition(node) {
         !isNaN(node.position.longitude);
 }
 
+// Payloads in the compact wire format name fields by id ('#' + base 36
+// index into the table the server sends on connect); '##' escapes a key
+// that really starts with '#'.
+function unpackWire(value, fields) {
+    if (Array.isArray(value)) {
+        return value.map(function(item) { return unpackWire(item, fields); });
+    }
+    if (value === null || typeof value !== 'object') {
+        return value;
+    }
+    var result = {};
+    Object.keys(value).forEach(function(key) {
+        var name = key;
+        if (key.charAt(0) === '#') {
+            name = key.charAt(1) === '#' ? key.slice(1) : (fields[key] || key);
+        }
+        result[name] = unpackWire(value[key], fields);
+    });
+    return result;
+}
+
 $(document).ready(function() {
-    var socket = io();
+    // ?wire=json opts out of the compact format, e.g. to compare traffic.
+    var wireFormat = new URLSearchParams(window.location.search).get('wire') || 'compact';
+    var wireFields = {};
+    var socket = io({ auth: { wire: wireFormat } });
     var currentChannel = 0;
     var nodes = {};
     var messages = {};
+    var messagePages = {};
+    var messageIndex = {};
+    var messageElements = {};
+    var queuedSends = {};
+    var nextClientId = 1;
+    var MESSAGE_PAGE_SIZE = 50;
     var map;
     var markers = {};
-    var messageTimeouts = {};
+    var visibleNodeIds = new Set();
+    var trackLayers = {};
+    var mapFitted = false;
     var discordWebhook = '';
     var myNodeInfo = null;
     var footer = $('.footer-buttons');
@@ -98,6 +130,9 @@ $(document).ready(function() {
             }
 
             messages = typeof initialMessages !== 'undefined' ? initialMessages : {};
+            Object.keys(messages).forEach(function(channel) {
+                indexMessages(messages[channel]);
+            });
             updateMessages();
 
             if (Object.keys(messages).length === 0) {
@@ -115,6 +150,7 @@ $(document).ready(function() {
     $('#debugBtn').click(function() {
         $('#debugContainer').toggle();
         $(this).toggleClass('btn-secondary btn-primary');
+        updateSubscriptions();
         if ($('#debugContainer').is(':visible')) {
             $('html, body').animate({
                 scrollTop: $('#debugContainer').offset().top - 20
@@ -153,8 +189,88 @@ $(document).ready(function() {
         L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
             attribution: '© OpenStreetMap contributors'
         }).addTo(map);
+        map.on('moveend', requestViewportNodes);
+    }
+
+    function requestViewportNodes() {
+        var bounds = map.getBounds();
+        socket.emit('query_nodes_in_view', {
+            bbox: [bounds.getSouth(), bounds.getWest(), bounds.getNorth(), bounds.getEast()]
+        });
+        updateSubscriptions();
+    }
+
+    // Tell the server which rooms this tab needs: the channel on screen,
+    // the node list, the map viewport and the debug stream when it is open.
+    function updateSubscriptions() {
+        var topics = ['nodes'];
+        if ($('#debugContainer').is(':visible')) {
+            topics.push('debug');
+        }
+        var viewport = null;
+        if (map) {
+            var bounds = map.getBounds();
+            viewport = [bounds.getSouth(), bounds.getWest(), bounds.getNorth(), bounds.getEast()];
+        }
+        socket.emit('subscribe', { channels: [currentChannel], topics: topics, viewport: viewport });
+    }
+
+    function fitMapToNodesOnce() {
+        if (mapFitted) return;
+        var bounds = L.latLngBounds();
+        Object.values(nodes).forEach(function(node) {
+            if (hasValidPosition(node)) {
+                bounds.extend(L.latLng(node.position.latitude, node.position.longitude));
+            }
+        });
+        if (bounds.isValid()) {
+            mapFitted = true;
+            map.fitBounds(bounds, { padding: [50, 50] });
+        } else {
+            requestViewportNodes();
+        }
+    }
+
+    function requestTrack(num) {
+        var center = map.getCenter();
+        var metersPerPixel = 40075016.686 * Math.cos(center.lat * Math.PI / 180) / Math.pow(2, map.getZoom() + 8);
+        socket.emit('get_track', { num: num, tolerance: Math.max(1, metersPerPixel * 2) });
+    }
+
+    function clearTrack(num) {
+        if (trackLayers[num]) {
+            map.removeLayer(trackLayers[num]);
+            delete trackLayers[num];
+        }
     }
 
+    socket.on('node_track', function(data) {
+        clearTrack(data.num);
+        if (!markers[data.num] || data.points.length < 2) return;
+        trackLayers[data.num] = L.polyline(data.points.map(function(point) {
+            return [point[0], point[1]];
+        }), { weight: 3, opacity: 0.7 }).addTo(map);
+        logDebugMessage('Track for ' + data.num + ': ' + data.points.length + ' of ' + data.originalPoints + ' points');
+    });
+
+    socket.on('nodes_in_view', function(data) {
+        visibleNodeIds = new Set();
+        data.nodes.forEach(function(item) {
+            var key = String(item.num);
+            visibleNodeIds.add(key);
+            if (!nodes[key]) {
+                nodes[key] = { num: item.num, user: item.name ? { longName: item.name } : undefined };
+            }
+            if (!hasValidPosition(nodes[key])) {
+                nodes[key].position = Object.assign({}, nodes[key].position, {
+                    latitude: item.latitude,
+                    longitude: item.longitude
+                });
+            }
+        });
+        updateMap();
+    });
+
     $('#discordWebhookBtn').click(function() {
             $('#discordWebhookModal').modal('show');
             loadWebhookUrl();
@@ -191,34 +307,31 @@ $(document).ready(function() {
         }
 
     function updateMap() {
-        var bounds = L.latLngBounds();
-        var hasValidPositionNode = false;
-
-        Object.values(nodes).forEach(function(node) {
-            if (hasValidPosition(node)) {
-                var latLng = L.latLng(node.position.latitude, node.position.longitude);
-                bounds.extend(latLng);
-                hasValidPositionNode = true;
+        Object.keys(markers).forEach(function(key) {
+            if (!visibleNodeIds.has(key) || !nodes[key] || !hasValidPosition(nodes[key])) {
+                map.removeLayer(markers[key]);
+                delete markers[key];
+            }
+        });
 
-                if (markers[node.num]) {
-                    markers[node.num].setLatLng(latLng);
-                } else {
-                    var nodeName = ((node.user && node.user.longName) || '') + 
-                                   ((node.user && node.user.shortName) ? ` (${node.user.shortName})` : '');
-                    if (!nodeName.trim()) nodeName = node.num || 'Unknown';
+        visibleNodeIds.forEach(function(key) {
+            var node = nodes[key];
+            if (!node || !hasValidPosition(node)) return;
+            var latLng = L.latLng(node.position.latitude, node.position.longitude);
 
-                    markers[node.num] = L.marker(latLng).addTo(map)
-                        .bindPopup(nodeName);
-                }
-            } else if (markers[node.num]) {
-                map.removeLayer(markers[node.num]);
-                delete markers[node.num];
+            if (markers[key]) {
+                markers[key].setLatLng(latLng);
+            } else {
+                var nodeName = ((node.user && node.user.longName) || '') + 
+                               ((node.user && node.user.shortName) ? ` (${node.user.shortName})` : '');
+                if (!nodeName.trim()) nodeName = node.num || 'Unknown';
+
+                markers[key] = L.marker(latLng).addTo(map)
+                    .bindPopup(nodeName)
+                    .on('popupopen', function() { requestTrack(node.num); })
+                    .on('popupclose', function() { clearTrack(node.num); });
             }
         });
-
-        if (hasValidPositionNode) {
-            map.fitBounds(bounds, { padding: [50, 50] });
-        }
     }
 
 function formatUptime(seconds) {
@@ -363,12 +476,14 @@ function updateNodeInfo() {
 $('#nodeSortSelect').change(updateNodeInfo);
 $('#nodeFilterInput').on('input', updateNodeInfo);
 
-function updateMessages() {
+function updateMessages(keepScroll) {
     var messagesContainer = $('#messagesContainer');
+    var previousHeight = messagesContainer[0].scrollHeight;
+    var previousTop = messagesContainer.scrollTop();
     messagesContainer.empty();
+    messageElements = {};
 
     console.log("Current channel:", currentChannel);
-    console.log("All messages:", messages);
 
     if (!messages || !messages[currentChannel] || !Array.isArray(messages[currentChannel])) {
         console.log("No messages for the current channel");
@@ -376,25 +491,90 @@ function updateMessages() {
     }
 
     messages[currentChannel].forEach(function(msg) {
-        if (!msg || !msg.text) {
-            console.log("Invalid message:", msg);
-            return;  
-        }
-        
-        var messageText;
-        var senderName = msg.sender === 'You' ? getMyNodeName() : msg.sender;
-        var statusDot = msg.sender === 'You' ? 
-            (msg.status === 'pending' ? '🟡' : (msg.status === 'acked' ? '🟢' : '🔴')) : '🟢';
-        
-        messageText = `${statusDot} <strong>${senderName}:</strong><br>${msg.text}<br><small>${new Date(msg.timestamp * 1000).toLocaleString()} (ID: ${msg.packetId})</small>`;
-        
-        messagesContainer.append('<p>' + messageText + '</p><hr>');
+        appendMessageElement(messagesContainer, msg);
     });
 
-    messagesContainer.scrollTop(messagesContainer[0].scrollHeight);
+    if (keepScroll) {
+        messagesContainer.scrollTop(messagesContainer[0].scrollHeight - previousHeight + previousTop);
+    } else {
+        messagesContainer.scrollTop(messagesContainer[0].scrollHeight);
+    }
     console.log('Messages updated for channel ' + currentChannel);
 }
 
+function messageStatusDot(msg) {
+    if (msg.sender !== 'You') {
+        return '🟢';
+    }
+    if (msg.status === 'pending') {
+        return msg.attempt > 1 ? '🟠' : '🟡';
+    }
+    return msg.status === 'acked' ? '🟢' : '🔴';
+}
+
+function appendMessageElement(messagesContainer, msg) {
+    if (!msg || !msg.text) {
+        console.log("Invalid message:", msg);
+        return;
+    }
+    var senderName = msg.sender === 'You' ? getMyNodeName() : msg.sender;
+    var element = $('<p>').html(`<span class="status-dot">${messageStatusDot(msg)}</span> <strong>${senderName}:</strong><br>${msg.text}<br><small>${new Date(msg.timestamp * 1000).toLocaleString()} (ID: ${msg.packetId})</small>`);
+    messagesContainer.append(element).append('<hr>');
+    if (msg.packetId !== undefined && msg.packetId !== null) {
+        messageElements[msg.packetId] = element;
+    }
+}
+
+function indexMessages(list) {
+    list.forEach(function(msg) {
+        if (msg.packetId !== undefined && msg.packetId !== null) {
+            messageIndex[msg.packetId] = msg;
+        }
+    });
+}
+
+function requestMessagePage(channel, before) {
+    var page = messagePages[channel];
+    if (!page) {
+        page = messagePages[channel] = { before: null, hasMore: true, loading: false, older: false };
+    }
+    if (page.loading) {
+        return;
+    }
+    page.loading = true;
+    page.older = !!before;
+    var request = { channel: channel, limit: MESSAGE_PAGE_SIZE };
+    if (before) {
+        request.before = before;
+    }
+    socket.emit('get_messages', request);
+}
+
+function requestOlderMessages() {
+    var page = messagePages[currentChannel];
+    if (page && page.hasMore && !page.loading && page.before) {
+        requestMessagePage(currentChannel, page.before);
+    }
+}
+
+function showChannel(channel) {
+    currentChannel = channel;
+    updateMessages();
+    updateSubscriptions();
+    // Only the visible channel's room is joined, so refresh its latest page.
+    requestMessagePage(channel, null);
+}
+
+$('#messagesContainer').on('scroll', function() {
+    if ($(this).scrollTop() < 50) {
+        requestOlderMessages();
+    }
+});
+
+function getChannelName(channel) {
+    return $('#channelSelect option[value="' + channel + '"]').text() || 'channel ' + channel;
+}
+
 function updateChannelList(channels) {
     var channelSelect = $('#channelSelect');
     channelSelect.empty();
@@ -435,7 +615,14 @@ $('#messageInput').keypress(function(e) {
 $('#sendBtn').click(function() {
     var message = $('#messageInput').val().trim();
     if (message) {
-        socket.emit('send_message', { message: message, channel: currentChannel });
+        var clientId = socket.id + ':' + nextClientId++;
+        queuedSends[clientId] = { position: null, eta: null };
+        socket.emit('send_message', {
+            message: message,
+            channel: currentChannel,
+            clientId: clientId,
+            compress: $('#compressToggle').is(':checked')
+        });
         logDebugMessage('Sending message: "' + message + '" on channel ' + currentChannel);
         $('#messageInput').val('');
     } else {
@@ -445,13 +632,40 @@ $('#sendBtn').click(function() {
 });
 
 $('#channelSelect').change(function() {
-    currentChannel = parseInt($(this).val());
-    updateMessages();
+    showChannel(parseInt($(this).val()));
     logDebugMessage('Switched to channel: ' + currentChannel);
 });
 
+// High-rate server events arrive bundled as one 'batch' frame per flush
+// window; replay them through the regular per-event handlers.
+socket.on('batch', function(data) {
+    data.events.forEach(function(item) {
+        socket.listeners(item[0]).forEach(function(handler) {
+            handler(item[1]);
+        });
+    });
+});
+
+socket.on('wire_format', function(data) {
+    wireFormat = data.format;
+    wireFields = {};
+    (data.fields || []).forEach(function(name, index) {
+        wireFields['#' + index.toString(36)] = name;
+    });
+    logDebugMessage('Wire format: ' + wireFormat);
+});
+
+socket.on('packed', function(frame) {
+    var data = unpackWire(frame[1], wireFields);
+    socket.listeners(frame[0]).forEach(function(handler) {
+        handler(data);
+    });
+});
+
 socket.on('connect', function() {
     socket.emit('get_settings');
+    socket.emit('get_nodes');
+    updateSubscriptions();
     logDebugMessage('Socket.IO connected to server');
 });
 
@@ -481,9 +695,16 @@ socket.on('serial_disconnected', function() {
     $('#nodeInfo').empty();
     nodes = {};
     messages = {};
+    messagePages = {};
+    messageIndex = {};
+    messageElements = {};
 });
 
 socket.on('serial_error', function(data) {
+    if (data.clientId && queuedSends[data.clientId]) {
+        delete queuedSends[data.clientId];
+        updateSendQueueStatus();
+    }
     logDebugMessage('Serial error: ' + JSON.stringify(data));
     alert('Serial error: ' + data.message);
 });
@@ -517,27 +738,83 @@ socket.on('new_message', function(data) {
     if (!messages[messageData.channel]) {
         messages[messageData.channel] = [];
     }
-    
-    var existingMessageIndex = messages[messageData.channel].findIndex(function(msg) {
-        return msg.packetId === messageData.packetId;
-    });
-    
-    if (existingMessageIndex !== -1) {
-        messages[messageData.channel][existingMessageIndex] = messageData;
+
+    var existing = messageIndex[messageData.packetId];
+    if (existing) {
+        Object.assign(existing, messageData);
     } else {
         messages[messageData.channel].push(messageData);
+        indexMessages([messageData]);
     }
-    
+
     if (messageData.channel === currentChannel) {
-        updateMessages();
+        if (existing) {
+            updateMessages();
+        } else {
+            var messagesContainer = $('#messagesContainer');
+            appendMessageElement(messagesContainer, messageData);
+            messagesContainer.scrollTop(messagesContainer[0].scrollHeight);
+        }
         console.log("Sending message to Discord webhook:", messageData);
         sendToDiscordWebhook(messageData);
     }
 });
 
+function updateSendQueueStatus() {
+    var ids = Object.keys(queuedSends);
+    var status = $('#sendQueueStatus');
+    if (ids.length === 0) {
+        status.text('');
+        return;
+    }
+    var next = ids.map(function(id) { return queuedSends[id]; }).reduce(function(best, entry) {
+        return entry.position !== null && (best.position === null || entry.position < best.position) ? entry : best;
+    });
+    var text = ids.length + ' message' + (ids.length > 1 ? 's' : '') + ' queued';
+    if (next.position !== null) {
+        text += ', next at position ' + next.position + ' (~' + Math.ceil(next.eta) + 's)';
+    }
+    status.text(text);
+}
+
+socket.on('send_queued', function(data) {
+    if (!queuedSends[data.clientId]) {
+        return;
+    }
+    queuedSends[data.clientId] = { position: data.position, eta: data.eta };
+    updateSendQueueStatus();
+});
+
+function restoreDraft(data) {
+    if (data.text && !$('#messageInput').val()) {
+        $('#messageInput').val(data.text);
+    }
+}
+
+socket.on('send_rejected', function(data) {
+    delete queuedSends[data.clientId];
+    updateSendQueueStatus();
+    logDebugMessage('Message rejected: ' + data.reason);
+    restoreDraft(data);
+    alert('Message not sent: ' + data.reason);
+});
+
+socket.on('send_throttled', function(data) {
+    delete queuedSends[data.clientId];
+    updateSendQueueStatus();
+    var reason = data.reason + (data.retryAfter ? ', try again in ' + Math.ceil(data.retryAfter) + 's' : '');
+    logDebugMessage('Message throttled: ' + reason);
+    $('#sendQueueStatus').text('Not sent: ' + reason);
+    restoreDraft(data);
+});
+
 socket.on('message_sent', function(data) {
+    if (data.clientId && queuedSends[data.clientId]) {
+        delete queuedSends[data.clientId];
+        updateSendQueueStatus();
+    }
     if (data.status === 'success') {
-        logDebugMessage('Message sent successfully');
+        logDebugMessage('Message sent successfully' + (data.compressed ? ' (compressed)' : ''));
         var sentMessage = {
             sender: 'You',
             text: data.message, 
@@ -550,11 +827,12 @@ socket.on('message_sent', function(data) {
             messages[data.channel] = [];
         }
         messages[data.channel].push(sentMessage);
-        updateMessages();
-        
-        messageTimeouts[data.packetId] = setTimeout(function() {
-            updateMessageStatus(data.packetId, 'timeout');
-        }, 60000);
+        indexMessages([sentMessage]);
+        if (data.channel === currentChannel) {
+            var messagesContainer = $('#messagesContainer');
+            appendMessageElement(messagesContainer, sentMessage);
+            messagesContainer.scrollTop(messagesContainer[0].scrollHeight);
+        }
     } else {
         logDebugMessage('Error sending message: ' + data.message);
     }
@@ -576,27 +854,112 @@ socket.on('node_updated', function(data) {
             updateMyNodeInfo(data);
         }
         
-        updateNodeInfo();
-        updateMap();
+        scheduleNodeRender();
     });
 
-socket.on('message_ack', function(data) {
-    logDebugMessage('ACK received for packet ID: ' + data.packetId);
-    if (messageTimeouts[data.packetId]) {
-        clearTimeout(messageTimeouts[data.packetId]);
-        delete messageTimeouts[data.packetId];
+socket.on('all_nodes', function(data) {
+    nodes = data.nodes || {};
+    scheduleNodeRender();
+    fitMapToNodesOnce();
+});
+
+function mergeNodeChanges(target, changes) {
+    Object.keys(changes).forEach(function(key) {
+        var value = changes[key];
+        if (value && typeof value === 'object' && !Array.isArray(value)) {
+            if (!target[key] || typeof target[key] !== 'object') {
+                target[key] = {};
+            }
+            mergeNodeChanges(target[key], value);
+        } else {
+            target[key] = value;
+        }
+    });
+}
+
+socket.on('node_delta', function(data) {
+    var node = nodes[data.num];
+    var currentVersion = node ? (node.version || 0) : 0;
+    if (currentVersion !== data.baseVersion) {
+        logDebugMessage('Node ' + data.num + ' out of sync (have v' + currentVersion + ', delta from v' + data.baseVersion + '), requesting resync');
+        socket.emit('resync_nodes', { ids: [data.num] });
+        return;
+    }
+    if (!node) {
+        node = nodes[data.num] = { num: data.num };
+    }
+    mergeNodeChanges(node, data.changes);
+    node.version = data.version;
+    if (data.changes.position && hasValidPosition(node) &&
+        map.getBounds().contains(L.latLng(node.position.latitude, node.position.longitude))) {
+        visibleNodeIds.add(String(data.num));
+    }
+    scheduleNodeRender();
+});
+
+socket.on('node_merged', function(data) {
+    logDebugMessage('Node ' + data.from + ' merged into ' + data.into);
+    if (markers[data.from]) {
+        map.removeLayer(markers[data.from]);
+        delete markers[data.from];
+    }
+    delete nodes[data.from];
+    socket.emit('resync_nodes', { ids: [data.into] });
+});
+
+socket.on('node_removed', function(data) {
+    if (markers[data.num]) {
+        map.removeLayer(markers[data.num]);
+        delete markers[data.num];
     }
+    delete nodes[data.num];
+    scheduleNodeRender();
+});
+
+var nodeRenderTimer = null;
+
+function scheduleNodeRender() {
+    if (nodeRenderTimer) return;
+    nodeRenderTimer = setTimeout(function() {
+        nodeRenderTimer = null;
+        updateNodeInfo();
+    }, 250);
+}
+
+socket.on('message_ack', function(data) {
+    logDebugMessage('ACK received for packet ID: ' + data.packetId +
+        (data.attempt ? ' on attempt ' + data.attempt : '') +
+        (typeof data.rtt === 'number' ? ' (' + data.rtt.toFixed(1) + 's round trip)' : ''));
     updateMessageStatus(data.packetId, 'acked');
 });
 
 socket.on('message_ack_timeout', function(data) {
-    logDebugMessage('ACK timeout for packet ID: ' + data.packetId);
-    if (messageTimeouts[data.packetId]) {
-        updateMessageStatus(data.packetId, 'timeout');
-        delete messageTimeouts[data.packetId];
+    logDebugMessage('ACK timeout for packet ID: ' + data.packetId +
+        (data.attempts ? ' after ' + data.attempts + ' attempts' : ''));
+    updateMessageStatus(data.packetId, 'timeout');
+});
+
+socket.on('message_retry', function(data) {
+    logDebugMessage('No ACK for packet ID ' + data.packetId + ' (' + data.reason + '), attempt ' +
+        data.attempt + '/' + data.maxAttempts + ' in ' + data.delay + 's');
+    var msg = messageIndex[data.packetId];
+    if (msg) {
+        msg.attempt = data.attempt;
+        updateMessageStatus(data.packetId, 'pending');
     }
 });
 
+['neighbor_info', 'traceroute', 'range_test', 'store_forward', 'position_update'].forEach(function(event) {
+    socket.on(event, function(data) {
+        logDebugMessage(event + ': ' + JSON.stringify(data));
+    });
+});
+
+socket.on('message_retry_sent', function(data) {
+    logDebugMessage('Resent packet ID ' + data.packetId + ' as ' + data.retryPacketId +
+        ' (attempt ' + data.attempt + '/' + data.maxAttempts + ')');
+});
+
 $(document).ready(function() {
     $('#settingsForm').on('submit', function(event) {
         event.preventDefault();
@@ -709,34 +1072,135 @@ function updateSendButtonTooltip() {
 }
 
 function updateMessageStatus(packetId, status) {
-    Object.keys(messages).forEach(function(channel) {
-        messages[channel].forEach(function(msg) {
-            if (msg.packetId === packetId) {
-                msg.status = status;
-                logDebugMessage('Message status updated to ' + status + ' for packet ID: ' + packetId);
+    var msg = messageIndex[packetId];
+    if (!msg || msg.status === 'acked') {
+        return;
+    }
+    msg.status = status;
+    logDebugMessage('Message status updated to ' + status + ' for packet ID: ' + packetId);
+    var element = messageElements[packetId];
+    if (element) {
+        element.find('.status-dot').text(messageStatusDot(msg));
+    }
+}
+
+    socket.on('messages_page', function(data) {
+        var page = messagePages[data.channel] || { before: null, hasMore: true, older: false };
+        var received = data.messages || [];
+        var current = messages[data.channel] || [];
+        indexMessages(received);
+        if (page.older) {
+            messages[data.channel] = received.concat(current);
+        } else {
+            // Keep anything that arrived live after the newest stored message.
+            var seen = new Set(received.map(function(msg) { return msg.packetId; }));
+            messages[data.channel] = received.concat(current.filter(function(msg) {
+                return !msg.id && !seen.has(msg.packetId);
+            }));
+        }
+        if (!page.older || received.length > 0) {
+            page.before = data.before;
+        }
+        page.hasMore = data.hasMore;
+        page.loading = false;
+        messagePages[data.channel] = page;
+        if (data.channel === currentChannel) {
+            updateMessages(page.older);
+        }
+    });
+
+    socket.on('messages_reset', function() {
+        messages = {};
+        messagePages = {};
+        messageIndex = {};
+        requestMessagePage(currentChannel, null);
+    });
+
+    var searchTimer = null;
+    var searchRequest = null;
+
+    function parseSearchInput(value) {
+        var request = { q: [], limit: 20, offset: 0 };
+        value.split(/\s+/).forEach(function(term) {
+            if (term.indexOf('from:') === 0 && term.length > 5) {
+                request.sender = term.slice(5);
+            } else if (term.indexOf('ch:') === 0 && term.length > 3) {
+                request.channel = parseInt(term.slice(3));
+            } else if (term) {
+                request.q.push(term);
             }
         });
-    });
-    updateMessages();
-}
+        request.q = request.q.join(' ');
+        return request;
+    }
 
-    function requestAllMessages() {
-        socket.emit('get_messages');
+    function runSearch(offset) {
+        searchRequest.offset = offset;
+        socket.emit('search_messages', searchRequest);
     }
 
-    socket.on('all_messages', function(data) {
-        console.log("All messages received:", data);
-        messages = data.messages || {};
-        updateMessages();
+    $('#messageSearchInput').on('input', function() {
+        var value = $(this).val().trim();
+        clearTimeout(searchTimer);
+        if (!value) {
+            searchRequest = null;
+            $('#searchResults').hide().empty();
+            return;
+        }
+        searchTimer = setTimeout(function() {
+            searchRequest = parseSearchInput(value);
+            runSearch(0);
+        }, 300);
+    });
+
+    $('#searchResults').on('click', '.search-more', function() {
+        if (searchRequest) {
+            runSearch(searchRequest.offset + searchRequest.limit);
+        }
     });
 
-    $('#channelSelect').change(function() {
-        currentChannel = parseInt($(this).val());
-        updateMessages();
-        console.log('Switched to channel: ' + currentChannel);
+    $('#searchResults').on('click', '.search-older', function() {
+        if (searchRequest) {
+            searchRequest.before = $(this).data('before');
+            runSearch(0);
+        }
+    });
+
+    socket.on('search_results', function(data) {
+        var container = $('#searchResults');
+        if (!searchRequest || data.query !== searchRequest.q) {
+            return;
+        }
+        if (data.error) {
+            container.empty().append($('<p>').text(data.error)).show();
+            return;
+        }
+        if (!data.offset && !searchRequest.before) {
+            container.empty();
+        }
+        container.find('.search-more, .search-older').remove();
+        data.results.forEach(function(msg) {
+            var item = $('<p>');
+            item.append($('<strong>').text((msg.sender || msg.senderNum) + ' on ' + getChannelName(msg.channel) + ':'));
+            item.append('<br>').append(document.createTextNode(msg.text));
+            item.append('<br>').append($('<small>').text(new Date(msg.timestamp * 1000).toLocaleString()));
+            container.append(item).append('<hr>');
+        });
+        if (!data.offset && !searchRequest.before && data.results.length === 0) {
+            container.append('<p>No matching messages</p>');
+        }
+        if (data.hasMore) {
+            container.append('<button class="btn btn-sm btn-secondary search-more">More results</button>');
+        } else if (data.truncated) {
+            // Only the newest matches are ranked; older ones come in further windows.
+            container.append($('<button class="btn btn-sm btn-secondary search-older">Search older messages</button>')
+                .data('before', data.before));
+        }
+        container.show();
+        logDebugMessage('Search "' + data.query + '" returned ' + data.results.length + ' results in ' + data.elapsedMs + ' ms');
     });
 
-    socket.emit('get_messages');
+    requestMessagePage(currentChannel, null);
 });
 
 
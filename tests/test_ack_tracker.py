@@ -0,0 +1,72 @@
+from ack_tracker import AckTracker
+from conftest import FakeClock
+
+
+def make_tracker(timeout=10):
+    fired = []
+    clock = FakeClock()
+    tracker = AckTracker(timeout=timeout, on_timeout=lambda packet_id, context: fired.append((packet_id, context)),
+                         clock=clock)
+    return tracker, clock, fired
+
+
+def test_timeout_fires_once():
+    tracker, clock, fired = make_tracker()
+    tracker.track(1, context='hello')
+    clock.advance(5)
+    assert tracker.expire() == 0
+    clock.advance(5)
+    assert tracker.expire() == 1
+    clock.advance(60)
+    assert tracker.expire() == 0
+    assert fired == [(1, 'hello')]
+    assert tracker.stats()['timeouts'] == 1
+
+
+def test_late_ack_after_timeout_is_ignored():
+    tracker, clock, fired = make_tracker()
+    tracker.track(1)
+    clock.advance(10)
+    tracker.expire()
+    assert tracker.ack(1) is None
+    stats = tracker.stats()
+    assert (stats['acked'], stats['lateOrUnknownAcks']) == (0, 1)
+
+
+def test_ack_returns_rtt_and_updates_stats():
+    tracker, clock, fired = make_tracker()
+    tracker.track(1)
+    clock.advance(1.5)
+    assert tracker.ack(1) == 1.5
+    clock.advance(20)
+    assert tracker.expire() == 0
+    assert fired == []
+    stats = tracker.stats()
+    assert (stats['inFlight'], stats['acked']) == (0, 1)
+    assert stats['rtt']['samples'] == 1
+    assert stats['rtt']['p50Ms'] == stats['rtt']['smoothedMs'] == 1500.0
+
+
+def test_cancelled_entries_are_compacted_out_of_the_heap():
+    tracker, clock, fired = make_tracker()
+    for packet_id in range(100):
+        tracker.track(packet_id)
+    for packet_id in range(90):
+        assert tracker.cancel(packet_id)
+    assert not tracker.cancel(0)
+    assert tracker.stats()['heapSize'] == 100
+    tracker.expire()
+    stats = tracker.stats()
+    assert (stats['heapSize'], stats['inFlight'], stats['cancelled']) == (10, 10, 90)
+
+
+def test_packet_id_can_be_tracked_again_after_cancel():
+    tracker, clock, fired = make_tracker()
+    tracker.track(7, context='first')
+    tracker.cancel(7)
+    tracker.track(7, timeout=20, context='second')
+    clock.advance(15)
+    assert tracker.expire() == 0
+    clock.advance(5)
+    assert tracker.expire() == 1
+    assert fired == [(7, 'second')]
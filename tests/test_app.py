@@ -0,0 +1,75 @@
+import pytest
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    pytest.importorskip('flask_socketio')
+    pytest.importorskip('meshtastic')
+    # Importing app opens its SQLite files relative to the working directory.
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(tmp_path_factory.mktemp('app'))
+        import app
+        yield app
+
+
+def test_telemetry_query_rejects_bad_ranges(app):
+    app.node_store.update(0x1234, {'user': {'longName': 'Telemetry node'}})
+    with pytest.raises(ValueError):
+        app.get_node_telemetry(0x1234, {'start': '200', 'end': '100'})
+    with pytest.raises(ValueError):
+        app.get_node_telemetry(0x1234, {'start': '100', 'end': '200', 'resolution': '0'})
+    with pytest.raises(ValueError):
+        app.get_node_telemetry(0x1234, {'start': '100', 'end': '200', 'resolution': '-60'})
+    result = app.get_node_telemetry(0x1234, {'start': '100', 'end': '200', 'resolution': '10'})
+    assert result['resolution'] == 10
+
+
+def test_node_query_limit_is_clamped(app):
+    for offset, num in enumerate((0x2001, 0x2002, 0x2003)):
+        app.spatial_index.update(num, 50.0 + offset * 0.001, 8.0)
+    area = {'lat': '50.0', 'lon': '8.0', 'radius': '1000'}
+    assert [node['num'] for node in app.query_nodes({**area, 'limit': '-1'})] == [0x2001]
+    assert len(app.query_nodes({**area, 'limit': '0'})) == 1
+    assert len(app.query_nodes(area)) == 3
+
+
+def test_stored_messages_are_decoded_and_need_rx_time(app):
+    class Interface:
+        nodesByNum = {1: {'messages': [
+            {'id': 1, 'from': 1, 'payload': b'caf\xc3\xa9 \xff', 'rxTime': 100},
+            {'id': 2, 'from': 1, 'payload': 'no time'}
+        ]}}
+    messages = app.fetch_stored_messages(Interface())
+    assert [message['packetId'] for message in messages] == [1]
+    assert messages[0]['text'] == 'café �'
+
+
+def test_only_marked_private_payloads_count_as_chat(app):
+    packed = app.text_compression.compress('anyone there? copy that, roger that, over')
+    chat = {'from': 1, 'decoded': {'portnum': 'PRIVATE_APP', 'payload': packed}}
+    other = {'from': 1, 'decoded': {'portnum': 'PRIVATE_APP', 'payload': b'\x01\x02\x03'}}
+    assert app.classify_packet(chat) == (app.PRIORITY_HIGH, None)
+    assert app.classify_packet(other) == (app.PRIORITY_NORMAL, None)
+
+
+def emitted(app, monkeypatch):
+    sent = []
+    monkeypatch.setattr(app.socketio, 'emit', lambda event, data, to=None: sent.append((event, to)))
+    return sent
+
+
+def test_broadcast_goes_out_as_json_without_registered_clients(app, monkeypatch):
+    sent = emitted(app, monkeypatch)
+    monkeypatch.setattr(app, 'client_formats', {})
+    app.emit_frame('new_message', {'text': 'hi'}, None)
+    assert sent == [('new_message', app.wire_room(app.BROADCAST_ROOM, app.WIRE_JSON))]
+
+
+def test_broadcast_fans_out_to_registered_formats(app, monkeypatch):
+    sent = emitted(app, monkeypatch)
+    monkeypatch.setattr(app, 'client_formats', {'sid1': app.WIRE_COMPACT})
+    app.emit_frame('new_message', {'text': 'hi'}, None)
+    assert sorted(sent) == sorted([
+        ('new_message', app.wire_room(app.BROADCAST_ROOM, app.WIRE_JSON)),
+        ('packed', app.wire_room(app.BROADCAST_ROOM, app.WIRE_COMPACT))
+    ])
@@ -0,0 +1,43 @@
+import zlib
+
+import pytest
+
+pytest.importorskip('meshtastic')
+
+from compression import (MARKER, MAX_TEXT_BYTES, SHARED_DICTIONARY, CompressionStats, compress_text,
+                         decompress_text, is_compressed)
+
+
+def test_round_trip():
+    text = 'Battery voltage is fine, signal is loud and clear from the summit. Over and out.'
+    packed = compress_text(text)
+    assert packed.startswith(MARKER)
+    assert len(packed) < len(text.encode('utf-8'))
+    assert decompress_text(packed) == text
+
+
+def test_no_gain_is_sent_plain():
+    stats = CompressionStats()
+    assert stats.compress('ok') is None
+    assert stats.stats()['skippedNoGain'] == 1
+
+
+def test_marker_is_required():
+    packed = compress_text('anyone there? copy that, roger that, over')
+    assert is_compressed(packed)
+    assert is_compressed(bytearray(packed))
+    assert not is_compressed(packed[len(MARKER):])
+    assert not is_compressed(b'\xc7\x02' + packed[len(MARKER):])
+    assert not is_compressed(packed.decode('latin-1'))
+
+
+def test_oversized_payload_is_not_expanded():
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, SHARED_DICTIONARY)
+    bomb = MARKER + compressor.compress(b'a' * 10 ** 6) + compressor.flush()
+    assert decompress_text(bomb) is None
+    stats = CompressionStats()
+    assert stats.decompress(bomb) is None
+    assert stats.decompress(MARKER + b'\xff\xff') is None
+    assert stats.stats()['errors'] == 2
+    text = 'x' * MAX_TEXT_BYTES
+    assert decompress_text(compress_text(text)) == text
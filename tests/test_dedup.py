@@ -0,0 +1,59 @@
+from conftest import FakeClock
+from dedup import DuplicateFilter
+
+
+def test_repeat_within_ttl_is_a_duplicate():
+    clock = FakeClock()
+    dedup = DuplicateFilter(max_entries=10, ttl=60, clock=clock)
+    assert dedup.seen(('!a', 1)) is False
+    clock.advance(59)
+    assert dedup.seen(('!a', 1)) is True
+
+
+def test_entry_expires_after_ttl():
+    clock = FakeClock()
+    dedup = DuplicateFilter(max_entries=10, ttl=60, clock=clock)
+    dedup.seen(('!a', 1))
+    clock.advance(60)
+    assert dedup.seen(('!a', 1)) is False
+    assert dedup.stats()['expired'] == 1
+
+
+def test_hit_refreshes_age():
+    clock = FakeClock()
+    dedup = DuplicateFilter(max_entries=10, ttl=60, clock=clock)
+    dedup.seen(('!a', 1))
+    clock.advance(40)
+    assert dedup.seen(('!a', 1)) is True
+    clock.advance(40)
+    assert dedup.seen(('!a', 1)) is True
+
+
+def test_expiry_only_drops_stale_entries():
+    clock = FakeClock()
+    dedup = DuplicateFilter(max_entries=10, ttl=60, clock=clock)
+    dedup.seen(('!a', 1))
+    clock.advance(30)
+    dedup.seen(('!a', 2))
+    clock.advance(31)
+    assert dedup.seen(('!a', 2)) is True
+    assert dedup.seen(('!a', 1)) is False
+
+
+def test_capacity_evicts_least_recently_seen():
+    clock = FakeClock()
+    dedup = DuplicateFilter(max_entries=2, ttl=600, clock=clock)
+    dedup.seen('a')
+    dedup.seen('b')
+    dedup.seen('a')
+    dedup.seen('c')
+    assert len(dedup) == 2
+    assert dedup.seen('a') is True
+    assert dedup.seen('b') is False
+    assert dedup.stats()['evicted'] >= 1
+
+
+def test_same_packet_id_from_different_senders_is_not_a_duplicate():
+    dedup = DuplicateFilter(clock=FakeClock())
+    assert dedup.seen(('!a', 7)) is False
+    assert dedup.seen(('!b', 7)) is False
@@ -0,0 +1,65 @@
+import pytest
+
+pytest.importorskip('meshtastic')
+
+from dispatch import PacketHandlerRegistry, PacketView
+
+
+def packet(portnum, **fields):
+    return PacketView(dict(fields, decoded={'portnum': portnum}))
+
+
+def test_handlers_register_by_name_or_number():
+    registry = PacketHandlerRegistry()
+    seen = []
+
+    @registry.on('TEXT_MESSAGE_APP')
+    def on_text(view):
+        seen.append(('text', view.packet_id))
+
+    registry.register(3, lambda view: seen.append(('position', view.packet_id)))
+    assert registry.portnums() == ['POSITION_APP', 'TEXT_MESSAGE_APP']
+    assert registry.handler_for(1) is on_text
+    assert registry.dispatch(packet(1, id=7))
+    assert registry.dispatch(packet('POSITION_APP', id=8))
+    assert seen == [('text', 7), ('position', 8)]
+    assert registry.unregister('TEXT_MESSAGE_APP') is on_text
+    assert not registry.dispatch(packet('TEXT_MESSAGE_APP'))
+
+
+def test_fallback_takes_unhandled_portnums():
+    registry = PacketHandlerRegistry()
+    seen = []
+    registry.set_fallback(lambda view: seen.append(view.portnum))
+    assert registry.dispatch(packet('RANGE_TEST_APP'))
+    assert seen == ['RANGE_TEST_APP']
+    assert registry.stats.snapshot()[PacketHandlerRegistry.UNHANDLED]['count'] == 1
+
+
+def test_failing_handler_does_not_stop_dispatch():
+    registry = PacketHandlerRegistry()
+    seen = []
+
+    @registry.on('TEXT_MESSAGE_APP')
+    def on_text(view):
+        if view.packet_id == 1:
+            raise ValueError('bad packet')
+        seen.append(view.packet_id)
+
+    assert registry.dispatch(packet('TEXT_MESSAGE_APP', id=1))
+    assert registry.dispatch(packet('TEXT_MESSAGE_APP', id=2))
+    assert seen == [2]
+    stats = registry.stats.snapshot()['TEXT_MESSAGE_APP']
+    assert (stats['count'], stats['errors']) == (2, 1)
+
+
+def test_stats_count_per_portnum_and_reset():
+    registry = PacketHandlerRegistry()
+    registry.register('TELEMETRY_APP', lambda view: None)
+    for _ in range(3):
+        registry.dispatch(packet('TELEMETRY_APP'))
+    stats = registry.stats.snapshot()['TELEMETRY_APP']
+    assert stats['count'] == 3
+    assert stats['maxMs'] >= stats['avgMs'] >= 0
+    registry.stats.reset()
+    assert registry.stats.snapshot() == {}
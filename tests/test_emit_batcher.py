@@ -0,0 +1,63 @@
+from emit_batcher import EmitBatcher, latest
+
+ROOMS = {None: ['a', 'b', 'c'], 'channel:0': ['a', 'b'], 'nodes': ['a'], 'c': ['c']}
+
+
+def make_batcher(recipients=None, merge_rules=None):
+    frames = []
+    batcher = EmitBatcher(lambda event, data, to: frames.append((event, data, to)), window=1,
+                          merge_rules=merge_rules, recipients=recipients)
+    return batcher, frames
+
+
+def test_one_frame_per_target_without_recipients():
+    batcher, frames = make_batcher()
+    batcher.emit('x', 1)
+    batcher.emit('y', 2, to='channel:0')
+    batcher.emit('z', 3)
+    assert batcher.flush() == 2
+    assert frames == [('batch', {'events': [['x', 1], ['z', 3]]}, None),
+                      ('batch', {'events': [['y', 2]]}, 'channel:0')]
+
+
+def test_one_frame_per_client_in_emit_order():
+    batcher, frames = make_batcher(recipients=lambda to: ROOMS.get(to, [to]))
+    batcher.emit('e1', 1)
+    batcher.emit('e2', 2, to='channel:0')
+    batcher.emit('e3', 3, to='nodes')
+    batcher.emit('e4', 4)
+    batcher.emit('e5', 5, to='c')
+    assert batcher.flush() == 3
+    by_client = {tuple(to): data['events'] for _, data, to in frames}
+    assert by_client == {
+        ('a',): [['e1', 1], ['e2', 2], ['e3', 3], ['e4', 4]],
+        ('b',): [['e1', 1], ['e2', 2], ['e4', 4]],
+        ('c',): [['e1', 1], ['e4', 4], ['e5', 5]]
+    }
+
+
+def test_clients_in_the_same_rooms_share_a_frame():
+    batcher, frames = make_batcher(recipients=lambda to: ROOMS.get(to, [to]))
+    batcher.emit('e1', 1, to='channel:0')
+    assert batcher.flush() == 1
+    assert frames == [('batch', {'events': [['e1', 1]]}, ['a', 'b'])]
+
+
+def test_merge_rules_combine_within_a_window():
+    rules = {'position_update': (lambda data: data['sender'], latest)}
+    batcher, frames = make_batcher(merge_rules=rules)
+    batcher.emit('position_update', {'sender': 1, 'lat': 1})
+    batcher.emit('position_update', {'sender': 2, 'lat': 5})
+    batcher.emit('position_update', {'sender': 1, 'lat': 2})
+    batcher.flush()
+    assert frames[0][1]['events'] == [['position_update', {'sender': 1, 'lat': 2}],
+                                      ['position_update', {'sender': 2, 'lat': 5}]]
+    assert batcher.stats()['merged'] == 1
+
+
+def test_zero_window_sends_immediately():
+    frames = []
+    batcher = EmitBatcher(lambda event, data, to: frames.append((event, data, to)), window=0)
+    batcher.emit('x', 1, to='room')
+    assert frames == [('x', 1, 'room')]
+    assert batcher.flush() == 0
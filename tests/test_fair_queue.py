@@ -0,0 +1,98 @@
+from conftest import FakeClock
+from send_queue import ClientQuota, FairQueue, OutboundJob
+
+
+def job(job_id, sid, cost=1.0):
+    return OutboundJob(job_id, 0, {}, sid, cost, 0)
+
+
+def drain(queue, count=None):
+    served = []
+    while queue and (count is None or len(served) < count):
+        served.append(queue.popleft())
+    return served
+
+
+def test_flooding_client_does_not_starve_another():
+    queue = FairQueue(quantum=1.0)
+    for i in range(10):
+        queue.append(job(i, 'flood'))
+    queue.append(job(100, 'quiet'))
+    served = [j.sid for j in drain(queue, 2)]
+    assert 'quiet' in served
+
+
+def test_clients_alternate_with_equal_costs():
+    queue = FairQueue(quantum=1.0)
+    for i in range(3):
+        queue.append(job(i, 'a'))
+        queue.append(job(10 + i, 'b'))
+    assert [j.sid for j in drain(queue)] == ['a', 'b'] * 3
+
+
+def test_fairness_is_measured_in_airtime():
+    queue = FairQueue(quantum=1.0)
+    for i in range(40):
+        queue.append(job(i, 'long', cost=2.0))
+        queue.append(job(100 + i, 'short', cost=0.5))
+    airtime = {'long': 0.0, 'short': 0.0}
+    for served in drain(queue, 30):
+        airtime[served.sid] += served.cost
+    assert abs(airtime['long'] - airtime['short']) <= 2.0
+    assert airtime['long'] > 0 and airtime['short'] > 0
+
+
+def test_job_costlier_than_quantum_is_served_eventually():
+    queue = FairQueue(quantum=0.25)
+    queue.append(job(1, 'a', cost=1.0))
+    assert queue.peek().id == 1
+    assert drain(queue)[0].id == 1
+    assert len(queue) == 0 and not queue
+
+
+def test_unused_credit_is_dropped_when_a_flow_empties():
+    queue = FairQueue(quantum=5.0)
+    queue.append(job(1, 'a', cost=1.0))
+    drain(queue)
+    queue.append(job(2, 'a', cost=1.0))
+    queue.append(job(3, 'a', cost=1.0))
+    queue.append(job(4, 'b', cost=1.0))
+    assert queue._flows['a'][1] == 0.0
+
+
+def test_queued_counts_per_client():
+    queue = FairQueue()
+    queue.append(job(1, 'a'))
+    queue.append(job(2, 'a'))
+    queue.append(job(3, 'b'))
+    assert queue.queued('a') == 2
+    assert queue.queued('c') == 0
+    assert [j.id for j in queue] == [1, 3, 2]
+
+
+def test_quota_caps_queued_jobs():
+    quota = ClientQuota(max_queued=2, per_minute=0, clock=FakeClock())
+    assert quota.admit('a', 1)[0] is True
+    allowed, reason, retry_after = quota.admit('a', 2)
+    assert allowed is False and 'limit 2' in reason and retry_after is None
+
+
+def test_quota_bucket_refills_per_minute():
+    clock = FakeClock()
+    quota = ClientQuota(max_queued=0, per_minute=6, burst=2, clock=clock)
+    assert quota.admit('a', 0)[0] is True
+    assert quota.admit('a', 0)[0] is True
+    allowed, _, retry_after = quota.admit('a', 0)
+    assert allowed is False
+    assert retry_after == 10.0
+    assert quota.admit('b', 0)[0] is True
+    clock.advance(10)
+    assert quota.admit('a', 0)[0] is True
+
+
+def test_forgetting_a_client_resets_its_bucket():
+    quota = ClientQuota(max_queued=0, per_minute=1, burst=1, clock=FakeClock())
+    quota.admit('a', 0)
+    assert quota.admit('a', 0)[0] is False
+    quota.forget('a')
+    assert quota.admit('a', 0)[0] is True
@@ -0,0 +1,134 @@
+import threading
+
+import pytest
+
+from ingest import PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL, IngestQueue, IngestWorker
+
+
+def drain(queue):
+    items = []
+    while len(queue):
+        items.append(queue.get(timeout=0))
+    return items
+
+
+def test_drop_oldest_keeps_the_newest_items():
+    queue = IngestQueue(maxsize=3, overflow=IngestQueue.DROP_OLDEST)
+    assert all(queue.put(i) for i in range(5))
+    assert drain(queue) == [2, 3, 4]
+    stats = queue.stats()
+    assert (stats['enqueued'], stats['dropped'], stats['maxDepth']) == (5, 2, 3)
+
+
+def test_drop_newest_refuses_items_when_full():
+    queue = IngestQueue(maxsize=3, overflow=IngestQueue.DROP_NEWEST)
+    assert [queue.put(i) for i in range(5)] == [True, True, True, False, False]
+    assert drain(queue) == [0, 1, 2]
+    assert queue.stats()['dropped'] == 2
+
+
+def test_block_waits_for_room_then_gives_up():
+    queue = IngestQueue(maxsize=1, overflow=IngestQueue.BLOCK, block_timeout=0.05)
+    queue.put('a')
+    assert not queue.put('b')
+    assert queue.stats()['dropped'] == 1
+    taker = threading.Timer(0.05, queue.get)
+    queue.block_timeout = 5
+    taker.start()
+    assert queue.put('c')
+    taker.join()
+    assert drain(queue) == ['c']
+
+
+def test_get_times_out_on_an_empty_queue():
+    assert IngestQueue().get(timeout=0.01) is None
+
+
+def test_invalid_settings_are_rejected():
+    with pytest.raises(ValueError):
+        IngestQueue(overflow='lifo')
+    with pytest.raises(ValueError):
+        IngestQueue(maxsize=0)
+
+
+def test_worker_survives_a_failing_item():
+    queue = IngestQueue()
+    done = threading.Event()
+    seen = []
+
+    def process(item):
+        if item == 'bad':
+            raise ValueError(item)
+        seen.append(item)
+        if item == 'last':
+            done.set()
+
+    worker = IngestWorker(queue, process, poll_interval=0.01)
+    worker.start()
+    for item in ('first', 'bad', 'last'):
+        queue.put(item)
+    assert done.wait(2)
+    worker.stop()
+    assert seen == ['first', 'last']
+    assert queue.stats()['processed'] == 3
+
+
+def classify(item):
+    # item = (priority, key, value)
+    return item[0], item[1]
+
+
+def test_higher_classes_drain_first():
+    queue = IngestQueue(classify=classify)
+    for item in [(PRIORITY_LOW, None, 'l1'), (PRIORITY_NORMAL, None, 'n1'),
+                 (PRIORITY_HIGH, None, 'h1'), (PRIORITY_LOW, None, 'l2'), (PRIORITY_HIGH, None, 'h2')]:
+        queue.put(item)
+    assert [item[2] for item in drain(queue)] == ['h1', 'h2', 'n1', 'l1', 'l2']
+
+
+def test_full_queue_evicts_lower_classes_first():
+    queue = IngestQueue(maxsize=3, classify=classify, overflow=IngestQueue.DROP_NEWEST, shed_threshold=10)
+    queue.put((PRIORITY_NORMAL, None, 'n1'))
+    queue.put((PRIORITY_LOW, None, 'l1'))
+    queue.put((PRIORITY_LOW, None, 'l2'))
+    assert queue.put((PRIORITY_HIGH, None, 'h1'))
+    assert queue.put((PRIORITY_HIGH, None, 'h2'))
+    assert queue.put((PRIORITY_HIGH, None, 'h3'))
+    assert not queue.put((PRIORITY_HIGH, None, 'h4'))
+    classes = queue.stats()['classes']
+    assert (classes['low']['dropped'], classes['normal']['dropped'], classes['high']['dropped']) == (2, 1, 1)
+    assert [item[2] for item in drain(queue)] == ['h1', 'h2', 'h3']
+
+
+def test_drop_oldest_never_evicts_a_higher_class():
+    queue = IngestQueue(maxsize=2, classify=classify, shed_threshold=10)
+    queue.put((PRIORITY_HIGH, None, 'h1'))
+    queue.put((PRIORITY_HIGH, None, 'h2'))
+    assert not queue.put((PRIORITY_LOW, None, 'l1'))
+    assert queue.put((PRIORITY_HIGH, None, 'h3'))
+    assert [item[2] for item in drain(queue)] == ['h2', 'h3']
+    assert queue.stats()['classes']['low']['dropped'] == 1
+
+
+def test_updates_coalesce_in_place_past_the_threshold():
+    queue = IngestQueue(classify=classify, shed_threshold=2)
+    queue.put((PRIORITY_LOW, 'node1', 'pos1'))
+    queue.put((PRIORITY_LOW, 'node1', 'pos2'))
+    assert len(queue) == 2
+    queue.put((PRIORITY_LOW, 'node2', 'pos1'))
+    queue.put((PRIORITY_LOW, 'node2', 'pos2'))
+    queue.put((PRIORITY_LOW, 'node1', 'pos3'))
+    assert len(queue) == 3
+    stats = queue.stats()
+    assert (stats['coalesced'], stats['classes']['low']['coalesced']) == (2, 2)
+    assert [item[2] for item in drain(queue)] == ['pos1', 'pos3', 'pos2']
+
+
+def test_coalescing_stops_below_the_threshold():
+    queue = IngestQueue(classify=classify, shed_threshold=2)
+    for value in ('pos1', 'pos2', 'pos3'):
+        queue.put((PRIORITY_LOW, 'node1', value))
+    assert drain(queue)[-1][2] == 'pos3'
+    queue.put((PRIORITY_LOW, 'node1', 'pos4'))
+    queue.put((PRIORITY_LOW, 'node1', 'pos5'))
+    assert [item[2] for item in drain(queue)] == ['pos4', 'pos5']
@@ -0,0 +1,85 @@
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+
+from loop_bridge import LoopBridge
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def run_patched(body):
+    # gevent runs in a child process so monkey patching stays out of the
+    # test runner.
+    script = textwrap.dedent('''
+        from gevent import monkey
+        monkey.patch_all()
+        import gevent
+        import gevent.event
+        from gevent.monkey import get_original
+        from loop_bridge import LoopBridge
+
+        real_ident = get_original('threading', 'get_ident')
+        bridge = LoopBridge('gevent')
+        bridge.start()
+        main_hub = gevent.get_hub()
+        main_thread = real_ident()
+
+        def from_plain_thread(fn):
+            get_original('_thread', 'start_new_thread')(fn, ())
+    ''') + textwrap.dedent(body)
+    result = subprocess.run([sys.executable, '-c', script], cwd=ROOT, capture_output=True, text=True, timeout=30)
+    assert result.returncode == 0, result.stderr
+
+
+def test_threading_mode_runs_calls_in_place():
+    bridge = LoopBridge()
+    bridge.start()
+    assert bridge.call(lambda a, b: a + b, 1, 2) == 3
+    assert bridge.run_in_thread(lambda: 'radio') == 'radio'
+    assert bridge.stats()['bridged'] == 0
+
+
+def test_call_from_a_plain_thread_runs_on_the_loop():
+    pytest.importorskip('gevent')
+    run_patched('''
+        done = gevent.event.Event()
+        seen = []
+
+        def on_loop(value):
+            seen.append((value, real_ident() == main_thread, gevent.get_hub() is main_hub))
+            done.set()
+
+        def failing():
+            raise ValueError('boom')
+
+        def radio():
+            bridge.call(failing)
+            bridge.call(on_loop, 'packet')
+
+        from_plain_thread(radio)
+        assert done.wait(5)
+        assert seen == [('packet', True, True)], seen
+        stats = bridge.stats()
+        assert (stats['bridged'], stats['errors']) == (2, 1), stats
+    ''')
+
+
+def test_run_in_thread_returns_the_result_or_raises():
+    pytest.importorskip('gevent')
+    run_patched('''
+        assert bridge.run_in_thread(lambda a, b: (a + b, real_ident() != main_thread), 2, 3) == (5, True)
+
+        def failing():
+            raise RuntimeError('no radio')
+
+        try:
+            bridge.run_in_thread(failing)
+        except RuntimeError as e:
+            assert str(e) == 'no radio'
+        else:
+            raise AssertionError('expected RuntimeError')
+        assert bridge.stats()['radioThreads'] == 0
+    ''')
@@ -0,0 +1,90 @@
+import threading
+import time
+from multiprocessing import AuthenticationError
+
+import pytest
+
+from message_bus import MessageBroker, connect_bus, parse_address
+
+KEY = b'test-key'
+
+
+@pytest.fixture
+def broker():
+    broker = MessageBroker(('127.0.0.1', 0), KEY, outbox_size=4)
+    broker.start()
+    broker.address = broker._listener.getsockname()[:2]
+    yield broker
+    broker.stop()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('timed out')
+        time.sleep(0.01)
+
+
+class StalledConnection:
+    # Never delivers anything and blocks on send, like a stuck worker.
+    def __init__(self):
+        self._closed = threading.Event()
+
+    def recv(self):
+        self._closed.wait()
+        raise EOFError()
+
+    def send(self, message):
+        self._closed.wait()
+        raise OSError('closed')
+
+    def close(self):
+        self._closed.set()
+
+
+def test_parse_address_defaults_to_loopback():
+    assert parse_address(':5680') == ('127.0.0.1', 5680)
+    assert parse_address('10.0.0.2:7000') == ('10.0.0.2', 7000)
+
+
+def test_peers_with_the_key_exchange_messages(broker):
+    sender = connect_bus(broker.address, KEY)
+    receiver = connect_bus(broker.address, KEY)
+    wait_for(lambda: broker.stats()['subscribers'] == 2)
+    sender.send({'method': 'emit', 'event': 'x', 'data': [1, 2]})
+    assert receiver.recv() == {'method': 'emit', 'event': 'x', 'data': [1, 2]}
+    sender.close()
+    receiver.close()
+
+
+def test_sender_does_not_get_its_own_message(broker):
+    sender = connect_bus(broker.address, KEY)
+    receiver = connect_bus(broker.address, KEY)
+    wait_for(lambda: broker.stats()['subscribers'] == 2)
+    sender.send({'n': 1})
+    receiver.send({'n': 2})
+    assert receiver.recv() == {'n': 1}
+    assert sender.recv() == {'n': 2}
+    sender.close()
+    receiver.close()
+
+
+def test_wrong_key_is_rejected_before_anything_is_read(broker):
+    with pytest.raises(AuthenticationError):
+        connect_bus(broker.address, b'wrong-key')
+    time.sleep(0.1)
+    assert broker.stats()['subscribers'] == 0
+    assert broker.stats()['relayed'] == 0
+
+
+def test_slow_subscriber_drops_its_oldest_messages(broker):
+    stalled = StalledConnection()
+    broker.attach(stalled)
+    for n in range(10):
+        broker.publish({'n': n})
+    stats = broker.stats()
+    assert stats['maxOutbox'] <= 4
+    assert stats['dropped'] >= 5
+    stalled.close()
+
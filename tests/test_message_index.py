@@ -0,0 +1,63 @@
+from message_index import MessageIndex
+
+
+def test_illegal_transitions_are_refused():
+    index = MessageIndex()
+    index.add({'packetId': 1, 'channel': 0, 'status': 'pending'})
+    assert index.set_status(1, 'acked')[1]
+    message, applied = index.set_status(1, 'pending')
+    assert not applied
+    assert message['status'] == 'acked'
+    assert not index.set_status(1, 'timeout')[1]
+    assert index.set_status(99, 'acked') == (None, False)
+    stats = index.stats()
+    assert (stats['transitions'], stats['rejectedTransitions'], stats['misses']) == (1, 2, 1)
+
+
+def test_late_ack_rescues_a_timed_out_message():
+    index = MessageIndex()
+    index.add({'packetId': 1, 'channel': 0, 'status': 'pending'})
+    assert index.set_status(1, 'timeout')[1]
+    assert index.set_status(1, 'acked')[1]
+    assert index.pending() == []
+
+
+def test_channel_view_drops_the_oldest():
+    index = MessageIndex(per_channel=2)
+    for packet_id in (1, 2, 3):
+        index.add({'packetId': packet_id, 'channel': 0})
+    assert index.get(1) is None
+    assert [m['packetId'] for m in index.recent(0)] == [2, 3]
+    assert index.add({'packetId': 3, 'channel': 0, 'text': 'edited'})['text'] == 'edited'
+    assert len(index.recent(0)) == 2
+    assert index.recent(5) == []
+
+
+def test_retry_alias_resolves_to_the_original():
+    index = MessageIndex()
+    original = index.add({'packetId': 1, 'channel': 0, 'status': 'pending', 'attempts': [2]})
+    index.alias(2, original)
+    assert index.get(2) is original
+    assert index.pending() == [original]
+    assert len(index.recent(0)) == 1
+    assert index.stats()['statuses'] == {'pending': 1}
+
+
+def test_late_ack_on_an_old_attempt_marks_the_original():
+    index = MessageIndex()
+    original = index.add({'packetId': 1, 'channel': 0, 'status': 'pending', 'attempts': [2, 3]})
+    index.alias(2, original)
+    index.alias(3, original)
+    assert index.set_status(3, 'timeout')[1]
+    message, applied = index.set_status(2, 'acked')
+    assert applied and message is original
+    assert original['status'] == 'acked'
+
+
+def test_dropped_message_takes_its_aliases_along():
+    index = MessageIndex(per_channel=1)
+    first = index.add({'packetId': 1, 'channel': 0, 'attempts': [10]})
+    index.alias(10, first)
+    index.add({'packetId': 2, 'channel': 0})
+    assert index.get(1) is None and index.get(10) is None
+    assert len(index) == 1
@@ -0,0 +1,81 @@
+import pytest
+
+from message_store import MessageStore, parse_cursor
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = MessageStore(str(tmp_path / 'messages.db'))
+    yield store
+    store.close()
+
+
+def add(store, count, channel=0, timestamp=None):
+    for i in range(count):
+        store.add_message({'packetId': channel * 1000 + i, 'senderNum': 1, 'channel': channel,
+                           'text': f'message {i}', 'timestamp': timestamp or 100 + i})
+    store.flush()
+
+
+def test_latest_page_is_oldest_first(store):
+    add(store, 5)
+    page = store.page(0, limit=3)
+    assert [m['text'] for m in page['messages']] == ['message 2', 'message 3', 'message 4']
+    assert page['hasMore'] is True
+
+
+def test_walking_back_visits_every_message_once(store):
+    add(store, 23)
+    seen = []
+    page = store.page(0, limit=5)
+    while True:
+        seen[:0] = [m['text'] for m in page['messages']]
+        if not page['hasMore']:
+            break
+        page = store.page(0, before=page['before'], limit=5)
+    assert seen == [f'message {i}' for i in range(23)]
+
+
+def test_same_timestamp_ties_break_on_id(store):
+    add(store, 7, timestamp=500)
+    first = store.page(0, limit=4)
+    older = store.page(0, before=first['before'], limit=4)
+    ids = [m['id'] for m in older['messages'] + first['messages']]
+    assert ids == sorted(ids)
+    assert len(set(ids)) == 7
+    assert older['hasMore'] is False
+
+
+def test_after_returns_newer_messages(store):
+    add(store, 6)
+    first = store.page(0, limit=2)
+    oldest = store.page(0, before=first['before'], limit=10)
+    newer = store.page(0, after=oldest['after'], limit=3)
+    assert [m['text'] for m in newer['messages']] == ['message 4', 'message 5']
+    assert newer['hasMore'] is False
+
+
+def test_pages_stay_in_their_channel(store):
+    add(store, 3, channel=0)
+    add(store, 2, channel=1)
+    assert len(store.page(1, limit=10)['messages']) == 2
+
+
+def test_empty_page_keeps_the_cursor(store):
+    add(store, 2)
+    page = store.page(0, limit=10)
+    empty = store.page(0, before=page['before'], limit=10)
+    assert empty['messages'] == []
+    assert empty['before'] == page['before']
+    assert empty['hasMore'] is False
+
+
+def test_before_and_after_together_are_rejected(store):
+    with pytest.raises(ValueError):
+        store.page(0, before='1:1', after='2:2')
+
+
+def test_cursor_must_be_timestamp_and_id():
+    assert parse_cursor('100:7') == (100, 7)
+    with pytest.raises(ValueError):
+        parse_cursor('garbage')
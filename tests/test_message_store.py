@@ -0,0 +1,96 @@
+import sqlite3
+
+import pytest
+
+from message_store import SCHEMA, MessageStore
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'messages.db')
+
+
+def count(store):
+    return store.query('SELECT COUNT(*) FROM messages')[0][0]
+
+
+def test_stored_messages_are_not_duplicated_on_reconnect(path):
+    store = MessageStore(path)
+    stored = [{'packetId': 7, 'senderNum': 1, 'text': 'hi', 'timestamp': 100},
+              {'packetId': None, 'senderNum': 2, 'text': 'no id', 'timestamp': 100},
+              {'packetId': 8, 'senderNum': None, 'text': 'no sender', 'timestamp': 100}]
+    for _ in range(3):
+        for message in stored:
+            store.add_message(message)
+        store.flush()
+    assert count(store) == 3
+    store.close()
+
+
+def test_sent_messages_are_not_deduplicated(path):
+    store = MessageStore(path)
+    sent = {'packetId': 7, 'senderNum': 1, 'text': 'hi', 'timestamp': 100, 'direction': 'tx'}
+    store.add_message(sent)
+    store.add_message(sent)
+    store.flush()
+    assert count(store) == 2
+    store.close()
+
+
+def test_existing_duplicates_are_removed_once(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    for _ in range(3):
+        conn.execute("INSERT INTO messages (packet_id, sender_num, text, timestamp) VALUES (7, 1, 'hi', 100)")
+        conn.execute("INSERT INTO messages (packet_id, sender_num, text, timestamp) VALUES (8, NULL, 'hey', 100)")
+    conn.commit()
+    conn.close()
+    store = MessageStore(path)
+    assert count(store) == 2
+    assert len(store.search('hi')['results']) == 1
+    store.close()
+
+
+def test_search_windows_reach_every_match(path):
+    store = MessageStore(path)
+    for i in range(2500):
+        store.add_message({'packetId': i, 'senderNum': 1, 'text': f'ping {i}', 'timestamp': 1000 + i})
+    store.flush()
+    found, windows, before = [], [], None
+    while True:
+        offset = 0
+        while True:
+            page = store.search('ping', limit=100, offset=offset, candidates=1000, before=before)
+            found.extend(message['packetId'] for message in page['results'])
+            if not page['hasMore']:
+                break
+            offset += 100
+        windows.append(page['truncated'])
+        if not page['truncated']:
+            break
+        before = page['before']
+    assert windows == [True, True, False]
+    assert sorted(found) == list(range(2500))
+    store.close()
+
+
+def test_search_ranks_closer_matches_first(path):
+    store = MessageStore(path)
+    store.add_message({'packetId': 1, 'senderNum': 1, 'text': 'relay ' + 'filler ' * 30, 'timestamp': 200})
+    store.add_message({'packetId': 2, 'senderNum': 1, 'text': 'relay relay', 'timestamp': 100})
+    store.flush()
+    results = store.search('relay')['results']
+    assert [message['packetId'] for message in results] == [2, 1]
+    store.close()
+
+
+def test_search_filters_and_quotes_input(path):
+    store = MessageStore(path)
+    store.add_message({'packetId': 1, 'senderNum': 1, 'channel': 0, 'text': 'hello "world"', 'timestamp': 100})
+    store.add_message({'packetId': 2, 'senderNum': 2, 'channel': 1, 'text': 'hello there', 'timestamp': 100})
+    store.flush()
+    assert [m['packetId'] for m in store.search('hello', channel=1)['results']] == [2]
+    assert [m['packetId'] for m in store.search('hello', sender_num=1)['results']] == [1]
+    assert [m['packetId'] for m in store.search('"world" OR')['results']] == []
+    assert [m['packetId'] for m in store.search('wor')['results']] == [1]
+    store.close()
@@ -0,0 +1,78 @@
+from conftest import FakeClock
+from node_store import NodeDeltaBatcher, NodeStore, merge_node_deltas
+
+
+def make_store():
+    return NodeStore(clock=FakeClock())
+
+
+def test_version_counts_changes_only():
+    store = make_store()
+    record, changed = store.update(1, {'snr': 5.0, 'user': {'longName': 'Alpha'}})
+    assert sorted(changed) == ['snr', 'user.longName']
+    assert record.version == 1
+    record, changed = store.update(1, {'snr': 5.0})
+    assert changed == []
+    assert record.version == 1
+    record, changed = store.update(1, {'snr': 6.0})
+    assert changed == ['snr']
+    assert record.version == 2
+
+
+def test_delta_carries_only_changed_paths():
+    store = make_store()
+    store.update(1, {'snr': 5.0, 'position': {'latitude': 1.0, 'longitude': 2.0}})
+    store.update(1, {'position': {'latitude': 1.5}})
+    version, changes = store.delta(1, ['position.latitude'])
+    assert version == 2
+    assert changes == {'position': {'latitude': 1.5}}
+
+
+def test_batcher_coalesces_a_window_into_one_delta():
+    store = make_store()
+    sent = []
+    batcher = NodeDeltaBatcher(store, lambda event, data: sent.append(data))
+    store.update(1, {'snr': 1.0})
+    batcher.flush()
+    sent.clear()
+    for snr in (2.0, 3.0):
+        record, changed = store.update(1, {'snr': snr, 'hopsAway': 1})
+        batcher.mark(1, changed, record.version)
+    assert batcher.flush() == 1
+    assert sent == [{'num': 1, 'baseVersion': 1, 'version': 3, 'changes': {'snr': 3.0, 'hopsAway': 1}}]
+    assert batcher.stats()['coalesced'] == 1
+
+
+def test_batcher_skips_unchanged_and_removed_nodes():
+    store = make_store()
+    sent = []
+    batcher = NodeDeltaBatcher(store, lambda event, data: sent.append(data))
+    batcher.mark(1, [], 1)
+    record, changed = store.update(2, {'snr': 1.0})
+    batcher.mark(2, changed, record.version)
+    store.remove(2)
+    assert batcher.flush() == 0
+    assert sent == []
+
+
+def test_merge_chains_consecutive_deltas():
+    old = {'num': 1, 'baseVersion': 3, 'version': 4,
+           'changes': {'snr': 1.0, 'position': {'latitude': 1.0, 'longitude': 2.0}}}
+    new = {'num': 1, 'baseVersion': 4, 'version': 6,
+           'changes': {'snr': 2.0, 'position': {'latitude': 1.5}}}
+    merged = merge_node_deltas(old, new)
+    assert merged == {'num': 1, 'baseVersion': 3, 'version': 6,
+                      'changes': {'snr': 2.0, 'position': {'latitude': 1.5, 'longitude': 2.0}}}
+    assert old['changes']['position'] == {'latitude': 1.0, 'longitude': 2.0}
+
+
+def test_merge_refuses_a_gap():
+    old = {'num': 1, 'baseVersion': 3, 'version': 4, 'changes': {'snr': 1.0}}
+    new = {'num': 1, 'baseVersion': 5, 'version': 6, 'changes': {'snr': 2.0}}
+    assert merge_node_deltas(old, new) is None
+
+
+def test_merge_keeps_cleared_fields():
+    old = {'num': 1, 'baseVersion': 1, 'version': 2, 'changes': {'user': {'shortName': 'A'}}}
+    new = {'num': 1, 'baseVersion': 2, 'version': 3, 'changes': {'user': None}}
+    assert merge_node_deltas(old, new)['changes'] == {'user': None}
@@ -0,0 +1,75 @@
+from conftest import FakeClock
+from node_store import NodeSpill, NodeStore
+
+
+class CountingSpill(NodeSpill):
+    def __init__(self, path):
+        super().__init__(path)
+        self.batches = []
+
+    def save_many(self, nodes):
+        self.batches.append(len(nodes))
+        super().save_many(nodes)
+
+
+def fill(store, clock, count):
+    for num in range(1, count + 1):
+        clock.advance(1)
+        store.update(num, {'lastHeard': int(clock()), 'user': {'longName': f'node {num}'}})
+
+
+def test_shrink_spills_in_one_batch(tmp_path):
+    clock = FakeClock()
+    spill = CountingSpill(str(tmp_path / 'spill.db'))
+    store = NodeStore(clock=clock, max_nodes=50, spill=spill)
+    fill(store, clock, 51)
+    assert spill.batches == [6]
+    assert sorted(spill.ids()) == [1, 2, 3, 4, 5, 6]
+    assert store.stats()['spillPending'] == 0
+
+
+def test_evicted_node_comes_back_intact(tmp_path):
+    clock = FakeClock()
+    store = NodeStore(clock=clock, max_nodes=50, spill=NodeSpill(str(tmp_path / 'spill.db')))
+    fill(store, clock, 51)
+    record, _ = store.update(1, {'snr': 3.0})
+    assert record.user.longName == 'node 1'
+    assert 1 not in store.spill.ids()
+
+
+def test_expire_spills_in_one_batch(tmp_path):
+    clock = FakeClock()
+    spill = CountingSpill(str(tmp_path / 'spill.db'))
+    store = NodeStore(clock=clock, max_age=100, spill=spill)
+    fill(store, clock, 10)
+    clock.advance(200)
+    assert store.expire() == 10
+    assert spill.batches == [10]
+    assert len(store) == 0
+
+
+def test_node_heard_before_its_spill_is_written(tmp_path):
+    clock = FakeClock()
+    spill = CountingSpill(str(tmp_path / 'spill.db'))
+    store = NodeStore(clock=clock, spill=spill)
+    fill(store, clock, 3)
+    with store._lock:
+        store._evict(1)
+    record, _ = store.update(1, {'snr': 3.0})
+    assert record.user.longName == 'node 1'
+    assert spill.batches == []
+    assert spill.ids() == []
+
+
+def test_shrink_evicts_the_least_recently_heard_tenth():
+    evicted = []
+    store = NodeStore(clock=FakeClock(), max_nodes=20, on_evict=evicted.append)
+    for num in range(1, 21):
+        store.update(num, {'lastHeard': 100 - num, 'user': {'longName': f'node {num}'}})
+    store.pin(20)
+    store.update(21, {'lastHeard': 1})
+    assert sorted(evicted) == [17, 18, 19]
+    assert len(store) == 18
+    assert 21 in store and 20 in store
+    assert store.resolve('node 19') is None
+    assert store.stats()['evicted'] == 3
@@ -0,0 +1,85 @@
+from conftest import FakeClock
+from node_store import NodeRecord, NodeStore
+
+
+def test_update_returns_changed_paths():
+    record = NodeRecord()
+    changed = record.update({'snr': 5.0, 'hopsAway': None, 'position': {},
+                             'user': {'longName': 'Alpha', 'shortName': 'A'}})
+    assert changed == ['snr', 'user.longName', 'user.shortName']
+    assert record.update({'snr': 5.0, 'user': {'longName': 'Alpha'}}) == []
+    assert record.update({'user': {'longName': 'Beta'}}) == ['user.longName']
+    assert record.position is None
+
+
+def test_unknown_fields_are_kept():
+    record = NodeRecord()
+    assert record.update({'isFavorite': True, 'user': {'role': 'ROUTER', 'newField': 1}}) == [
+        'isFavorite', 'user.role', 'user.newField'
+    ]
+    assert record.get('user.newField') == 1
+    assert record.to_dict()['isFavorite'] is True
+    assert record.update({'isFavorite': True}) == []
+
+
+def test_store_update_stamps_last_updated():
+    clock = FakeClock()
+    store = NodeStore(clock=clock)
+    record, changed = store.update(1, {'snr': 1.0})
+    assert changed == ['snr']
+    assert record.lastUpdated == 1000
+    clock.advance(5)
+    record, changed = store.update(1, {'snr': 1.0})
+    assert changed == []
+    assert record.lastUpdated == 1005
+    assert store.get_dict(1)['snr'] == 1.0
+    assert len(store) == 1
+
+
+def test_entry_keyed_by_user_id_merges_into_numeric_record():
+    merges = []
+    store = NodeStore(clock=FakeClock(), on_merge=lambda src, dst: merges.append((src, dst)))
+    store.update(0xabcd, {'snr': 1.0, 'position': {'latitude': 1.5}})
+    store.update(0x1234, {'snr': 5.0})
+    record, changed = store.update(0x1234, {'user': {'id': '!0000abcd', 'longName': 'Alpha'}})
+    assert merges == [(0xabcd, 0x1234)]
+    assert 0xabcd not in store
+    assert record.snr == 5.0
+    assert record.get('position.latitude') == 1.5
+    assert 'position.latitude' in changed and 'snr' not in changed
+    assert store.resolve('alpha') == 0x1234
+
+
+def test_merge_keeps_existing_fields():
+    store = NodeStore(clock=FakeClock())
+    store.update(1, {'snr': 5.0, 'user': {'shortName': 'DST'}})
+    store.update(2, {'snr': 1.0, 'hopsAway': 3, 'user': {'shortName': 'SRC', 'longName': 'Source'}})
+    assert store.merge(2, 1) == ['hopsAway', 'user.longName']
+    record = store.get(1)
+    assert (record.snr, record.hopsAway, record.user.shortName) == (5.0, 3, 'DST')
+    assert store.resolve('src') is None
+    assert store.resolve('source') == 1
+    assert record.version == 2
+
+
+def test_name_index_follows_renames_and_removal():
+    store = NodeStore(clock=FakeClock())
+    store.update(1, {'user': {'longName': 'Alpha', 'shortName': 'AL'}})
+    assert store.resolve('ALPHA') == 1
+    store.update(1, {'user': {'longName': 'Beta'}})
+    assert store.resolve('alpha') is None
+    assert store.resolve('beta') == 1
+    assert store.resolve('al') == 1
+    store.remove(1)
+    assert store.resolve('beta') is None
+    assert store.stats()['names'] == 0
+
+
+def test_digit_only_name_resolves_to_its_node():
+    store = NodeStore(clock=FakeClock())
+    store.update(0x5678, {'user': {'longName': '1234'}})
+    assert store.resolve('1234') == 0x5678
+    assert store.display_name('1234') == '1234'
+    assert store.resolve('4321') == 4321
+    assert store.resolve(1234) == 1234
+    assert store.resolve('!000004d2') == 1234
@@ -0,0 +1,38 @@
+from rooms import MAP_ALL_ROOM, channel_room, map_cell_room, map_rooms_for_bbox, map_rooms_for_point
+
+
+def test_channel_room():
+    assert channel_room(3) == 'channel:3'
+    assert channel_room('2') == 'channel:2'
+    assert channel_room(None) == channel_room(0) == 'channel:0'
+
+
+def test_point_joins_its_cell_and_the_whole_map():
+    assert map_rooms_for_point(10.5, 20.5, 1.0) == (MAP_ALL_ROOM, 'map:10:20')
+    assert map_rooms_for_point(-0.5, 181.0, 1.0) == (MAP_ALL_ROOM, 'map:-1:-179')
+    assert map_rooms_for_point(90.0, 180.0, 1.0) == (MAP_ALL_ROOM, 'map:89:-180')
+
+
+def test_bbox_covers_every_overlapping_cell():
+    rooms = map_rooms_for_bbox(10.2, 20.2, 11.5, 21.5, 1.0, 100)
+    assert rooms == ['map:10:20', 'map:10:21', 'map:11:20', 'map:11:21']
+    assert map_rooms_for_point(11.9, 21.9, 1.0)[1] in rooms
+
+
+def test_bbox_is_clamped_at_the_poles():
+    rooms = map_rooms_for_bbox(88.5, 0.5, 95.0, 1.5, 1.0, 100)
+    assert rooms == ['map:88:0', 'map:88:1', 'map:89:0', 'map:89:1']
+    assert map_rooms_for_point(90.0, 1.0, 1.0)[1] in rooms
+    assert map_rooms_for_bbox(-95.0, 0.5, -89.5, 0.9, 1.0, 100) == ['map:-90:0']
+    assert map_rooms_for_bbox(90.0, 0.5, 60.0, 0.9, 10.0, 100) == ['map:6:0', 'map:7:0', 'map:8:0']
+
+
+def test_bbox_across_the_antimeridian_is_split():
+    rooms = map_rooms_for_bbox(0.5, 178.5, 0.9, -178.5, 1.0, 100)
+    assert rooms == [map_cell_room(0, col) for col in (178, 179, -180, -179)]
+    assert map_rooms_for_bbox(0.5, 178.5, 0.9, 181.5, 1.0, 100) == rooms
+
+
+def test_wide_views_fall_back_to_the_whole_map():
+    assert map_rooms_for_bbox(0, 0, 10, 10, 1.0, 50) == [MAP_ALL_ROOM]
+    assert map_rooms_for_bbox(-10, -200, 10, 170, 1.0, 10 ** 6) == [MAP_ALL_ROOM]
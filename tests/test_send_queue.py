@@ -0,0 +1,98 @@
+import pytest
+
+from conftest import FakeClock
+from ingest import PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL
+from send_queue import OutboundQueue, backoff_delay, lora_airtime, text_airtime
+
+
+def make_queue(clock, rate=0.5, burst=2.0, maxsize=10, **kwargs):
+    return OutboundQueue(lambda job: None, rate=rate, burst=burst, maxsize=maxsize,
+                         cost=lambda payload: payload.get('cost', 1.0), clock=clock, **kwargs)
+
+
+def take(queue):
+    job, _ = queue._next()
+    return job.payload['name']
+
+
+def test_airtime_grows_with_payload():
+    assert lora_airtime(10) < lora_airtime(100) < lora_airtime(200)
+    assert text_airtime('hello') == lora_airtime(len('hello') + 32)
+
+
+def test_bucket_allows_burst_then_refills_at_rate():
+    clock = FakeClock()
+    queue = make_queue(clock)
+    for name in 'abc':
+        queue.put({'name': name})
+    assert take(queue) == 'a'
+    assert take(queue) == 'b'
+    assert queue.stats()['tokens'] == 0
+    assert queue.positions() == [(3, 1, 2.0)]
+    clock.advance(2.0)
+    assert take(queue) == 'c'
+
+
+def test_bucket_never_exceeds_burst():
+    clock = FakeClock()
+    queue = make_queue(clock)
+    clock.advance(3600)
+    assert queue.stats()['tokens'] == 2.0
+
+
+def test_cost_is_capped_at_burst():
+    clock = FakeClock()
+    queue = make_queue(clock)
+    job = queue.put({'name': 'huge', 'cost': 50.0})
+    assert job.cost == 2.0
+    assert take(queue) == 'huge'
+
+
+def test_higher_priority_goes_first():
+    clock = FakeClock()
+    queue = make_queue(clock, burst=5.0)
+    queue.put({'name': 'low'}, PRIORITY_LOW)
+    queue.put({'name': 'normal'}, PRIORITY_NORMAL)
+    queue.put({'name': 'high'}, PRIORITY_HIGH)
+    assert [take(queue) for _ in range(3)] == ['high', 'normal', 'low']
+
+
+def test_delayed_job_waits_until_due():
+    clock = FakeClock()
+    queue = make_queue(clock, burst=5.0)
+    queue.put({'name': 'later'}, delay=10)
+    queue.put({'name': 'now'})
+    assert take(queue) == 'now'
+    assert len(queue) == 0
+    clock.advance(10)
+    assert take(queue) == 'later'
+
+
+def test_full_queue_rejects():
+    queue = make_queue(FakeClock(), maxsize=2)
+    assert queue.put({'name': 'a'}) is not None
+    assert queue.put({'name': 'b'}, delay=5) is not None
+    assert queue.put({'name': 'c'}) is None
+    assert queue.stats()['rejected'] == 1
+
+
+def test_positions_are_reported_on_put():
+    clock = FakeClock()
+    reported = []
+    queue = make_queue(clock, burst=1.0, on_position=lambda job, position, eta: reported.append((job.id, position, eta)))
+    queue.put({'name': 'a'})
+    queue.put({'name': 'b'})
+    queue.put({'name': 'urgent'}, PRIORITY_HIGH)
+    # The urgent job reports itself and every job it overtook.
+    assert reported[-3:] == [(3, 1, 0.0), (1, 2, 2.0), (2, 3, 4.0)]
+
+
+def test_rate_must_be_positive():
+    with pytest.raises(ValueError):
+        OutboundQueue(lambda job: None, rate=0)
+
+
+def test_backoff_doubles_up_to_the_cap():
+    assert backoff_delay(1, base=10, cap=100, rng=lambda: 0.0) == 5.0
+    assert backoff_delay(3, base=10, cap=100, rng=lambda: 1.0) == 40.0
+    assert backoff_delay(10, base=10, cap=100, rng=lambda: 1.0) == 100.0
@@ -0,0 +1,69 @@
+import pytest
+
+from spatial import GridIndex, haversine
+
+
+def keys(results):
+    return sorted(item[0] for item in results)
+
+
+def test_update_moves_a_point_between_cells():
+    index = GridIndex(cell_size=1.0)
+    assert index.update('a', 10.2, 20.2)
+    index.update('a', 10.4, 20.4)
+    assert index.stats()['cellMoves'] == 0
+    index.update('a', 12.5, 22.5)
+    assert index.stats()['cellMoves'] == 1
+    assert index.stats()['cells'] == 1
+    assert index.position('a') == (12.5, 22.5)
+    assert keys(index.query_bbox(10, 20, 11, 21)) == []
+    assert keys(index.query_bbox(12, 22, 13, 23)) == ['a']
+
+
+def test_invalid_coordinates_remove_the_point():
+    index = GridIndex()
+    index.update('a', 10.0, 20.0)
+    assert not index.update('a', 95.0, 20.0)
+    assert len(index) == 0
+    assert index.stats()['cells'] == 0
+
+
+def test_remove_drops_empty_cells():
+    index = GridIndex()
+    index.update('a', 1.0, 1.0)
+    index.update('b', 1.1, 1.1)
+    index.remove('a')
+    assert keys(index.query_bbox(0, 0, 2, 2)) == ['b']
+    index.remove('b')
+    index.remove('missing')
+    assert index.stats()['cells'] == 0
+
+
+def test_bbox_query_filters_within_cells():
+    index = GridIndex(cell_size=10.0)
+    index.update('inside', 5.0, 5.0)
+    index.update('same-cell', 9.0, 9.0)
+    index.update('far', 45.0, 45.0)
+    assert keys(index.query_bbox(4, 4, 6, 6)) == ['inside']
+    assert keys(index.query_bbox(-90, -180, 90, 180)) == ['far', 'inside', 'same-cell']
+    assert len(index.query_bbox(-90, -180, 90, 180, limit=2)) == 2
+
+
+def test_bbox_across_the_antimeridian_is_split():
+    index = GridIndex()
+    index.update('east', 10.0, 179.5)
+    index.update('west', 10.0, -179.5)
+    index.update('greenwich', 10.0, 0.0)
+    assert keys(index.query_bbox(9, 179, 11, -179)) == ['east', 'west']
+    assert keys(index.query_bbox(9, 179, 11, 181)) == ['east', 'west']
+    assert keys(index.query_bbox(9, -400, 11, 400)) == ['east', 'greenwich', 'west']
+
+
+def test_radius_query_sorts_by_distance():
+    index = GridIndex()
+    index.update('near', 40.001, -75.0)
+    index.update('mid', 40.01, -75.0)
+    index.update('far', 41.0, -75.0)
+    results = index.query_radius(40.0, -75.0, 5000)
+    assert [item[0] for item in results] == ['near', 'mid']
+    assert results[0][3] == pytest.approx(haversine(40.0, -75.0, 40.001, -75.0))
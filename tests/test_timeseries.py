@@ -0,0 +1,87 @@
+from array import array
+
+import pytest
+
+import timeseries
+from conftest import FakeClock
+from timeseries import Series, TelemetryStore, aggregate
+
+
+def contents(series):
+    times, values = series.slice(-10 ** 12, 10 ** 12)
+    return list(times), list(values)
+
+
+def test_series_grows_with_its_samples():
+    series = Series(1000)
+    series.append(1, 1.0)
+    assert series.allocated_bytes() == 16
+    assert contents(series) == ([1], [1.0])
+
+
+def test_full_series_wraps_around():
+    series = Series(3)
+    for t in range(1, 6):
+        series.append(t, float(t))
+    assert contents(series) == ([3, 4, 5], [3.0, 4.0, 5.0])
+    assert series.allocated_bytes() == 48
+    assert series.last_time() == 5
+
+
+def test_trim_while_growing_and_after_wrapping():
+    series = Series(4)
+    for t in (10, 20, 30):
+        series.append(t, 0.0)
+    assert series.trim_before(25) == 2
+    assert contents(series)[0] == [30]
+    for t in (40, 50, 60, 70):
+        series.append(t, 0.0)
+    assert contents(series)[0] == [40, 50, 60, 70]
+    assert series.trim_before(55) == 2
+    series.append(80, 0.0)
+    assert contents(series)[0] == [60, 70, 80]
+
+
+def test_slice_is_half_open():
+    series = Series(10)
+    for t in (10, 20, 30, 40):
+        series.append(t, float(t))
+    times, values = series.slice(20, 40)
+    assert list(times) == [20, 30]
+
+
+def test_buckets_aggregate_min_max_avg(monkeypatch):
+    monkeypatch.setattr(timeseries, 'np', None)
+    buckets = aggregate(array('q', [0, 10, 60, 70]), array('d', [1.0, 3.0, 5.0, 5.0]), 0, 60)
+    assert buckets == [
+        {'t': 0, 'min': 1.0, 'max': 3.0, 'avg': 2.0, 'count': 2},
+        {'t': 60, 'min': 5.0, 'max': 5.0, 'avg': 5.0, 'count': 2}
+    ]
+
+
+def test_numpy_buckets_match_pure_python(monkeypatch):
+    pytest.importorskip('numpy')
+    times = array('q', [5, 10, 61, 62, 300, 301, 302, 900])
+    values = array('d', [2.5, -1.0, 4.0, 4.5, 0.0, 10.0, 3.0, 7.0])
+    fast = aggregate(times, values, 0, 60)
+    assert all(type(bucket['t']) is int and type(bucket['count']) is int for bucket in fast)
+    monkeypatch.setattr(timeseries, 'np', None)
+    assert fast == aggregate(times, values, 0, 60)
+    assert [bucket['t'] for bucket in fast] == [0, 60, 300, 900]
+
+
+def test_store_reports_real_allocation():
+    clock = FakeClock(10000)
+    store = TelemetryStore(max_points=10080, clock=clock)
+    store.record(1, clock(), {'batteryLevel': 90, 'voltage': 4.1, 'note': 'text', 'isCharging': True})
+    stats = store.stats()
+    assert stats['series'] == 2
+    assert stats['approxBytes'] == 2 * 16
+
+
+def test_store_skips_out_of_order_samples():
+    clock = FakeClock(10000)
+    store = TelemetryStore(clock=clock)
+    store.record(1, 9000, {'voltage': 4.0})
+    assert store.record(1, 8000, {'voltage': 3.0}) == 0
+    assert store.stats()['outOfOrder'] == 1
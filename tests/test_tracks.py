@@ -0,0 +1,44 @@
+from tracks import TrackBuffer, TrackStore, simplify
+
+
+def test_buffer_grows_up_to_capacity():
+    track = TrackBuffer(4)
+    for t in range(3):
+        track.append(1.0, 2.0 + t, None, t)
+    assert len(track.lat) == 3
+    assert track.points() == [(1.0, 2.0, None, 0), (1.0, 3.0, None, 1), (1.0, 4.0, None, 2)]
+
+
+def test_full_buffer_wraps_oldest_first():
+    track = TrackBuffer(3)
+    for t in range(5):
+        track.append(float(t), 0.0, 10.0 * t, t)
+    assert len(track.lat) == 3
+    assert [p[3] for p in track.points()] == [2, 3, 4]
+    assert track.points(since=3) == [(3.0, 0.0, 30.0, 3), (4.0, 0.0, 40.0, 4)]
+
+
+def test_repeated_fix_is_skipped():
+    track = TrackBuffer(3)
+    assert track.append(1.0, 2.0, None, 5)
+    assert not track.append(1.0, 2.0, None, 5)
+    assert track.append(1.0, 2.0, None, 6)
+    assert len(track) == 2
+
+
+def test_simplify_drops_collinear_points_and_keeps_endpoints():
+    line = [(0.0, 0.001 * i, None, i) for i in range(10)]
+    assert simplify(line, 1.0) == [line[0], line[-1]]
+    bent = line[:5] + [(0.01, 0.005, None, 5)] + line[6:]
+    assert simplify(bent, 1.0) == [bent[0], bent[4], bent[5], bent[6], bent[-1]]
+    assert simplify(line, 0) == line
+
+
+def test_store_returns_raw_and_simplified_tracks():
+    store = TrackStore(depth=10)
+    for i in range(5):
+        store.add('a', 0.0, 0.001 * i, None, 100 + i)
+    points, simplified = store.track('a', tolerance=1.0)
+    assert len(points) == 5
+    assert len(simplified) == 2
+    assert store.track('missing') == ([], [])
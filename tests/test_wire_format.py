@@ -0,0 +1,46 @@
+import json
+
+from wire_format import FIELD_NAMES, FIELD_TOKENS, WIRE_COMPACT, WIRE_JSON, pack, unpack, wire_room
+
+
+def round_trip(value):
+    return unpack(json.loads(json.dumps(pack(value))))
+
+
+def test_node_delta_round_trips():
+    delta = {'num': 1, 'baseVersion': 3, 'version': 4,
+             'changes': {'position': {'latitude': 1.5, 'longitude': None}, 'user': {'longName': 'Alpha'}}}
+    assert round_trip(delta) == delta
+
+
+def test_known_keys_shrink_and_unknown_keys_pass_through():
+    packed = pack({'num': 1, 'customField': 2})
+    assert packed == {FIELD_TOKENS['num']: 1, 'customField': 2}
+
+
+def test_keys_that_look_like_tokens_are_escaped():
+    value = {'#0': 'literal', '##x': 'double', 'num': 'real'}
+    packed = pack(value)
+    assert packed['##0'] == 'literal'
+    assert packed['###x'] == 'double'
+    assert round_trip(value) == value
+
+
+def test_lists_and_batches_round_trip():
+    batch = {'events': [['node_delta', {'num': 1, 'changes': {}}], ['new_message', {'text': 'hi', 'channel': 0}]]}
+    assert round_trip(batch) == batch
+
+
+def test_scalars_are_untouched():
+    for value in (None, 0, 1.5, 'num', True, []):
+        assert round_trip(value) == value
+
+
+def test_tokens_are_unique_and_short():
+    assert len(set(FIELD_TOKENS.values())) == len(FIELD_NAMES)
+    assert all(len(token) <= 3 for token in FIELD_TOKENS.values())
+
+
+def test_every_format_gets_its_own_room():
+    assert wire_room('channel:0', WIRE_JSON) == 'channel:0'
+    assert wire_room('channel:0', WIRE_COMPACT) == 'channel:0|compact'
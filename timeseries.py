@@ -0,0 +1,198 @@
+import threading
+import time
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class Series:
+    # Ring buffer of (time, value) held in two typed columns. Samples must
+    # arrive in time order, which keeps range lookups a binary search. The
+    # columns grow with the data and only turn into a ring once they reach
+    # capacity, so a node heard once costs two samples, not a full ring.
+    __slots__ = ('capacity', 'times', 'values', 'start', 'size')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array('q')
+        self.values = array('d')
+        self.start = 0
+        self.size = 0
+
+    def _index(self, offset):
+        return (self.start + offset) % len(self.times)
+
+    def last_time(self):
+        return self.times[self._index(self.size - 1)] if self.size else None
+
+    def append(self, timestamp, value):
+        if len(self.times) < self.capacity:
+            self.times.append(timestamp)
+            self.values.append(value)
+            self.size += 1
+            return
+        if self.size < self.capacity:
+            index = self._index(self.size)
+            self.size += 1
+        else:
+            index = self.start
+            self.start = (self.start + 1) % self.capacity
+        self.times[index] = timestamp
+        self.values[index] = value
+
+    def trim_before(self, cutoff):
+        dropped = 0
+        if len(self.times) < self.capacity:
+            # Still growing: start stays 0, so drop the prefix in place.
+            while dropped < self.size and self.times[dropped] < cutoff:
+                dropped += 1
+            if dropped:
+                del self.times[:dropped]
+                del self.values[:dropped]
+                self.size -= dropped
+            return dropped
+        while self.size and self.times[self.start] < cutoff:
+            self.start = (self.start + 1) % self.capacity
+            self.size -= 1
+            dropped += 1
+        return dropped
+
+    def allocated_bytes(self):
+        return self.times.itemsize * len(self.times) + self.values.itemsize * len(self.values)
+
+    def _bisect(self, timestamp):
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.times[self._index(mid)] < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def slice(self, start, end):
+        # Returns (times, values) for start <= t < end as at most two
+        # contiguous pieces of the ring, concatenated.
+        first, last = self._bisect(start), self._bisect(end)
+        if first >= last:
+            return array('q'), array('d')
+        begin, finish = self._index(first), self._index(last - 1) + 1
+        if begin < finish:
+            return self.times[begin:finish], self.values[begin:finish]
+        return self.times[begin:] + self.times[:finish], self.values[begin:] + self.values[:finish]
+
+    def __len__(self):
+        return self.size
+
+
+def aggregate(times, values, start, resolution):
+    if not times:
+        return []
+    if np is not None:
+        t = np.frombuffer(times, dtype=np.int64)
+        v = np.frombuffer(values, dtype=np.float64)
+        buckets = (t - start) // resolution
+        edges = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+        counts = np.diff(np.append(edges, len(v)))
+        mins = np.minimum.reduceat(v, edges)
+        maxs = np.maximum.reduceat(v, edges)
+        sums = np.add.reduceat(v, edges)
+        return [
+            {'t': int(start + bucket * resolution), 'min': float(lo), 'max': float(hi),
+             'avg': float(total / count), 'count': int(count)}
+            for bucket, lo, hi, total, count in zip(buckets[edges], mins, maxs, sums, counts)
+        ]
+    result = []
+    current = None
+    for timestamp, value in zip(times, values):
+        bucket = (timestamp - start) // resolution
+        if current is None or bucket != current[0]:
+            current = [bucket, value, value, 0.0, 0]
+            result.append(current)
+        if value < current[1]:
+            current[1] = value
+        if value > current[2]:
+            current[2] = value
+        current[3] += value
+        current[4] += 1
+    return [
+        {'t': start + bucket * resolution, 'min': lo, 'max': hi, 'avg': total / count, 'count': count}
+        for bucket, lo, hi, total, count in result
+    ]
+
+
+class TelemetryStore:
+    def __init__(self, max_points=10080, max_age=7 * 24 * 3600, clock=time.time):
+        self.max_points = max_points
+        self.max_age = max_age
+        self.clock = clock
+        self._series = {}
+        self._lock = threading.Lock()
+        self._samples = 0
+        self._out_of_order = 0
+        self._trimmed = 0
+
+    def record(self, node, timestamp, metrics):
+        timestamp = int(timestamp)
+        cutoff = int(self.clock()) - self.max_age if self.max_age else None
+        recorded = 0
+        with self._lock:
+            for metric, value in metrics.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                key = (node, metric)
+                series = self._series.get(key)
+                if series is None:
+                    series = self._series[key] = Series(self.max_points)
+                last = series.last_time()
+                if last is not None and timestamp < last:
+                    self._out_of_order += 1
+                    continue
+                series.append(timestamp, value)
+                if cutoff is not None:
+                    self._trimmed += series.trim_before(cutoff)
+                recorded += 1
+            self._samples += recorded
+        return recorded
+
+    def metrics(self, node):
+        with self._lock:
+            return sorted(metric for key_node, metric in self._series if key_node == node)
+
+    def query(self, node, metric, start=None, end=None, resolution=3600):
+        now = int(self.clock())
+        end = now + 1 if end is None else int(end)
+        start = end - 24 * 3600 if start is None else int(start)
+        if self.max_age:
+            start = max(start, now - self.max_age)
+        resolution = max(1, int(resolution))
+        with self._lock:
+            series = self._series.get((node, metric))
+            if series is None:
+                return []
+            times, values = series.slice(start, end)
+        return aggregate(times, values, start, resolution)
+
+    def remove(self, node):
+        with self._lock:
+            for key in [key for key in self._series if key[0] == node]:
+                del self._series[key]
+
+    def stats(self):
+        with self._lock:
+            points = sum(len(series) for series in self._series.values())
+            allocated = sum(series.allocated_bytes() for series in self._series.values())
+            return {
+                'series': len(self._series),
+                'points': points,
+                'maxPointsPerSeries': self.max_points,
+                'maxAgeSeconds': self.max_age,
+                'samples': self._samples,
+                'outOfOrder': self._out_of_order,
+                'trimmed': self._trimmed,
+                'approxBytes': allocated,
+                'backend': 'numpy' if np is not None else 'array'
+            }
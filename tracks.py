@@ -0,0 +1,131 @@
+import math
+import threading
+from array import array
+
+from spatial import METERS_PER_DEGREE
+
+
+class TrackBuffer:
+    # Fixed-capacity ring of positions stored column-wise in typed arrays:
+    # 32 bytes per point instead of a dict per fix. The columns grow with
+    # the track and only wrap once they reach capacity.
+    __slots__ = ('capacity', 'lat', 'lon', 'alt', 'time', 'start', 'size')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.lat = array('d')
+        self.lon = array('d')
+        self.alt = array('d')
+        self.time = array('q')
+        self.start = 0
+        self.size = 0
+
+    def append(self, lat, lon, alt, timestamp):
+        if self.size:
+            last = (self.start + self.size - 1) % self.capacity
+            if self.time[last] == timestamp and self.lat[last] == lat and self.lon[last] == lon:
+                return False
+        if alt is None:
+            alt = math.nan
+        if self.size < self.capacity:
+            self.lat.append(lat)
+            self.lon.append(lon)
+            self.alt.append(alt)
+            self.time.append(timestamp)
+            self.size += 1
+            return True
+        index = self.start
+        self.start = (self.start + 1) % self.capacity
+        self.lat[index] = lat
+        self.lon[index] = lon
+        self.alt[index] = alt
+        self.time[index] = timestamp
+        return True
+
+    def points(self, since=None):
+        result = []
+        for offset in range(self.size):
+            index = (self.start + offset) % self.capacity
+            timestamp = self.time[index]
+            if since is not None and timestamp < since:
+                continue
+            alt = self.alt[index]
+            result.append((self.lat[index], self.lon[index], None if math.isnan(alt) else alt, timestamp))
+        return result
+
+    def __len__(self):
+        return self.size
+
+
+def simplify(points, tolerance):
+    # Douglas-Peucker on a local equirectangular projection, tolerance in meters.
+    if tolerance <= 0 or len(points) < 3:
+        return list(points)
+    scale_x = METERS_PER_DEGREE * math.cos(math.radians(points[0][0]))
+    xy = [(p[1] * scale_x, p[0] * METERS_PER_DEGREE) for p in points]
+    keep = bytearray(len(points))
+    keep[0] = keep[-1] = 1
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        x1, y1 = xy[first]
+        x2, y2 = xy[last]
+        dx, dy = x2 - x1, y2 - y1
+        length_sq = dx * dx + dy * dy
+        max_dist, max_index = 0.0, None
+        for i in range(first + 1, last):
+            px, py = xy[i]
+            if length_sq == 0:
+                dist = math.hypot(px - x1, py - y1)
+            else:
+                t = max(0.0, min(1.0, ((px - x1) * dx + (py - y1) * dy) / length_sq))
+                dist = math.hypot(px - (x1 + t * dx), py - (y1 + t * dy))
+            if dist > max_dist:
+                max_dist, max_index = dist, i
+        if max_index is not None and max_dist > tolerance:
+            keep[max_index] = 1
+            stack.append((first, max_index))
+            stack.append((max_index, last))
+    return [p for p, kept in zip(points, keep) if kept]
+
+
+class TrackStore:
+    def __init__(self, depth=500):
+        self.depth = depth
+        self._tracks = {}
+        self._lock = threading.Lock()
+        self._appended = 0
+
+    def add(self, key, lat, lon, alt, timestamp):
+        with self._lock:
+            track = self._tracks.get(key)
+            if track is None:
+                track = self._tracks[key] = TrackBuffer(self.depth)
+            if track.append(lat, lon, alt, int(timestamp)):
+                self._appended += 1
+                return True
+            return False
+
+    def remove(self, key):
+        with self._lock:
+            self._tracks.pop(key, None)
+
+    def track(self, key, tolerance=0, since=None):
+        with self._lock:
+            track = self._tracks.get(key)
+            points = track.points(since) if track is not None else []
+        return points, simplify(points, tolerance)
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def stats(self):
+        with self._lock:
+            points = sum(len(track) for track in self._tracks.values())
+            return {
+                'tracks': len(self._tracks),
+                'depth': self.depth,
+                'points': points,
+                'appended': self._appended,
+                'approxBytes': points * 32
+            }
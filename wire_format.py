@@ -0,0 +1,126 @@
+import json
+import threading
+import zlib
+
+WIRE_JSON = 'json'
+WIRE_COMPACT = 'compact'
+WIRE_FORMATS = (WIRE_JSON, WIRE_COMPACT)
+WIRE_VERSION = 1
+
+# Field ids for the compact format: a known key travels as '#' plus its
+# index in base 36, so the most frequent keys go first and stay two
+# characters long. The table is sent to each client on connect.
+FIELD_NAMES = (
+    'num', 'version', 'baseVersion', 'changes', 'user', 'position', 'deviceMetrics', 'telemetry',
+    'snr', 'lastHeard', 'hopsAway', 'latitude', 'longitude', 'latitudeI', 'longitudeI', 'altitude',
+    'time', 'timestamp', 'sender', 'precisionBits', 'batteryLevel', 'voltage', 'channelUtilization',
+    'airUtilTx', 'uptimeSeconds', 'packetId', 'channel', 'text', 'status', 'events', 'message',
+    'raw_message', 'formatted_message', 'senderNum', 'attempts', 'attempt', 'longName', 'shortName',
+    'id', 'hwModel', 'macaddr', 'role', 'isLicensed', 'publicKey', 'viaMqtt', 'lastUpdated',
+    'PDOP', 'groundSpeed', 'groundTrack', 'satsInView', 'nodes', 'messages', 'results', 'rank',
+    'hasMore', 'before', 'after', 'from', 'to', 'into', 'error', 'jobId', 'clientId', 'eta',
+    'direction', 'points', 'tracks', 'series', 'bbox', 'rssi', 'payload', 'portnum',
+    'maxAttempts', 'retryPacketId', 'delay', 'reason', 'query', 'offset', 'elapsedMs'
+)
+
+_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def _token(index):
+    token = ''
+    while True:
+        index, digit = divmod(index, 36)
+        token = _DIGITS[digit] + token
+        if not index:
+            return '#' + token
+
+
+FIELD_TOKENS = {name: _token(index) for index, name in enumerate(FIELD_NAMES)}
+TOKEN_FIELDS = {token: name for name, token in FIELD_TOKENS.items()}
+
+
+def pack(value):
+    # Lossless: only keys change. Keys that already start with '#' are
+    # escaped with a second '#'. None values are kept because node deltas
+    # use them to clear fields.
+    if isinstance(value, dict):
+        packed = {}
+        for key, item in value.items():
+            if not isinstance(key, str):
+                key = str(key)
+            token = FIELD_TOKENS.get(key)
+            if token is None:
+                token = '#' + key if key[:1] == '#' else key
+            packed[token] = pack(item)
+        return packed
+    if isinstance(value, (list, tuple)):
+        return [pack(item) for item in value]
+    return value
+
+
+def unpack(value):
+    if isinstance(value, dict):
+        unpacked = {}
+        for key, item in value.items():
+            if key[:1] == '#':
+                key = key[1:] if key[1:2] == '#' else TOKEN_FIELDS.get(key, key)
+            unpacked[key] = unpack(item)
+        return unpacked
+    if isinstance(value, list):
+        return [unpack(item) for item in value]
+    return value
+
+
+def wire_room(room, wire_format):
+    # Clients on a non-JSON format join a shadow of every room so each
+    # encoding is built once per frame, not once per client.
+    return room if wire_format == WIRE_JSON else f'{room}|{wire_format}'
+
+
+class WireStats:
+    # Bytes per event for the JSON and compact encodings, raw and deflated
+    # (a per-message stand-in for permessage-deflate). Only every
+    # `sample_every`-th event is measured so the comparison stays cheap.
+    def __init__(self, sample_every=10):
+        self.sample_every = max(1, sample_every)
+        self._lock = threading.Lock()
+        self._seen = 0
+        self._events = {}
+
+    def observe(self, event, data):
+        with self._lock:
+            self._seen += 1
+            if self._seen % self.sample_every:
+                return
+        items = data.get('events', ()) if event == 'batch' and isinstance(data, dict) else ((event, data),)
+        for name, payload in items:
+            plain = json.dumps(payload, separators=(',', ':'), default=str).encode('utf-8')
+            packed = json.dumps(pack(payload), separators=(',', ':'), default=str).encode('utf-8')
+            sizes = (len(plain), len(packed), len(zlib.compress(plain)), len(zlib.compress(packed)))
+            with self._lock:
+                entry = self._events.setdefault(name, [0, 0, 0, 0, 0])
+                entry[0] += 1
+                for i, size in enumerate(sizes, 1):
+                    entry[i] += size
+
+    def stats(self):
+        with self._lock:
+            events = {}
+            totals = [0, 0, 0, 0, 0]
+            for name, entry in self._events.items():
+                count = entry[0]
+                events[name] = {
+                    'sampled': count,
+                    'jsonBytes': round(entry[1] / count, 1),
+                    'compactBytes': round(entry[2] / count, 1),
+                    'jsonDeflatedBytes': round(entry[3] / count, 1),
+                    'compactDeflatedBytes': round(entry[4] / count, 1)
+                }
+                totals = [a + b for a, b in zip(totals, entry)]
+            return {
+                'sampleEvery': self.sample_every,
+                'sampled': totals[0],
+                'compactRatio': round(totals[2] / totals[1], 3) if totals[1] else None,
+                'compactDeflatedRatio': round(totals[4] / totals[3], 3) if totals[3] else None,
+                'events': events
+            }